@@ -1,8 +1,18 @@
+import html
+import math
+import time
+
+import numpy as np
 import streamlit as st
-import gspread
 import pandas as pd
-import random
-import time
+
+import bulk_points
+import raffle_draw
+from leaderboard import render_leaderboard, render_my_rank
+from metrics import api_metrics
+from prefetch import prefetch
+from profiling import rerun_profiler, session_id
+from storage import ConcurrentUpdateError, InvalidPointsError, MissingColumnsError, ReadOnlyError, get_storage
 
 # 設定頁面標題和佈局
 st.set_page_config(
@@ -11,99 +21,253 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 從 Streamlit secrets 讀取 Google 服務帳號憑證
+# 點數管理的會員列表每頁顯示人數
+MEMBER_PAGE_SIZE = 50
+# 排行榜自動更新時檢查資料是否變動的間隔秒數 (secrets.toml 的 leaderboard_refresh_seconds)
+DEFAULT_LEADERBOARD_REFRESH_SECONDS = 10
+
+# 依 secrets.toml 建立資料來源 (預設為 Google Sheets)，在整個程序中只建立一次
 try:
-    creds = st.secrets["gcp_service_account"]
-    gc = gspread.service_account_from_dict(creds)
+    storage = get_storage()
 except Exception as e:
     st.error(f"無法連接到 Google Sheets。請檢查 .streamlit/secrets.toml 檔案和服務帳號權限。錯誤：{e}")
     st.stop()
 
-def get_points_sheet():
-    """連接並取得會員點數管理的 Google Sheet 資料 (包含登入資訊)。"""
+def get_member_repository():
+    """取得會員點數管理的資料 (包含登入資訊)。"""
     try:
-        # 假設 sheet1 包含 暱稱, 點數, 帳號, 密碼
-        worksheet = gc.open("拯救會員管理").sheet1
-        return worksheet
+        # 假設資料包含 暱稱, 點數, 帳號, 密碼
+        storage.members.check()
+        return storage.members
     except Exception as e:
         st.error(f"無法開啟「拯救會員管理」表格。請確認服務帳號已獲得編輯權限。錯誤：{e}")
         return None
 
-def get_raffle_sheet():
-    """連接並取得抽獎名單的 Google Sheet 資料。"""
+def get_raffle_repository():
+    """取得抽獎名單的資料。"""
     try:
-        worksheet = gc.open("抽獎名單").sheet1
-        return worksheet
+        storage.raffle.check()
+        return storage.raffle
     except Exception as e:
         st.error(f"無法開啟「抽獎名單」表格。請確認服務帳號已獲得編輯權限。錯誤：{e}")
         return None
 
-def draw_winners(df, num_winners):
-    """從 DataFrame 中隨機選出指定數量的得獎者。"""
-    if df.empty or num_winners <= 0:
-        return None
-    return random.sample(df.to_dict('records'), min(num_winners, len(df)))
-
-def update_winners_status(sheet, winners):
-    """將中獎者在 Google Sheet 中的狀態更新為 '是'。"""
-    try:
-        # 為了準確找到行數，讀取所有電子郵件
-        emails_list = sheet.col_values(2)
-        header_row = sheet.row_values(1)
-        try:
-            status_col = header_row.index('是否中獎') + 1
-        except ValueError:
-            st.error("Google Sheet 中找不到 '是否中獎' 欄位。請先手動新增此欄位。")
-            return
-
-        for winner in winners:
-            try:
-                # 找到電子郵件所在的行數 (1-based index)
-                row_index = emails_list.index(winner['電子郵件']) + 1
-                sheet.update_cell(row_index, status_col, "是")
-            except ValueError:
-                st.warning(f"找不到電子郵件為 '{winner['電子郵件']}' 的參與者，無法更新狀態。")
-        
-        st.success("🎉 中獎者的狀態已成功註記於 Google Sheet！")
-    except Exception as e:
-        st.error(f"更新 Google Sheet 時發生錯誤：{e}")
-
-# 新增一個函式，用於根據 Sheet 標頭動態構建要新增的列
-def build_append_row(sheet, nickname, points, account, password):
-    """根據 Google Sheet 的實際標頭順序，創建要 append 的行資料列表。"""
+def draw_winners(df, prizes, weights=None, seed=None, rows=None):
+    """依獎項名額一次抽出所有得獎者，回傳 (抽獎紀錄, 得獎者列表)。
+
+    只抽出列的位置，得獎者的資料才轉成 dict；抽獎紀錄包含 seed，可用來重播與稽核。
+    rows 為參加抽獎的列位置 (None 為全部)，抽獎紀錄中的 index 是在 rows 中的位置。
+    """
+    if rows is None:
+        rows = np.arange(len(df))
+    if not len(rows) or not prizes:
+        return None, []
+    record = raffle_draw.draw(df['電子郵件'].to_numpy()[rows].tolist(), prizes, weights, seed)
+    rows = df.iloc[rows[[winner['index'] for winner in record['winners']]]].to_dict('records')
+    winners = [dict(row, 獎項=winner['prize']) for winner, row in zip(record['winners'], rows)]
+    return record, winners
+
+def update_winners_status(raffle, winners):
+    """將中獎者的狀態更新為 '是' (所有中獎者一次寫入)，回傳寫入結果 (存入 session_state，rerun 後再顯示)。"""
     try:
-        header = sheet.row_values(1)
+        not_found = raffle.mark_winners([winner['電子郵件'] for winner in winners])
+    except MissingColumnsError:
+        return {"error": "Google Sheet 中找不到 '是否中獎' 欄位。請先手動新增此欄位。", "not_found": [], "written": 0}
     except Exception as e:
-        st.error(f"無法取得 Google Sheet 標頭進行驗證: {e}")
-        return None
-
-    # 必須包含的欄位及其對應的值
-    data_map = {
-        '暱稱': str(nickname),
-        '點數': int(points),
-        # 確保帳號和密碼始終作為字串儲存
-        '帳號': str(account),
-        '密碼': str(password)
-    }
-    
-    # 檢查所有必要欄位是否都存在於標頭中
-    if not all(col in header for col in data_map.keys()):
-        missing_cols = [col for col in data_map.keys() if col not in header]
-        # 在側邊欄或主頁面顯示錯誤，取決於是哪個提交按鈕觸發
-        error_location = st.sidebar if st.session_state.get('registration_trigger', False) else st
-        error_location.error(f"錯誤：您的 '拯救會員管理' Sheet 缺少必要的欄位: {', '.join(missing_cols)}。")
-        return None
-    
-    # 根據標頭順序構建要新增的列
-    row_to_append = []
-    for col_name in header:
-        # 如果是我們關心的欄位，則放入值；否則放入空字串作為佔位符
-        row_to_append.append(data_map.get(col_name, '')) 
-        
-    return row_to_append
+        names = "、".join(str(winner['姓名']) for winner in winners)
+        return {"error": f"以下中獎者的狀態未能寫入：{names}。錯誤：{e}", "not_found": [], "written": 0}
+    return {"error": None, "not_found": not_found, "written": len(winners) - len(not_found)}
+
+def render_winners_status(status):
+    """顯示中獎者狀態的寫入結果。"""
+    if status["error"]:
+        st.error(status["error"])
+        return
+    # 找不到的參與者個別提出警告，其餘中獎者已完成註記
+    for email in status["not_found"]:
+        st.warning(f"找不到電子郵件為 '{email}' 的參與者，無法更新狀態。")
+    if status["written"]:
+        st.success("🎉 中獎者的狀態已成功註記！")
 
 # --- 主要應用程式邏輯 ---
+def render_paged_table(df, key="member_table", rows=None, unit="位會員"):
+    """分頁顯示表格，只把目前這一頁的資料傳送到瀏覽器。
+
+    rows 為要顯示的列位置 (例如篩選結果)；只取出目前這一頁，不必複製整份篩選後的資料。
+    """
+    total = len(df) if rows is None else len(rows)
+    total_pages = max(1, math.ceil(total / MEMBER_PAGE_SIZE))
+    page_key = f"{key}_page"
+    # 會員減少後，頁碼可能超出範圍
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+    page = st.number_input(f"頁碼 (共 {total_pages} 頁)", min_value=1, max_value=total_pages, step=1, key=page_key)
+    start = (page - 1) * MEMBER_PAGE_SIZE
+    page_rows = slice(start, start + MEMBER_PAGE_SIZE) if rows is None else rows[start:start + MEMBER_PAGE_SIZE]
+    page_df = df.iloc[page_rows]
+    st.dataframe(page_df, hide_index=True)
+    st.caption(f"第 {start + 1 if len(page_df) else 0}–{start + len(page_df)} 位，共 {total:,} {unit}")
+
+@st.fragment
+def points_editor(members):
+    """以暱稱或帳號搜尋會員並增減點數；輸入搜尋文字時只重新執行這個區塊。
+
+    st.fragment 會保留呼叫參數供之後重新執行，因此不傳入 DataFrame，避免 session 一直參照舊版本的資料。
+    """
+    query = st.text_input(
+        "搜尋會員 (暱稱或帳號)",
+        key="member_search",
+        type="search",
+        live=True,
+        placeholder="輸入暱稱或帳號的一部分",
+    )
+    # 只有符合的一小頁暱稱會送到瀏覽器
+    matches = members.search(query) if query else []
+    if query and not matches:
+        st.info("找不到符合的會員。")
+    member_nickname = st.selectbox("選擇要管理的會員暱稱：", options=matches)
+    if not member_nickname:
+        return
+
+    # 共用的 DataFrame 只以篩選遮罩取出一個值，不複製整張表
+    df = members.frame()
+    points = df.loc[df['暱稱'] == member_nickname, '點數']
+    if points.empty:
+        st.info("此會員剛剛已被移除或改名，請重新搜尋。")
+        return
+    st.metric(label="目前點數", value=points.iloc[0])
+
+    with st.form(key="points_form"):
+        points_change = st.number_input(
+            "輸入要增減的點數：",
+            value=0,
+            step=1
+        )
+        submit_points = st.form_submit_button("更新點數")
+
+    if submit_points:
+        try:
+            new_points = members.update_points(member_nickname, points_change)
+        except MissingColumnsError:
+            st.error("點數表格中找不到 '點數' 欄位。")
+        except InvalidPointsError as e:
+            st.error(str(e))
+        except ValueError:
+            st.warning("點數不能為負數，請重新輸入。")
+        except (ConcurrentUpdateError, ReadOnlyError) as e:
+            st.warning(str(e))
+        except Exception as e:
+            st.error(f"更新點數時發生錯誤：{e}")
+        else:
+            st.success(f"已將會員 **{member_nickname}** 的點數更新為 **{new_points}**！")
+            st.rerun() # 重新運行以更新會員列表與顯示的點數
+
+def leaderboard_refresh_seconds():
+    return st.secrets.get("leaderboard_refresh_seconds", DEFAULT_LEADERBOARD_REFRESH_SECONDS)
+
+def leaderboard_section(members, nickname):
+    """排行榜區塊 (以 st.fragment 執行)。只重新執行這個區塊時，耗時另外記錄為「排行榜自動更新」。"""
+    with rerun_profiler.rerun("排行榜自動更新"):
+        rerun_profiler.phase("排行榜")
+        render_leaderboard_section(members, nickname)
+
+def render_leaderboard_section(members, nickname):
+    """先比對資料的版本標記，沒有變動時沿用已建立的畫面內容，
+    不必重新下載或排序；資料變動時名次索引已由快取增量更新。"""
+    # 按下時只重新執行這個區塊
+    st.button("重新整理排行榜")
+
+    revision = members.revision()
+    state = st.session_state
+    if state.get("leaderboard_revision") != revision:
+        state.leaderboard_revision = revision
+        state.leaderboard_changed_at = time.time()
+
+    ranking = members.ranking()
+    if not len(ranking):
+        st.warning("目前沒有任何會員資料可顯示。")
+        return
+
+    st.markdown("---")
+    st.subheader("我的名次")
+    render_my_rank(ranking, nickname)
+
+    st.markdown("---")
+    st.subheader("點數冠軍榜 ✨")
+
+    # 視覺化前三名
+    top_3 = ranking.top(3)
+    if len(top_3) >= 3:
+        top_3_cols = st.columns(3)
+        with top_3_cols[0]:
+            st.markdown(f"<h3 style='text-align: center;'>🥇 No.1</h3>", unsafe_allow_html=True)
+            # 使用 Markdown 確保暱稱不會過長而影響 metric 顯示
+            st.markdown(f"**{html.escape(top_3[0][0])}**", unsafe_allow_html=True)
+            st.metric("點數", value=f"{top_3[0][1]:,}") # 點數加上千分位
+        with top_3_cols[1]:
+            st.markdown(f"<h3 style='text-align: center;'>🥈 No.2</h3>", unsafe_allow_html=True)
+            st.markdown(f"**{html.escape(top_3[1][0])}**", unsafe_allow_html=True)
+            st.metric("點數", value=f"{top_3[1][1]:,}")
+        with top_3_cols[2]:
+            st.markdown(f"<h3 style='text-align: center;'>🥉 No.3</h3>", unsafe_allow_html=True)
+            st.markdown(f"**{html.escape(top_3[2][0])}**", unsafe_allow_html=True)
+            st.metric("點數", value=f"{top_3[2][1]:,}")
+    elif len(top_3) > 0:
+        st.warning(f"會員人數不足3位 (目前 {len(top_3)} 位)，無法顯示完整前三名。")
+
+    st.markdown("---")
+    st.subheader("完整排行榜")
+
+    # 🏆 以單一 HTML 區塊分頁顯示，只傳送目前頁面的資料
+    render_leaderboard(ranking, highlight_nickname=nickname, revision=revision)
+    changed_at = time.strftime("%H:%M:%S", time.localtime(state.leaderboard_changed_at))
+    st.caption(f"排行榜資料最後變動時間：{changed_at}")
+
+def current_view():
+    """目前選取的分頁 (管理員頁面再加上子分頁)，作為 rerun 耗時統計的分類。"""
+    state = st.session_state
+    view = state.get("main_tab", "會員點數排行榜")
+    if view == "管理員頁面" and state.get("admin_logged_in"):
+        view += f" / {state.get('admin_tab', '點數管理')}"
+    return view
+
+def prefetch_current_view():
+    """依目前選取的分頁 (與管理員子分頁)，同時送出該頁面需要的讀取，其他分頁不會讀取資料。"""
+    state = st.session_state
+    loaders = {}
+    view = state.get("main_tab", "會員點數排行榜")
+    if view == "會員點數排行榜" and state.member_logged_in:
+        loaders["ranking"] = storage.members.ranking
+    elif view == "管理員頁面" and state.admin_logged_in:
+        admin_view = state.get("admin_tab", "點數管理")
+        if admin_view == "點數管理":
+            loaders["members"] = storage.members.frame
+        elif admin_view == "抽獎管理":
+            loaders["raffle"] = storage.raffle.frame
+            # 按下依點數加權的抽獎時也會用到會員資料
+            if state.get("raffle_draw") and state.get("raffle_weighted"):
+                loaders["members"] = storage.members.frame
+    return prefetch(loaders)
+
 def main():
+    # 重設本次 rerun 的 Google Sheets API 呼叫統計
+    api_metrics.start_rerun()
+    rerun_profiler.phase("初始化")
+
+    # Google Sheets 無法連線時改以本機快照顯示，此時只能瀏覽資料
+    cache = storage.cache
+    if storage.backend == "sheets" and cache.is_offline():
+        synced = [cache.synced_at(name) for name in cache.offline]
+        synced = [synced_at for synced_at in synced if synced_at is not None]
+        if synced:
+            minutes = int((time.time() - min(synced)) // 60)
+            notice = f"⚠️ 目前無法連線到 Google Sheets，顯示的是約 {minutes} 分鐘前的資料，暫時無法修改點數或抽獎。"
+        else:
+            notice = "⚠️ 目前無法連線到 Google Sheets，暫時無法修改點數或抽獎。"
+        if storage.write_queue is not None:
+            notice += "新的註冊與報名會先保存在本機，恢復連線後自動寫入。"
+        st.warning(notice)
+
     # 使用 session_state 來儲存登入狀態
     if 'admin_logged_in' not in st.session_state:
         st.session_state.admin_logged_in = False
@@ -113,8 +277,12 @@ def main():
         st.session_state.member_logged_in = False
     if 'current_member_nickname' not in st.session_state:
         st.session_state.current_member_nickname = None
-    if 'registration_trigger' not in st.session_state:
-        st.session_state.registration_trigger = False # 用於追蹤註冊是從哪裡觸發的
+
+    # 目前頁面需要的工作表同時下載，各分頁再從這裡取得結果
+    rerun_profiler.phase("送出預先讀取")
+    prefetched = prefetch_current_view()
+
+    rerun_profiler.phase("側邊欄")
 
     # 側邊欄 Logo
     logo_url = "https://raw.githubusercontent.com/ThomasPeng8888/streamlit-guppy/main/logo.png"
@@ -125,9 +293,9 @@ def main():
     # 📌 登入/註冊區塊 (保留在側邊欄)
     st.sidebar.markdown("---")
     
-    sheet = get_points_sheet()
-    if not sheet:
-        return # 如果無法取得 Sheet，則停止應用程式
+    members = get_member_repository()
+    if not members:
+        return # 如果無法取得會員資料，則停止應用程式
 
     if not st.session_state.member_logged_in:
         # ---------------------------
@@ -139,25 +307,17 @@ def main():
             login_member_button = st.form_submit_button("登入會員")
         
         if login_member_button:
-            # 載入所有會員資料進行比對
-            df = pd.DataFrame(sheet.get_all_records())
-            
-            required_cols = ['帳號', '密碼', '暱稱']
-            if not all(col in df.columns for col in required_cols):
+            # 直接以帳號查詢 (索引或資料庫)，不需建立整張表的 DataFrame
+            if members.missing_columns:
                 st.sidebar.error("會員資料表格缺少 '帳號'、'密碼' 或 '暱稱' 欄位。請確認 Google Sheet 已更新。")
                 return
 
-            # 強制將 DataFrame 中的 '帳號' 和 '密碼' 轉換為字串型態
-            df['帳號'] = df.get('帳號', pd.Series(dtype=str)).astype(str)
-            df['密碼'] = df.get('密碼', pd.Series(dtype=str)).astype(str)
-            
-            # 尋找匹配的帳號和密碼
-            match = df[(df['帳號'] == member_account) & (df['密碼'] == member_password)]
+            matched_nickname = members.authenticate(member_account, member_password)
             
-            if not match.empty:
+            if matched_nickname is not None:
                 st.session_state.member_logged_in = True
-                st.session_state.current_member_nickname = match.iloc[0]['暱稱']
-                st.sidebar.success(f"登入成功！歡迎 {match.iloc[0]['暱稱']}")
+                st.session_state.current_member_nickname = matched_nickname
+                st.sidebar.success(f"登入成功！歡迎 {matched_nickname}")
                 st.rerun()
             else:
                 st.sidebar.error("帳號或密碼錯誤。")
@@ -174,54 +334,37 @@ def main():
             register_button = st.form_submit_button("立即註冊")
         
         if register_button:
-            st.session_state.registration_trigger = True # 標記註冊由側邊欄觸發
             if not new_nickname or not new_account or not new_password:
                 st.sidebar.error("暱稱、帳號和密碼為必填欄位。")
             else:
                 # 檢查暱稱和帳號是否重複
-                all_values = sheet.get_all_values()
-                
-                if len(all_values) > 0:
-                    header = all_values[0]
-                    data_rows = all_values[1:]
-                    
-                    try:
-                        # 找到 '暱稱' 和 '帳號' 欄位索引，用於重複性檢查
-                        nickname_col_index = header.index('暱稱')
-                        account_col_index = header.index('帳號')
-                    except ValueError as e:
-                        st.sidebar.error(f"會員資料表格缺少必要的欄位 ({e.args[0].split()[-1].strip()})。")
-                        st.session_state.registration_trigger = False
-                        return
-
-                    # 取得現有資料進行比對
-                    existing_nicknames = [row[nickname_col_index] for row in data_rows if len(row) > nickname_col_index]
-                    existing_accounts = [row[account_col_index] for row in data_rows if len(row) > account_col_index]
-                else:
-                    existing_nicknames = []
-                    existing_accounts = []
+                missing_cols = [col for col in ('暱稱', '帳號') if col in members.missing_columns]
+                if missing_cols:
+                    st.sidebar.error(f"會員資料表格缺少必要的欄位 ({', '.join(missing_cols)})。")
+                    return
 
-                if new_nickname in existing_nicknames:
+                if members.nickname_taken(new_nickname):
                     st.sidebar.warning("此暱稱已被使用，請選擇其他暱稱。")
-                elif new_account in existing_accounts:
+                elif members.account_taken(new_account):
                     st.sidebar.warning("此帳號已被使用，請選擇其他帳號。")
                 else:
                     initial_points = 0
-                    
-                    # 使用動態構建的行資料，確保順序正確
-                    row_to_append = build_append_row(sheet, new_nickname, initial_points, new_account, new_password)
 
-                    if row_to_append:
-                        # 執行 append_row
-                        sheet.append_row(row_to_append)
-                        
-                        # 註冊成功後自動登入
-                        st.session_state.member_logged_in = True
-                        st.session_state.current_member_nickname = new_nickname
-                        st.sidebar.success(f"會員 **{new_nickname}** 註冊成功並自動登入！")
-                        st.balloons()
-                        st.rerun()
-            st.session_state.registration_trigger = False
+                    try:
+                        # 延遲寫入模式下會先放入佇列
+                        added = members.add_member(new_nickname, initial_points, new_account, new_password)
+                    except MissingColumnsError as e:
+                        st.sidebar.error(f"錯誤：您的 '拯救會員管理' Sheet 缺少必要的欄位: {', '.join(e.columns)}。")
+                    else:
+                        if not added:
+                            st.sidebar.warning("此暱稱或帳號剛剛已被註冊，請選擇其他暱稱或帳號。")
+                        else:
+                            # 註冊成功後自動登入
+                            st.session_state.member_logged_in = True
+                            st.session_state.current_member_nickname = new_nickname
+                            st.sidebar.success(f"會員 **{new_nickname}** 註冊成功並自動登入！")
+                            st.balloons()
+                            st.rerun()
 
     else:
         st.sidebar.success(f"已登入：**{st.session_state.current_member_nickname}**")
@@ -236,405 +379,516 @@ def main():
     # 移除原本的 st.sidebar.title("導覽選單") 和 st.sidebar.radio
     
     # --- 頂部導覽列 (Main Content Tabs) ---
+    rerun_profiler.phase("分頁內容")
     st.title("應用程式功能區")
     
-    tab_rank, tab_raffle, tab_admin = st.tabs(["會員點數排行榜", "抽獎活動", "管理員頁面"])
+    # on_change="rerun" 讓每次 rerun 只執行目前選取的分頁，隱藏的分頁不會讀取任何資料
+    tab_rank, tab_raffle, tab_admin = st.tabs(["會員點數排行榜", "抽獎活動", "管理員頁面"], key="main_tab", on_change="rerun")
 
 
     # ----------------------------------------------------
     # 📌 頁面 1: 會員點數排行榜
     with tab_rank:
-        st.subheader("會員點數排行榜 🏆")
+        if tab_rank.open:
+            st.subheader("會員點數排行榜 🏆")
         
-        if not st.session_state.member_logged_in:
-            st.warning("⚠️ 此頁面為會員專屬，請先登入帳號或註冊新會員。")
-        else:
-            st.info(f"歡迎 **{st.session_state.current_member_nickname}**！所有會員點數排名，會即時更新喔！")
+            if not st.session_state.member_logged_in:
+                st.warning("⚠️ 此頁面為會員專屬，請先登入帳號或註冊新會員。")
+            else:
+                st.info(f"歡迎 **{st.session_state.current_member_nickname}**！所有會員點數排名，會即時更新喔！")
             
-            if st.button("重新整理排行榜"):
-                st.rerun()
-
-            if sheet:
-                data = sheet.get_all_records()
-                if data:
-                    df = pd.DataFrame(data)
-                    
-                    # 確保 '點數' 欄位是數字類型，並處理錯誤
-                    df['點數'] = pd.to_numeric(df.get('點數', pd.Series(dtype=int)), errors='coerce').fillna(0).astype(int)
-                    
-                    # 按點數降序排列，並重設索引
-                    sorted_df = df.sort_values(by='點數', ascending=False).reset_index(drop=True)
-                    
-                    st.markdown("---")
-                    st.subheader("點數冠軍榜 ✨")
-                    
-                    # 視覺化前三名
-                    if len(sorted_df) >= 3:
-                        top_3_cols = st.columns(3)
-                        with top_3_cols[0]:
-                            st.markdown(f"<h3 style='text-align: center;'>🥇 No.1</h3>", unsafe_allow_html=True)
-                            # 使用 Markdown 確保暱稱不會過長而影響 metric 顯示
-                            st.markdown(f"**{sorted_df.iloc[0]['暱稱']}**", unsafe_allow_html=True)
-                            st.metric("點數", value=f"{sorted_df.iloc[0]['點數']:,}") # 點數加上千分位
-                        with top_3_cols[1]:
-                            st.markdown(f"<h3 style='text-align: center;'>🥈 No.2</h3>", unsafe_allow_html=True)
-                            st.markdown(f"**{sorted_df.iloc[1]['暱稱']}**", unsafe_allow_html=True)
-                            st.metric("點數", value=f"{sorted_df.iloc[1]['點數']:,}")
-                        with top_3_cols[2]:
-                            st.markdown(f"<h3 style='text-align: center;'>🥉 No.3</h3>", unsafe_allow_html=True)
-                            st.markdown(f"**{sorted_df.iloc[2]['暱稱']}**", unsafe_allow_html=True)
-                            st.metric("點數", value=f"{sorted_df.iloc[2]['點數']:,}")
-                    elif len(sorted_df) > 0:
-                        st.warning(f"會員人數不足3位 (目前 {len(sorted_df)} 位)，無法顯示完整前三名。")
-
-                    st.markdown("---")
-                    st.subheader("完整排行榜")
-                    
-                    # ----------------------------------------------------
-                    # 🏆 UI/UX 優化：使用 Markdown/CSS 建立自定義且對齊的排行榜
-                    # ----------------------------------------------------
-                    st.markdown("""
-                    <style>
-                    /* Custom CSS for a better-aligned and styled leaderboard */
-                    .leaderboard-header-row {
-                        display: flex;
-                        font-weight: bold;
-                        font-size: 1.1em;
-                        padding: 10px 15px;
-                        background-color: #e6f3ff; /* 淺藍色背景 */
-                        border-radius: 8px;
-                        margin-bottom: 5px;
-                        color: #1f78b4;
-                    }
-
-                    .leaderboard-item-row {
-                        display: flex;
-                        padding: 8px 15px;
-                        margin-bottom: 5px;
-                        border-radius: 8px;
-                        align-items: center;
-                        background-color: white;
-                        box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-                        transition: all 0.2s ease-in-out;
-                        /* 設置每個元素的高度，避免在 Streamlit 中因內容不同而導致的不對齊 */
-                        min-height: 40px; 
-                        color: #333333; /* ✨ 修改點：為所有行項目設定清晰的深灰色字體 */
-                    }
-                    .leaderboard-item-row:hover {
-                        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                        transform: translateY(-1px);
-                    }
-
-                    /* 使用固定百分比寬度確保對齊 */
-                    .leaderboard-rank { width: 15%; text-align: left; font-weight: bold; }
-                    .leaderboard-name { width: 60%; text-align: left; }
-                    .leaderboard-points { width: 25%; text-align: right; font-weight: bold; color: #0056b3; } /* ✨ 修改點：改為清晰的深藍色 */
-
-                    /* 特殊前三名樣式 */
-                    .rank-1 { background-color: #fffde7; border-left: 5px solid #FFD700; }
-                    .rank-2 { background-color: #f7f7f7; border-left: 5px solid #C0C0C0; }
-                    .rank-3 { background-color: #fff0e6; border-left: 5px solid #CD7F32; }
-
-                    .leaderboard-name, .leaderboard-points, .leaderboard-rank {
-                        /* 確保文字不會換行，使用省略號 */
-                        white-space: nowrap; 
-                        overflow: hidden; 
-                        text-overflow: ellipsis;
-                        align-self: center; /* 垂直居中 */
-                    }
-                    </style>
-                    """, unsafe_allow_html=True)
-
-                    # 排行榜標頭
-                    st.markdown("""
-                    <div class='leaderboard-header-row'>
-                        <span class='leaderboard-rank'>排名</span>
-                        <span class='leaderboard-name'>暱稱</span>
-                        <span class='leaderboard-points'>點數</span>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-
-                    for index, row in sorted_df.iterrows():
-                        rank = index + 1
-                        nickname = row['暱稱']
-                        points = f"{row['點數']:,}" # 點數加上千分位格式
-
-                        # 根據排名決定樣式
-                        if rank == 1:
-                            rank_icon = "🥇 No.1"
-                            row_class = "rank-1"
-                        elif rank == 2:
-                            rank_icon = "🥈 No.2"
-                            row_class = "rank-2"
-                        elif rank == 3:
-                            rank_icon = "🥉 No.3"
-                            row_class = "rank-3"
-                        else:
-                            rank_icon = f"No.{rank}"
-                            row_class = ""
-
-                        # 渲染每一行排行榜
-                        st.markdown(f"""
-                        <div class='leaderboard-item-row {row_class}'>
-                            <span class='leaderboard-rank'>{rank_icon}</span>
-                            <span class='leaderboard-name'>{nickname}</span>
-                            <span class='leaderboard-points'>{points}</span>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    # ----------------------------------------------------
-                    
-                else:
-                    st.warning("目前沒有任何會員資料可顯示。")
+                auto_refresh = st.toggle(
+                    "自動更新排行榜",
+                    key="leaderboard_auto",
+                    help=f"每 {leaderboard_refresh_seconds()} 秒檢查一次，只有資料變動時才重新顯示",
+                )
+                # 等待預先送出的讀取完成，排行榜區塊再從共用快取取得名次索引
+                rerun_profiler.phase("等待排行榜資料")
+                prefetched.result("ranking", members.ranking)
+                # 自動更新時只定時重新執行排行榜區塊，不會重新執行整個頁面
+                live = st.fragment(leaderboard_section, run_every=leaderboard_refresh_seconds() if auto_refresh else None)
+                live(members, st.session_state.current_member_nickname)
     
     # ----------------------------------------------------
     # 📌 頁面 2: 抽獎活動
     with tab_raffle:
-        st.subheader("抽獎活動報名表單")
+        if tab_raffle.open:
+            rerun_profiler.phase("抽獎報名")
+            st.subheader("抽獎活動報名表單")
         
-        if not st.session_state.member_logged_in:
-            st.warning("⚠️ 此頁面為會員專屬，請先登入帳號或註冊新會員才能參與抽獎活動。")
-        else:
-            st.info("請填寫您的資訊，以便參與抽獎！")
+            if not st.session_state.member_logged_in:
+                st.warning("⚠️ 此頁面為會員專屬，請先登入帳號或註冊新會員才能參與抽獎活動。")
+            else:
+                st.info("請填寫您的資訊，以便參與抽獎！")
 
-            with st.form(key="registration_form"):
-                name = st.text_input("姓名")
-                email = st.text_input("電子郵件")
-                submit_button = st.form_submit_button("提交報名")
+                with st.form(key="registration_form"):
+                    name = st.text_input("姓名")
+                    email = st.text_input("電子郵件")
+                    submit_button = st.form_submit_button("提交報名")
             
-            if submit_button:
-                if not name or not email:
-                    st.error("姓名和電子郵件為必填欄位。")
-                else:
-                    raffle_sheet = get_raffle_sheet()
-                    if raffle_sheet:
-                        # 檢查電子郵件重複性 (從第 2 行開始檢查，忽略標題)
-                        try:
-                            # 假設電子郵件在第 2 欄
-                            emails_list = raffle_sheet.col_values(2)[1:] 
-                        except Exception as e:
-                            st.error(f"無法讀取電子郵件列表：{e}")
-                            return
-                        
-                        if email in emails_list:
-                            st.warning("您使用的電子郵件已報名過，請勿重複提交。")
-                        else:
-                            # 假設抽獎名單表格結構是 [姓名, 電子郵件, 是否中獎 (此欄位應該是手動新增的)]
-                            # 為了確保資料順序正確，需要讀取標頭並動態建立行
+                if submit_button:
+                    if not name or not email:
+                        st.error("姓名和電子郵件為必填欄位。")
+                    else:
+                        raffle = get_raffle_repository()
+                        if raffle:
+                            # 檢查電子郵件重複性
                             try:
-                                raffle_header = raffle_sheet.row_values(1)
-                                row_to_append = []
-                                data_map = {'姓名': name, '電子郵件': email, '是否中獎': ''}
-                                for col_name in raffle_header:
-                                    row_to_append.append(data_map.get(col_name, ''))
-
-                                raffle_sheet.append_row(row_to_append)
-                                st.success("報名成功！感謝您的參與！")
-                                st.balloons()
+                                email_taken = raffle.email_taken(email)
                             except Exception as e:
-                                st.error(f"新增抽獎報名資料時發生錯誤：{e}")
+                                st.error(f"無法讀取電子郵件列表：{e}")
+                                return
+                        
+                            if email_taken:
+                                st.warning("您使用的電子郵件已報名過，請勿重複提交。")
+                            else:
+                                # 假設抽獎名單表格結構是 [姓名, 電子郵件, 是否中獎 (此欄位應該是手動新增的)]
+                                try:
+                                    if raffle.add_entry(name, email):
+                                        st.success("報名成功！感謝您的參與！")
+                                        st.balloons()
+                                    else:
+                                        st.warning("您使用的電子郵件已報名過，請勿重複提交。")
+                                except Exception as e:
+                                    st.error(f"新增抽獎報名資料時發生錯誤：{e}")
 
 
     # ----------------------------------------------------
     # 📌 頁面 3: 管理員頁面
     with tab_admin:
-        if not st.session_state.admin_logged_in:
-            with st.form(key="admin_login_form"):
-                st.subheader("管理員登入 🔐")
-                password = st.text_input("輸入密碼", type="password")
-                login_button = st.form_submit_button("登入")
-
-            if login_button:
-                if password and password == st.secrets.get("admin_password"):
-                    st.session_state.admin_logged_in = True
-                    st.success("登入成功！")
-                    st.rerun()
-                else:
-                    st.error("密碼錯誤。")
-        else:
-            st.title("管理員控制台 ⚙️")
-            st.markdown("---")
+        if tab_admin.open:
+            if not st.session_state.admin_logged_in:
+                with st.form(key="admin_login_form"):
+                    st.subheader("管理員登入 🔐")
+                    password = st.text_input("輸入密碼", type="password")
+                    login_button = st.form_submit_button("登入")
+
+                if login_button:
+                    if password and password == st.secrets.get("admin_password"):
+                        st.session_state.admin_logged_in = True
+                        st.success("登入成功！")
+                        st.rerun()
+                    else:
+                        st.error("密碼錯誤。")
+            else:
+                rerun_profiler.phase("管理員狀態")
+                st.title("管理員控制台 ⚙️")
+
+                # 顯示共用快取的命中情況，方便觀察實際省下多少次 Google Sheets 讀取
+                cache = storage.cache
+                write_queue = storage.write_queue
+                with st.expander("資料快取狀態"):
+                    st.caption(f"資料來源：{storage.backend}")
+                    if cache is not None:
+                        st.caption(f"快取存活時間：{cache.ttl} 秒")
+                        if cache.incremental:
+                            st.caption(f"增量同步：{', '.join(sorted(cache.incremental))}，每 {cache.full_sync_interval} 秒整張重新下載一次")
+                        if cache.shared is not None:
+                            leaders = "、".join(
+                                f"{name}：{'本程序' if owner == cache.shared.owner else owner}"
+                                for name, (owner, expires_at) in sorted(cache.shared.leases().items())
+                                if expires_at > time.time()
+                            )
+                            st.caption(f"多個程序共用快取，負責重新下載的程序：{leaders or '無'}")
+                        cache_stats = cache.stats()
+                        if cache_stats:
+                            st.dataframe(pd.DataFrame(cache_stats).T.rename(columns={"hits": "命中", "deltas": "增量下載", "misses": "整張下載"}))
+                        else:
+                            st.write("尚未有任何讀取。")
+                        # 所有 session 共用同一份快照；舊版本在沒有 session 使用後就會被回收
+                        memory = pd.DataFrame(cache.memory()).T
+                        if not memory.empty:
+                            memory[["snapshot", "frames", "old_bytes"]] = (memory[["snapshot", "frames", "old_bytes"]] / 2**20).round(2)
+                            st.caption("快照記憶體用量 (MB)")
+                            st.dataframe(memory.rename(columns={
+                                "revision": "版本", "snapshot": "目前快照", "frames": "DataFrame",
+                                "old_versions": "使用中的舊版本數", "old_bytes": "舊版本",
+                            }))
+                    if write_queue is not None:
+                        st.caption(f"延遲寫入佇列：{write_queue.pending_count()} 筆待寫入")
+                        if write_queue.last_error:
+                            st.warning(f"最近一次寫回 Google Sheet 失敗：{write_queue.last_error}")
+                    if storage.sync is not None and storage.sync.last_error:
+                        st.warning(f"最近一次同步到 Google Sheets 失敗：{storage.sync.last_error}")
+
+                # 顯示 Google Sheets API 呼叫量，找出是哪個頁面或操作用掉配額
+                with st.expander("Google Sheets API 使用量"):
+                    calls_per_minute = api_metrics.calls_per_minute()
+                    st.metric(
+                        "最近一分鐘呼叫次數",
+                        value=f"{calls_per_minute} / {api_metrics.quota_per_minute}",
+                        help="與每分鐘配額相比，超過配額時 Google 會回傳 429 錯誤。",
+                    )
+                    st.progress(min(calls_per_minute / api_metrics.quota_per_minute, 1.0))
+                    rerun_totals, session_totals = api_metrics.current_session()
+                    st.caption(
+                        f"本次 rerun：{rerun_totals['calls']} 次呼叫、{rerun_totals['bytes']:,} bytes ｜ "
+                        f"本 session：{session_totals['calls']} 次呼叫、{session_totals['bytes']:,} bytes"
+                    )
+                    if api_metrics.retries:
+                        retries = "、".join(f"{status}：{count} 次" for status, count in api_metrics.retries.items())
+                        st.caption(f"自動重試：{retries}")
+                    hottest = api_metrics.hottest(by="path")
+                    if hottest:
+                        st.markdown("#### 呼叫最多的程式位置")
+                        hottest_df = pd.DataFrame(hottest).set_index("name")
+                        hottest_df["avg_ms"] = (hottest_df["seconds"] / hottest_df["calls"] * 1000).round(1)
+                        st.dataframe(hottest_df[["calls", "errors", "avg_ms", "bytes"]])
+                    export_cols = st.columns(2)
+                    export_cols[0].download_button("下載 JSON", api_metrics.to_json(), file_name="sheets_api_metrics.json")
+                    export_cols[1].download_button("下載 Prometheus 格式", api_metrics.to_prometheus(), file_name="sheets_api_metrics.prom")
+
+                # 每次 rerun 各階段的耗時，以及指定 session 的 cProfile 擷取
+                with st.expander("執行時間分析"):
+                    profiling_section()
+                st.markdown("---")
             
-            # 管理員頁面內部的子選單仍使用 st.tabs
-            tab1, tab2, tab3 = st.tabs(["點數管理", "抽獎管理", "新增會員"])
-
-            # 點數管理功能
-            with tab1:
-                st.subheader("會員點數管理")
-                if st.button("重新整理會員列表", key="refresh_points_admin"):
-                    st.rerun()
-
-                if sheet:
-                    data = sheet.get_all_records()
-                    if data:
-                        df = pd.DataFrame(data)
-                        
-                        # 確保 '點數' 欄位是數字類型
-                        df['點數'] = pd.to_numeric(df.get('點數', pd.Series(dtype=int)), errors='coerce').fillna(0).astype(int)
-                        
-                        # 確保暱稱也是字串，用於下拉選單和後續查找
-                        df['暱稱'] = df.get('暱稱', pd.Series(dtype=str)).astype(str)
-                        
-                        st.markdown("#### 所有會員列表")
+                # 管理員頁面內部的子選單同樣只執行目前選取的分頁
+                tab1, tab2, tab3, tab4 = st.tabs(
+                    ["點數管理", "抽獎管理", "新增會員", "活動封存"], key="admin_tab", on_change="rerun"
+                )
+
+                # 點數管理功能
+                with tab1:
+                    if tab1.open:
+                        rerun_profiler.phase("點數管理")
+                        st.subheader("會員點數管理")
+                        if st.button("重新整理會員列表", key="refresh_points_admin"):
+                            members.refresh()
+                            st.rerun()
+
+                        if members:
+                            # 點數為 int32、暱稱為字串 (由 schema 統一轉換)
+                            rerun_profiler.phase("等待會員資料")
+                            df = prefetched.result("members", members.frame)
+                            rerun_profiler.phase("點數管理")
+                            if not df.empty:
+                                st.markdown("#### 所有會員列表")
                         
-                        # 只顯示 '暱稱' 和 '點數' 欄位
-                        display_cols = ['暱稱', '點數']
-                        available_cols = [col for col in display_cols if col in df.columns]
-                        st.dataframe(df[available_cols], hide_index=True)
+                                # 只顯示 '暱稱' 和 '點數' 欄位，並且只傳送目前這一頁
+                                display_cols = ['暱稱', '點數']
+                                available_cols = [col for col in display_cols if col in df.columns]
+                                render_paged_table(df[available_cols])
                         
-                        if '暱稱' in df.columns:
-                            member_nickname = st.selectbox(
-                                "選擇要管理的會員暱稱：",
-                                options=df['暱稱'].tolist()
-                            )
-                        else:
-                            st.warning("會員資料表格缺少 '暱稱' 欄位。")
-                            member_nickname = None
-
-                        if member_nickname:
-                            member_data = df[df['暱稱'] == member_nickname].iloc[0]
-                            st.markdown("---")
-                            st.metric(label="目前點數", value=member_data['點數'])
-                            
-                            with st.form(key="points_form"):
-                                points_change = st.number_input(
-                                    "輸入要增減的點數：",
-                                    value=0,
-                                    step=1
-                                )
-                                submit_points = st.form_submit_button("更新點數")
-                            
-                            if submit_points:
-                                header_row = sheet.row_values(1)
-                                try:
-                                    points_col_index = header_row.index('點數') + 1
-                                except ValueError:
-                                    st.error("點數表格中找不到 '點數' 欄位。")
-                                    return
-
-                                current_points = member_data['點數']
-                                new_points = int(current_points) + points_change
-                                
-                                if new_points < 0:
-                                    st.warning("點數不能為負數，請重新輸入。")
+                                if '暱稱' in df.columns:
+                                    st.markdown("---")
+                                    points_editor(members)
                                 else:
+                                    st.warning("會員資料表格缺少 '暱稱' 欄位。")
+
+                                # 批次調整：上傳 CSV 或貼上清單，先預覽再以單一請求寫入
+                                st.markdown("---")
+                                st.markdown("#### 批次調整點數")
+                                with st.form(key="bulk_points_form"):
+                                    uploaded = st.file_uploader("上傳 CSV (每行「暱稱,增減」)", type="csv")
+                                    pasted = st.text_area("或貼上「暱稱,增減」清單 (每行一筆)", key="bulk_points_text")
+                                    preview_cols = st.columns(2)
+                                    preview_bulk = preview_cols[0].form_submit_button("預覽")
+                                    apply_bulk = preview_cols[1].form_submit_button("套用")
+
+                                if preview_bulk or apply_bulk:
                                     try:
-                                        # 找出暱稱所在行 (gspread 索引從 1 開始)
-                                        nicknames_list = sheet.col_values(1)
-                                        row_index = nicknames_list.index(member_nickname) + 1 
-                                        
-                                        # 更新點數：row_index 是行數 (1-based)
-                                        sheet.update_cell(row_index, points_col_index, new_points)
-                                        st.success(f"已將會員 **{member_nickname}** 的點數更新為 **{new_points}**！")
-                                        st.rerun() # 重新運行以更新顯示的點數
-                                    except Exception as e:
-                                        st.error(f"更新點數時發生錯誤：{e}")
-                    else:
-                        st.warning("目前沒有任何會員。")
+                                        text = bulk_points.decode_csv(uploaded.getvalue()) if uploaded is not None else pasted
+                                    except UnicodeDecodeError:
+                                        st.error("無法辨識 CSV 檔案的編碼，請另存為 UTF-8 或 Big5 格式後再上傳。")
+                                        text = None
+                                    changes = bulk_points.parse_changes(text) if text is not None else None
+                                    if changes is None:
+                                        pass
+                                    elif changes.empty:
+                                        st.warning("請上傳 CSV 或貼上要調整的清單。")
+                                    else:
+                                        try:
+                                            report = members.bulk_update_points(changes, dry_run=not apply_bulk)
+                                        except MissingColumnsError as e:
+                                            st.error(f"會員資料表格缺少必要的欄位 ({', '.join(e.columns)})。")
+                                        except ReadOnlyError as e:
+                                            st.warning(str(e))
+                                        except Exception as e:
+                                            st.error(f"批次調整點數時發生錯誤：{e}")
+                                        else:
+                                            st.session_state.bulk_points_report = (bool(apply_bulk), report)
+                                            if apply_bulk:
+                                                st.rerun() # 重新運行以更新會員列表
+
+                                if st.session_state.get('bulk_points_report') is not None:
+                                    was_applied, report = st.session_state.bulk_points_report
+                                    counts = report['結果'].value_counts()
+                                    summary = "、".join(f"{status} {count} 筆" for status, count in counts.items())
+                                    if was_applied:
+                                        st.success(f"批次調整完成：{summary}")
+                                    else:
+                                        st.info(f"預覽 (尚未寫入)：{summary}")
+                                    st.dataframe(report[['行號', '內容', '暱稱', '增減', '原點數', '新點數', '結果']], hide_index=True)
+
+                                # 每次增減都有紀錄，可與目前點數比對找出被直接修改或遺失的更新
+                                if storage.ledger is not None:
+                                    with st.expander("點數異動紀錄"):
+                                        st.dataframe(storage.ledger.recent(), hide_index=True)
+                                        mismatches = storage.ledger.mismatches(df)
+                                        if mismatches.empty:
+                                            st.caption("有異動紀錄的會員，目前點數都與最後一筆紀錄相符。")
+                                        else:
+                                            st.warning(f"有 {len(mismatches)} 位會員的目前點數與異動紀錄不符 (可能被直接修改了工作表)：")
+                                            st.dataframe(mismatches, hide_index=True)
+                            else:
+                                st.warning("目前沒有任何會員。")
             
-            # 抽獎管理功能
-            with tab2:
-                st.subheader("抽獎控制台")
-                if st.button("重新整理抽獎名單", key="refresh_raffle_admin"):
-                    st.rerun()
-
-                raffle_sheet = get_raffle_sheet()
-                if raffle_sheet:
-                    data = raffle_sheet.get_all_records()
-                    if data:
-                        df = pd.DataFrame(data)
-                        
-                        if '是否中獎' not in df.columns:
-                            st.error("抽獎名單表格中找不到 '是否中獎' 欄位，請在 Google Sheet 中手動新增。")
-                            eligible_df = pd.DataFrame() 
-                        else:
-                            # 強制將 '是否中獎' 欄位轉換為字串，以避免因資料型態不一致導致過濾失敗
-                            df['是否中獎'] = df.get('是否中獎', pd.Series(dtype=str)).astype(str)
-                            # 過濾掉已經中獎的參與者
-                            eligible_df = df[df['是否中獎'] != '是'] 
-
-                        st.markdown(f"### 目前共有 {len(eligible_df)} 位合格參與者：")
-                        st.dataframe(eligible_df, hide_index=True)
-
-                        if not eligible_df.empty:
-                            num_winners = st.number_input(
-                                "請輸入要抽出的得獎者人數：", 
-                                min_value=1, 
-                                max_value=len(eligible_df), 
-                                value=min(1, len(eligible_df)),
-                                step=1
+                # 抽獎管理功能
+                with tab2:
+                    if tab2.open:
+                        rerun_profiler.phase("抽獎管理")
+                        st.subheader("抽獎控制台")
+                        raffle = get_raffle_repository()
+                        if st.button("重新整理抽獎名單", key="refresh_raffle_admin"):
+                            if raffle:
+                                raffle.refresh()
+                            st.rerun()
+
+                        # 最近一次的抽獎結果與稽核紀錄 (rerun 後仍會顯示)
+                        if st.session_state.get('last_draw'):
+                            record = st.session_state.last_draw
+                            if st.session_state.pop('celebrate_draw', False):
+                                st.balloons()
+                            st.success("🎉🎉🎉 恭喜以下幸運兒！ 🎉🎉🎉")
+                            for winner in st.session_state.last_draw_winners:
+                                st.success(f"**{winner['獎項']}**｜**姓名**：{winner['姓名']}")
+                                st.write(f"**聯絡信箱**：{winner['電子郵件']}")
+                            render_winners_status(st.session_state.last_draw_status)
+                            st.caption(
+                                f"抽獎時間：{record['drawn_at']}｜參與人數：{record['pool_size']}｜"
+                                f"亂數種子：{record['seed']}｜名單雜湊：{record['pool_fingerprint'][:12]}"
                             )
-                            if st.button("開始抽獎！"):
-                                if num_winners > 0 and num_winners <= len(eligible_df):
-                                    with st.spinner("正在抽出幸運兒..."):
-                                        time.sleep(2)
-                                        winners = draw_winners(eligible_df, num_winners)
-                                        
-                                        if winners:
-                                            st.balloons()
-                                            st.success("🎉🎉🎉 恭喜以下幸運兒！ 🎉🎉🎉")
-                                            for winner in winners:
-                                                st.success(f"**姓名**：{winner['姓名']}")
-                                                st.write(f"**聯絡信箱**：{winner['電子郵件']}")
-                                            update_winners_status(raffle_sheet, winners)
-                                            st.rerun()
-                                        else:
-                                            st.error("抽獎失敗，請確認名單。")
+                            st.download_button(
+                                "下載抽獎紀錄 (JSON)",
+                                raffle_draw.to_json(record),
+                                file_name=f"raffle_draw_{record['seed']}.json",
+                                mime="application/json",
+                            )
+
+                        if raffle:
+                            rerun_profiler.phase("等待抽獎名單")
+                            df = prefetched.result("raffle", raffle.frame)
+                            rerun_profiler.phase("抽獎管理")
+                            if not df.empty:
+                                if '是否中獎' not in df.columns:
+                                    st.error("抽獎名單表格中找不到 '是否中獎' 欄位，請在 Google Sheet 中手動新增。")
+                                    eligible = np.arange(0)
                                 else:
-                                    st.error("抽獎人數必須大於 0 且不超過合格參與者總數。")
-                        else:
-                            st.warning("目前沒有任何合格的參與者，所有人都已經中過獎。")
-                    else:
-                        st.warning("目前沒有任何參與者報名。")
+                                    # 過濾掉已經中獎的參與者：只保留列的位置，不複製共用的 DataFrame
+                                    eligible = np.flatnonzero(df['是否中獎'].to_numpy() != '是')
+
+                                st.markdown(f"### 目前共有 {len(eligible)} 位合格參與者：")
+                                render_paged_table(df, key="raffle_table", rows=eligible, unit="位合格參與者")
+
+                                if len(eligible):
+                                    num_winners = st.number_input(
+                                        "請輸入要抽出的得獎者人數：", 
+                                        min_value=1, 
+                                        max_value=len(eligible), 
+                                        value=min(1, len(eligible)),
+                                        step=1
+                                    )
+                                    prizes_text = st.text_area(
+                                        "多個獎項 (選填，每行一個「獎項名稱,名額」，依序由先抽出的人獲得；填寫後會取代上方的人數)",
+                                        key="raffle_prizes",
+                                    )
+                                    weighted = st.checkbox("依會員點數加權 (姓名與會員暱稱相同者權重為 1 + 點數，其餘為 1)", key="raffle_weighted")
+                                    seed_text = st.text_input("亂數種子 (重播抽獎時填入，留空則自動產生)", key="raffle_seed")
+                                    # 離線時無法把中獎者寫回工作表，暫停抽獎
+                                    if st.button("開始抽獎！", key="raffle_draw", disabled=raffle.read_only):
+                                        try:
+                                            prizes = raffle_draw.parse_prizes(prizes_text) or [("得獎者", int(num_winners))]
+                                            seed = int(seed_text) if seed_text.strip() else None
+                                        except ValueError as e:
+                                            st.error(f"抽獎設定有誤：{e}")
+                                            prizes = None
+                                        if prizes and sum(count for _, count in prizes) > len(eligible):
+                                            st.error("抽獎人數必須大於 0 且不超過合格參與者總數。")
+                                        elif prizes:
+                                            weights = None
+                                            if weighted:
+                                                member_df = prefetched.result("members", members.frame)
+                                                if not member_df.empty and '暱稱' in member_df.columns:
+                                                    points = member_df['點數'].clip(lower=0).set_axis(member_df['暱稱'])
+                                                    points = points[~points.index.duplicated()]
+                                                    weights = df['姓名'].iloc[eligible].map(points).fillna(0).to_numpy(dtype=float) + 1
+                                            rerun_profiler.phase("抽獎並寫回")
+                                            record, winners = draw_winners(df, prizes, weights, seed, rows=eligible)
+                                            if winners:
+                                                st.session_state.last_draw = record
+                                                st.session_state.last_draw_winners = winners
+                                                st.session_state.celebrate_draw = True
+                                                st.session_state.last_draw_status = update_winners_status(raffle, winners)
+                                                st.rerun()
+                                            else:
+                                                st.error("抽獎失敗，請確認名單。")
+                                else:
+                                    st.warning("目前沒有任何合格的參與者，所有人都已經中過獎。")
+                            else:
+                                st.warning("目前沒有任何參與者報名。")
             
-            # 新增會員功能（管理員手動新增）
-            with tab3:
-                st.subheader("新增會員 (管理員專用) ➕")
-                with st.form(key="registration_form_new"):
-                    nickname = st.text_input("暱稱")
-                    account = st.text_input("帳號 (用於登入)")
-                    password = st.text_input("密碼 (用於登入)", type="password")
-                    initial_points = 0
-                    submit_button = st.form_submit_button("創建會員")
+                # 新增會員功能（管理員手動新增）
+                with tab3:
+                    if tab3.open:
+                        rerun_profiler.phase("新增會員")
+                        st.subheader("新增會員 (管理員專用) ➕")
+                        with st.form(key="registration_form_new"):
+                            nickname = st.text_input("暱稱")
+                            account = st.text_input("帳號 (用於登入)")
+                            password = st.text_input("密碼 (用於登入)", type="password")
+                            initial_points = 0
+                            submit_button = st.form_submit_button("創建會員")
+
+                        if submit_button:
+                            if not nickname or not account or not password:
+                                st.error("暱稱、帳號和密碼為必填欄位。")
+                            else:
+                                # 檢查暱稱和帳號是否重複
+                                missing_cols = [col for col in ('暱稱', '帳號') if col in members.missing_columns]
+                                if missing_cols:
+                                    st.error(f"會員資料表格缺少必要的欄位 ({', '.join(missing_cols)})。")
+                                    return
 
-                if submit_button:
-                    if not nickname or not account or not password:
-                        st.error("暱稱、帳號和密碼為必填欄位。")
-                    else:
-                        # 檢查暱稱和帳號是否重複
-                        all_values = sheet.get_all_values()
-                        
-                        if len(all_values) > 0:
-                            header = all_values[0]
-                            data_rows = all_values[1:]
-                            
-                            try:
-                                nickname_col_index = header.index('暱稱')
-                                account_col_index = header.index('帳號')
-                            except ValueError as e:
-                                st.error(f"會員資料表格缺少必要的欄位 ({e.args[0].split()[-1].strip()})。")
-                                return
-                            
-                            existing_nicknames = [row[nickname_col_index] for row in data_rows if len(row) > nickname_col_index]
-                            existing_accounts = [row[account_col_index] for row in data_rows if len(row) > account_col_index]
-                        else:
-                            existing_nicknames = []
-                            existing_accounts = []
+                                if members.nickname_taken(nickname):
+                                    st.warning("此暱稱已被使用，請選擇其他暱稱。")
+                                elif members.account_taken(account):
+                                    st.warning("此帳號已被使用，請選擇其他帳號。")
+                                else:
+                                    try:
+                                        # 延遲寫入模式下會先放入佇列
+                                        added = members.add_member(nickname, initial_points, account, password)
+                                    except MissingColumnsError as e:
+                                        st.error(f"錯誤：您的 '拯救會員管理' Sheet 缺少必要的欄位: {', '.join(e.columns)}。")
+                                    else:
+                                        if not added:
+                                            st.warning("此暱稱或帳號剛剛已被註冊，請選擇其他暱稱或帳號。")
+                                        else:
+                                            st.success(f"會員 **{nickname}** 創建成功！帳號：{account}。")
+                                            st.balloons()
 
-                        if nickname in existing_nicknames:
-                            st.warning("此暱稱已被使用，請選擇其他暱稱。")
-                        elif account in existing_accounts:
-                            st.warning("此帳號已被使用，請選擇其他帳號。")
-                        else:
-                            # 使用動態構建的行資料，確保順序正確
-                            row_to_append = build_append_row(sheet, nickname, initial_points, account, password)
+                # 結束目前的抽獎活動，以及查詢已封存的活動
+                with tab4:
+                    if tab4.open:
+                        rerun_profiler.phase("活動封存")
+                        campaign_archive_section()
+
+
+def profiling_section():
+    """各頁面每個階段的 rerun 耗時 (最近幾次的 p50 / p95)，以及以取樣方式擷取某個 session 的 cProfile。"""
+    own = session_id()
+    last = rerun_profiler.last_rerun(own)
+    if last is not None:
+        view, _, phases = last
+        breakdown = "、".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in phases)
+        st.caption(f"這個 session 上一次 rerun ({view})：{breakdown}")
+
+    stats = rerun_profiler.stats()
+    if stats:
+        views = sorted({row["view"] for row in stats})
+        view = st.selectbox("頁面", views, key="profile_view")
+        table = pd.DataFrame([row for row in stats if row["view"] == view]).drop(columns="view")
+        st.dataframe(
+            table.set_index("phase").sort_values("p95_ms", ascending=False).rename(columns={"count": "次數"})
+        )
+
+    st.markdown("#### cProfile 擷取")
+    target = rerun_profiler.target
+    labels = {
+        sid: f"{'這個 session' if sid == own else sid[:8]}｜{view}｜{time.strftime('%H:%M:%S', time.localtime(ended_at))}"
+        for sid, view, ended_at in rerun_profiler.sessions()
+    }
+    if labels:
+        with st.form(key="profile_capture_form"):
+            chosen = st.selectbox("要擷取的 session (依最近一次 rerun 排序)", list(labels), format_func=labels.get)
+            rate = st.slider("取樣比例 (%)", min_value=1, max_value=100, value=int(target[1] * 100) if target else 10)
+            start_col, stop_col = st.columns(2)
+            start = start_col.form_submit_button("開始擷取")
+            stop = stop_col.form_submit_button("停止擷取")
+        if start:
+            rerun_profiler.set_target(chosen, rate / 100)
+        elif stop:
+            rerun_profiler.set_target(None, 0)
+        target = rerun_profiler.target
+    if target is not None:
+        name = labels.get(target[0], target[0][:8]).split("｜")[0]
+        st.caption(f"正在以 {target[1]:.0%} 的比例擷取 {name} 的 rerun (同一時間只擷取一個 session)。")
+    else:
+        st.caption("目前沒有擷取任何 session，不會影響執行速度。")
+
+    captures = list(rerun_profiler.captures)
+    if captures:
+        index = st.selectbox(
+            "擷取結果",
+            range(len(captures)),
+            format_func=lambda i: f"{captures[i]['captured_at']}｜{captures[i]['view']}｜{captures[i]['seconds'] * 1000:.0f} ms",
+            key="profile_capture",
+        )
+        capture = captures[index]
+        st.code(capture["text"], language=None)
+        stamp = capture["captured_at"].replace(" ", "_").replace(":", "")
+        download_cols = st.columns(3)
+        download_cols[0].download_button(
+            "下載 .prof (snakeviz 可顯示火焰圖)", capture["prof"], file_name=f"rerun_{stamp}.prof",
+        )
+        download_cols[1].download_button("下載文字報表", capture["text"], file_name=f"rerun_{stamp}.txt")
+        if download_cols[2].button("清除擷取結果", key="clear_profile_captures"):
+            rerun_profiler.captures.clear()
+            st.rerun()
 
-                            if row_to_append:
-                                # 執行 append_row
-                                sheet.append_row(row_to_append)
-                                st.success(f"會員 **{nickname}** 創建成功！帳號：{account}。")
-                                st.balloons()
+def campaign_archive_section():
+    """結束本期抽獎活動 (報名資料封存到本機檔案後清空名單)，並可查詢過去各期的報名與中獎者。"""
+    st.subheader("抽獎活動封存 🗂️")
+    raffle = get_raffle_repository()
+    if raffle:
+        # 封存後才填入，顯示新一期的名稱
+        current = st.empty()
+        with st.form(key="close_campaign_form"):
+            next_name = st.text_input("下一期活動名稱 (選填，留空則沿用目前的名稱)")
+            confirm = st.checkbox("我確定要結束本期活動：報名名單會封存後清空")
+            close = st.form_submit_button("結束本期活動並封存", disabled=raffle.read_only)
+        if close:
+            if not confirm:
+                st.warning("請先勾選確認。")
+            else:
+                try:
+                    closed, count = raffle.close_campaign(next_name.strip() or None)
+                except ReadOnlyError as e:
+                    st.warning(str(e))
+                except Exception as e:
+                    st.error(f"封存活動時發生錯誤：{e}")
+                else:
+                    st.session_state.pop('last_draw', None)
+                    st.success(f"已封存「{closed}」的 {count} 筆報名資料，新的一期已開始。")
+        current.markdown(f"目前進行中的活動：**{raffle.campaign()}**")
+
+    st.markdown("#### 過去的活動")
+    campaigns = storage.archive.campaigns()
+    if not campaigns:
+        st.info("目前還沒有封存的活動。")
+        return
+    labels = {key: f"{name} (結束於 {closed_at})" for key, name, closed_at in campaigns}
+    key = st.selectbox("選擇活動", list(labels), format_func=labels.get, key="archived_campaign")
+    past = storage.archive.frame(key)
+    if past is None or past.empty:
+        st.warning("這一期活動沒有任何報名資料。")
+        return
+    winners = np.flatnonzero(past['是否中獎'].to_numpy() == '是') if '是否中獎' in past.columns else np.arange(0)
+    col1, col2 = st.columns(2)
+    col1.metric("報名人數", len(past))
+    col2.metric("中獎人數", len(winners))
+    if st.checkbox("只顯示中獎者", key="archived_winners_only"):
+        render_paged_table(past, key="archive_table", rows=winners, unit="位中獎者")
+    else:
+        render_paged_table(past, key="archive_table", unit="筆報名資料")
+    st.download_button(
+        "下載報名資料 (CSV)",
+        past.to_csv(index=False).encode("utf-8-sig"),
+        file_name=f"{key}.csv",
+        mime="text/csv",
+    )
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with rerun_profiler.rerun(current_view()):
+        main()
\ No newline at end of file
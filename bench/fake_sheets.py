@@ -0,0 +1,272 @@
+"""記憶體中的假 Google Sheets：實作應用程式用到的 gspread Worksheet 方法，可注入延遲與 429 錯誤。
+
+只在壓力測試 (bench/load_test.py) 中使用，不會連線到 Google，也不會消耗配額。
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import requests
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+from metrics import api_metrics
+from quota import MAX_RETRIES, backoff_delay, should_retry
+from sheets_client import InstrumentedWorksheet
+
+# 讀取方法以 GET 送出，其餘為寫入 (決定 5xx 是否重試，與 PooledHTTPClient 相同)
+READ_METHODS = {"get_all_values", "get", "batch_get", "col_values", "row_values", "cell", "fetch_sheet_metadata",
+                "get_lastUpdateTime"}
+
+
+def _quota_error():
+    response = requests.Response()
+    response.status_code = 429
+    response._content = json.dumps({"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}).encode()
+    return APIError(response)
+
+
+def _connection_error():
+    raise requests.ConnectionError("無法連線到 Google Sheets")
+
+
+class FaultInjector:
+    """每個 API 請求的模擬延遲與 429 機率，以及各方法的呼叫次數 (所有工作表共用)。
+
+    429 的處理與 sheets_client.PooledHTTPClient 相同：依 quota.backoff_delay 退避後重試，
+    超過 MAX_RETRIES 才把錯誤交給應用程式。
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = 0
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def call(self, method, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            with self._lock:
+                self.calls[method] += 1
+                delay = self.latency + self._random.uniform(0, self.jitter)
+                throttled = self._random.random() < self.error_rate
+            time.sleep(delay)
+            if not throttled:
+                return func(*args, **kwargs)
+            with self._lock:
+                self.throttled += 1
+            error = _quota_error()
+            http_method = "get" if method in READ_METHODS else "post"
+            if attempt >= MAX_RETRIES or not should_retry(http_method, 429):
+                raise error
+            api_metrics.record_retry(429)
+            time.sleep(backoff_delay(attempt, error.response))
+            attempt += 1
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.id = worksheet.title
+        self._worksheet = worksheet
+
+    def get_lastUpdateTime(self):
+        return self._worksheet.faults.call("get_lastUpdateTime", lambda: str(self._worksheet.modified))
+
+    def fetch_sheet_metadata(self, params=None):
+        return self._worksheet.faults.call("fetch_sheet_metadata", lambda: {"spreadsheetId": self.id})
+
+    def batch_update(self, body):
+        """只支援 SheetCache.compare_and_set 使用的單一儲存格 findReplace。"""
+        return self._worksheet.faults.call("find_replace", self._worksheet._write, self._worksheet.find_replace, body)
+
+
+class FakeWorksheet:
+    """以二維串列保存資料的工作表，所有值都以字串回傳 (與 get_all_values() 相同)。"""
+
+    def __init__(self, title, rows, faults):
+        self.title = title
+        self.id = 0
+        self.faults = faults
+        self._rows = [[str(value) for value in row] for row in rows]
+        # 每次寫入都會增加，作為 Drive 的 modifiedTime
+        self.modified = 0
+        self._lock = threading.Lock()
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def _set(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        cells += [''] * (col - len(cells))
+        cells[col - 1] = str(value)
+
+    def _range(self, a1):
+        """把 'A5:C' 或 'A1:D9' 轉成 (起始列, 起始欄, 結束列, 結束欄)。"""
+        start, _, end = a1.partition(":")
+        row1, col1 = a1_to_rowcol(start)
+        if not end:
+            return row1, col1, row1, col1
+        if re.fullmatch(r"[A-Z]+", end):
+            end += str(max(len(self._rows), 1))
+        row2, col2 = a1_to_rowcol(end)
+        return row1, col1, row2, col2
+
+    def _calls(self, method, func, *args, **kwargs):
+        if method not in READ_METHODS:
+            return self.faults.call(method, self._write, func, *args, **kwargs)
+        return self.faults.call(method, func, *args, **kwargs)
+
+    def _write(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.modified += 1
+
+    # --- 讀取 ---
+    def get_all_values(self, **kwargs):
+        return self._calls("get_all_values", lambda: [list(row) for row in self._rows])
+
+    def get(self, range_name=None, **kwargs):
+        def read():
+            row1, col1, row2, col2 = self._range(range_name)
+            return [row[col1 - 1:col2] for row in self._rows[row1 - 1:row2]]
+        return self._calls("get", read)
+
+    def batch_get(self, ranges, **kwargs):
+        def read():
+            result = []
+            for a1 in ranges:
+                row1, col1, row2, col2 = self._range(a1)
+                values = [row[col1 - 1:col2] for row in self._rows[row1 - 1:row2]]
+                # 與 API 相同，省略結尾的空白列
+                while values and not any(values[-1]):
+                    values.pop()
+                result.append(values)
+            return result
+        return self._calls("batch_get", read)
+
+    def col_values(self, col, **kwargs):
+        def read():
+            values = [row[col - 1] if len(row) >= col else '' for row in self._rows]
+            # 與 API 相同，省略結尾的空白儲存格
+            while values and values[-1] == '':
+                values.pop()
+            return values
+        return self._calls("col_values", read)
+
+    def row_values(self, row, **kwargs):
+        return self._calls("row_values", lambda: list(self._rows[row - 1]) if row <= len(self._rows) else [])
+
+    def cell(self, row, col, **kwargs):
+        def read():
+            cells = self._rows[row - 1] if row <= len(self._rows) else []
+            return SimpleNamespace(row=row, col=col, value=cells[col - 1] if col <= len(cells) else '')
+        return self._calls("cell", read)
+
+    # --- 寫入 ---
+    def update_cell(self, row, col, value):
+        def write():
+            with self._lock:
+                self._set(row, col, value)
+            return {"updatedRange": f"{self.title}!{rowcol_to_a1(row, col)}"}
+        return self._calls("update_cell", write)
+
+    def batch_update(self, data, **kwargs):
+        def write():
+            with self._lock:
+                for item in data:
+                    row1, col1, _, _ = self._range(item["range"])
+                    for i, values in enumerate(item["values"]):
+                        for j, value in enumerate(values):
+                            self._set(row1 + i, col1 + j, value)
+            return {"responses": [{"updatedRange": item["range"]} for item in data]}
+        return self._calls("batch_update", write)
+
+    def append_rows(self, rows, **kwargs):
+        def write():
+            with self._lock:
+                first = len(self._rows) + 1
+                self._rows.extend([str(value) for value in row] for row in rows)
+                last = len(self._rows)
+            width = max((len(row) for row in rows), default=1)
+            return {"updates": {"updatedRange": f"'{self.title}'!A{first}:{rowcol_to_a1(last, width)}"}}
+        return self._calls("append_rows", write)
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row], **kwargs)
+
+    def update(self, values, range_name="A1", **kwargs):
+        def write():
+            row1, col1, _, _ = self._range(range_name)
+            with self._lock:
+                for i, row in enumerate(values):
+                    for j, value in enumerate(row):
+                        self._set(row1 + i, col1 + j, value)
+        return self._calls("update", write)
+
+    def batch_clear(self, ranges):
+        def write():
+            with self._lock:
+                for a1 in ranges:
+                    row1, col1, row2, col2 = self._range(a1)
+                    for row in self._rows[row1 - 1:row2]:
+                        for col in range(col1, min(col2, len(row)) + 1):
+                            row[col - 1] = ''
+        return self._calls("batch_clear", write)
+
+    def delete_rows(self, start_index, end_index=None):
+        def write():
+            with self._lock:
+                del self._rows[start_index - 1:end_index or start_index]
+        return self._calls("delete_rows", write)
+
+    def find_replace(self, body):
+        changed = 0
+        with self._lock:
+            for request in body["requests"]:
+                spec = request["findReplace"]
+                grid = spec["range"]
+                row, col = grid["startRowIndex"] + 1, grid["startColumnIndex"] + 1
+                cells = self._rows[row - 1] if row <= len(self._rows) else []
+                if col <= len(cells) and cells[col - 1] == spec["find"]:
+                    cells[col - 1] = spec["replacement"]
+                    changed += 1
+        return {"replies": [{"findReplace": {"occurrencesChanged": changed} if changed else {}}]}
+
+
+class FakeConnection:
+    """取代 sheets_client.SheetsConnection：worksheet() 回傳以 InstrumentedWorksheet 包裝的假工作表，
+    讓應用程式的 API 統計與讀取合併照常運作。"""
+
+    def __init__(self, sheets, faults):
+        self.faults = faults
+        self.sheets = {name: FakeWorksheet(name, rows, faults) for name, rows in sheets.items()}
+        # 設為 True 時模擬 Google 無法連線：每次開啟工作表都算一次請求並拋出 ConnectionError
+        self.outage = False
+
+    def worksheet(self, name):
+        if self.outage:
+            return self.faults.call("fetch_sheet_metadata", _connection_error)
+        return InstrumentedWorksheet(self.sheets[name], name)
+
+
+def sample_sheets(members=1000, raffle=300, seed=0):
+    """產生測試用的會員與抽獎名單 (帳號 acc{i}、密碼 pw{i}，暱稱 member{i})。"""
+    rng = random.Random(seed)
+    member_rows = [['暱稱', '點數', '帳號', '密碼']]
+    member_rows += [[f'member{i}', rng.randrange(0, 5000), f'acc{i}', f'pw{i}'] for i in range(members)]
+    raffle_rows = [['姓名', '電子郵件', '是否中獎']]
+    raffle_rows += [[f'member{i}', f'member{i}@example.com', ''] for i in range(raffle)]
+    return {"members": member_rows, "raffle": raffle_rows}
@@ -0,0 +1,266 @@
+"""app.py 的離線壓力測試：以 Streamlit AppTest 模擬多個同時操作的 session，不會連線到 Google Sheets。
+
+每個會員 session 會登入、重新整理排行榜數次並報名抽獎；管理員 session 會登入並進行抽獎。
+結果包含每種動作的 rerun 耗時 (p50/p95/p99)、每個動作的 API 呼叫數與記憶體峰值。
+
+AppTest 每次執行都會替換全域的 Runtime 與 st.secrets，無法在多個執行緒同時執行，
+因此 N 個 session 以隨機順序交錯執行各自的下一個動作：所有 session 共用同一個程序的快取與連線，
+與正式環境中多位使用者連到同一個 Streamlit 程序相同；每個動作的 API 呼叫數也因此可以精確計算。
+
+用法 (在專案根目錄執行)：
+    python bench/load_test.py --sessions 20 --admins 2 --latency 0.15 --error-rate 0.02
+    python bench/load_test.py --json bench_result.json
+    python bench/load_test.py --baseline bench_result.json   # 比基準變慢或 API 呼叫變多時以狀態 1 結束
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sheet_cache  # noqa: E402
+import sheets_client  # noqa: E402
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from fake_sheets import FakeConnection, FaultInjector, sample_sheets  # noqa: E402
+
+APP = os.path.join(ROOT, "app.py")
+ADMIN_PASSWORD = "bench-admin"
+
+
+class Session:
+    """一個瀏覽器分頁：包裝 AppTest，記錄每個動作 (一次 rerun) 的耗時與 API 呼叫數。
+
+    下方的 journey 是 generator，每完成一個動作就 yield，讓排程器切換到其他 session。
+    """
+
+    def __init__(self, secrets, faults, timeout):
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        for key, value in secrets.items():
+            self.at.secrets[key] = value
+        self.faults = faults
+        # AppTest 不會保留分頁的選取狀態，每次 rerun 前重新設定
+        self.tabs = {}
+        self.timings = []
+        self.api_calls = []
+
+    def run(self, action):
+        for key, value in self.tabs.items():
+            self.at.session_state[key] = value
+        calls = self.faults.total_calls()
+        start = time.perf_counter()
+        self.at.run()
+        self.timings.append((action, time.perf_counter() - start))
+        self.api_calls.append((action, self.faults.total_calls() - calls))
+        if self.at.exception:
+            raise RuntimeError(f"{action}：{self.at.exception[0].message}")
+
+    def fill(self, widgets, values):
+        for widget in widgets:
+            if widget.label in values:
+                widget.input(values[widget.label])
+
+    def click(self, widgets, label):
+        next(widget for widget in widgets if widget.label == label).click()
+
+
+def member_journey(session, member, refreshes, tag):
+    session.tabs["main_tab"] = "會員點數排行榜"
+    yield session.run("open")
+    session.fill(session.at.sidebar.text_input, {"帳號": f"acc{member}", "密碼": f"pw{member}"})
+    session.click(session.at.sidebar.button, "登入會員")
+    yield session.run("login")
+    for _ in range(refreshes):
+        session.click(session.at.button, "重新整理排行榜")
+        yield session.run("leaderboard_refresh")
+    session.tabs["main_tab"] = "抽獎活動"
+    yield session.run("open_raffle")
+    session.fill(session.at.text_input, {"姓名": f"member{member}", "電子郵件": f"{tag}@example.com"})
+    session.click(session.at.button, "提交報名")
+    yield session.run("raffle_signup")
+
+
+def admin_journey(session, draws):
+    session.tabs["main_tab"] = "管理員頁面"
+    yield session.run("open_admin")
+    session.fill(session.at.text_input, {"輸入密碼": ADMIN_PASSWORD})
+    session.click(session.at.button, "登入")
+    yield session.run("admin_login")
+    session.tabs["admin_tab"] = "抽獎管理"
+    yield session.run("open_draw")
+    for _ in range(draws):
+        session.click(session.at.button, "開始抽獎！")
+        yield session.run("admin_draw")
+
+
+def percentiles(seconds):
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+    return round(float(p50), 1), round(float(p95), 1), round(float(p99), 1)
+
+
+def run_sessions(args, secrets, faults):
+    """交錯執行 args.sessions 個會員與 args.admins 個管理員 session，回傳 (所有 session, 錯誤列表)。"""
+    rng = random.Random(args.seed)
+    sessions = []
+    active = []
+    for i in range(args.sessions + args.admins):
+        session = Session(secrets, faults, args.timeout)
+        sessions.append(session)
+        if i < args.sessions:
+            active.append((session, member_journey(session, rng.randrange(args.members), args.refreshes, f"bench{i}")))
+        else:
+            active.append((session, admin_journey(session, args.draws)))
+
+    errors = []
+    while active:
+        entry = rng.choice(active)
+        try:
+            next(entry[1])
+        except StopIteration:
+            active.remove(entry)
+        except Exception as e:
+            errors.append(f"{entry[1].__name__}: {e}")
+            active.remove(entry)
+    return sessions, errors
+
+
+def summarize(sessions):
+    """依動作彙整 rerun 耗時與 API 呼叫數。"""
+    timings = defaultdict(list)
+    calls = defaultdict(list)
+    for session in sessions:
+        for action, seconds in session.timings:
+            timings[action].append(seconds)
+        for action, count in session.api_calls:
+            calls[action].append(count)
+
+    actions = {}
+    for action, seconds in timings.items():
+        p50, p95, p99 = percentiles(seconds)
+        actions[action] = {
+            "count": len(seconds),
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "api_calls_avg": round(sum(calls[action]) / len(calls[action]), 2),
+            "api_calls_max": max(calls[action]),
+        }
+    return actions
+
+
+def print_report(result):
+    print(f"\n{'動作':<20}{'次數':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'API 平均':>9}{'API 最多':>9}")
+    for action, row in result["actions"].items():
+        print(f"{action:<20}{row['count']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+              f"{row['api_calls_avg']:>9}{row['api_calls_max']:>9}")
+    print(f"\nsession 數：{result['sessions']}，rerun 次數：{result['reruns']}，總耗時：{result['wall_seconds']} 秒，"
+          f"錯誤：{len(result['errors'])}")
+    print(f"API 呼叫總數：{result['api_calls_total']} {result['api_calls_by_method']}")
+    print(f"模擬的 429：{result['throttled']} 次")
+    print(f"記憶體峰值 (RSS)：{result['peak_rss_mb']} MB", end="")
+    if result.get("tracemalloc_peak_mb") is not None:
+        print(f"，Python 配置峰值：{result['tracemalloc_peak_mb']} MB", end="")
+    print()
+    for error in result["errors"][:10]:
+        print(f"  錯誤：{error}")
+
+
+def compare(result, baseline, tolerance):
+    """回傳比基準差的項目：p95 或平均 API 呼叫數超過基準的 (1 + tolerance) 倍。"""
+    regressions = []
+    for action, base in baseline["actions"].items():
+        row = result["actions"].get(action)
+        if row is None:
+            continue
+        if row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{action} p95 {base['p95_ms']} → {row['p95_ms']} ms")
+        if row["api_calls_avg"] > base["api_calls_avg"] * (1 + tolerance):
+            regressions.append(f"{action} API 呼叫 {base['api_calls_avg']} → {row['api_calls_avg']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py 的離線壓力測試")
+    parser.add_argument("--sessions", type=int, default=10, help="會員 session 數")
+    parser.add_argument("--admins", type=int, default=1, help="進行抽獎的管理員 session 數")
+    parser.add_argument("--members", type=int, default=1000, help="會員資料筆數")
+    parser.add_argument("--raffle", type=int, default=300, help="抽獎名單筆數")
+    parser.add_argument("--refreshes", type=int, default=3, help="每個會員重新整理排行榜的次數")
+    parser.add_argument("--draws", type=int, default=2, help="每個管理員抽獎的次數")
+    parser.add_argument("--latency", type=float, default=0.1, help="每個 API 請求的延遲秒數")
+    parser.add_argument("--jitter", type=float, default=0.05, help="延遲額外的隨機秒數 (0 到此值)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="每個請求回傳 429 的機率")
+    parser.add_argument("--cache-ttl", type=float, default=30, help="工作表快取存活秒數")
+    parser.add_argument("--timeout", type=float, default=60, help="單次 rerun 的逾時秒數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="以 tracemalloc 記錄 Python 配置峰值 (會變慢)")
+    parser.add_argument("--json", help="把結果寫入 JSON 檔")
+    parser.add_argument("--baseline", help="與先前的 JSON 結果比較")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p95 與 API 呼叫數可接受的增加比例")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="guppy-bench-")
+    secrets = {
+        "admin_password": ADMIN_PASSWORD,
+        "gcp_service_account": {},
+        "cache_ttl_seconds": args.cache_ttl,
+        # 不寫本機快照、不使用離線佇列，只測量與 Google Sheets 之間的行為
+        "snapshot_dir": "",
+        "offline_write_queue": False,
+        "points_ledger_path": os.path.join(workdir, "points_ledger.sqlite3"),
+    }
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    faults = FaultInjector(args.latency, args.jitter, args.error_rate, args.seed)
+    connection = FakeConnection(sample_sheets(args.members, args.raffle, args.seed), faults)
+    sheets_client.get_connection = sheet_cache.get_connection = lambda: connection
+    st.cache_resource.clear()
+    start = time.perf_counter()
+    sessions, errors = run_sessions(args, secrets, faults)
+    wall_seconds = round(time.perf_counter() - start, 2)
+
+    result = {
+        "config": vars(args),
+        "sessions": len(sessions),
+        "reruns": sum(len(session.timings) for session in sessions),
+        "wall_seconds": wall_seconds,
+        "actions": summarize(sessions),
+        "api_calls_total": faults.total_calls(),
+        "api_calls_by_method": dict(faults.calls),
+        "throttled": faults.throttled,
+        # Linux 的 ru_maxrss 單位為 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "tracemalloc_peak_mb": round(tracemalloc.get_traced_memory()[1] / 2**20, 1) if args.trace_memory else None,
+        "errors": errors,
+    }
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"  變差：{regression}")
+        if regressions:
+            sys.exit(1)
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from schema import MAX_POINTS
+
+# 批次調整點數的處理結果
+STATUS_OK = "可更新"
+STATUS_APPLIED = "已更新"
+STATUS_BAD_FORMAT = "格式錯誤"
+STATUS_NOT_FOUND = "找不到會員"
+STATUS_NEGATIVE = "點數不能為負數"
+STATUS_INVALID_POINTS = "目前點數無法辨識"
+STATUS_OVERFLOW = "點數超過上限"
+
+# 第一行是這些標頭時略過
+HEADER_NAMES = {"暱稱", "nickname"}
+
+
+def decode_csv(data):
+    """上傳的 CSV 內容：先以 UTF-8 (可含 BOM) 解碼，失敗時改用繁體中文版 Excel 預設的 Big5 (cp950)。
+
+    兩種編碼都無法解碼時拋出 UnicodeDecodeError。
+    """
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp950")
+
+
+def parse_changes(text):
+    """把每行一筆「暱稱,增減」的文字 (或 CSV 檔內容) 轉成 DataFrame。
+
+    回傳的欄位為 行號、內容、暱稱、增減 (無法解析、不是整數或超出點數範圍的增減為 <NA>)。暱稱本身可以包含逗號，以最後一個逗號分隔。
+    """
+    lines = pd.Series(text.replace("，", ",").splitlines(), dtype="string")
+    lines.index = pd.RangeIndex(1, len(lines) + 1)
+    lines = lines[lines.str.strip() != ""]
+    # 沒有任何資料時 rpartition 不會產生欄位
+    parts = lines.str.rpartition(",").reindex(columns=[0, 1, 2]).astype("string")
+    changes = pd.DataFrame({
+        "行號": lines.index,
+        "內容": lines.str.strip().to_numpy(),
+        "暱稱": parts[0].str.strip().to_numpy(),
+        "增減": pd.to_numeric(parts[2].str.strip(), errors="coerce").astype("Float64").to_numpy(),
+    })
+    if len(changes) and changes["暱稱"].iloc[0] in HEADER_NAMES and pd.isna(changes["增減"].iloc[0]):
+        changes = changes.iloc[1:]
+    # 小數或超出點數範圍的增減不接受
+    deltas = changes["增減"]
+    valid = ((deltas % 1 == 0) & (deltas.abs() <= MAX_POINTS)).fillna(False)
+    changes["增減"] = deltas.where(valid).astype("Int64")
+    return changes.reset_index(drop=True)
+
+
+def plan(current, changes):
+    """計算每一列的結果與新點數。
+
+    current 為 暱稱、點數、key (寫入時使用的列號或 id) 三個欄位的 DataFrame，重複的暱稱以第一筆為準，
+    點數為 <NA> 表示工作表上的值無法辨識 (不能當成 0 計算後覆蓋)；changes 為 parse_changes() 的結果。
+    同一位會員出現多次時合併計算，新點數為負數或超過上限時該會員的所有列都不更新。
+    """
+    current = current.drop_duplicates("暱稱").set_index("暱稱")
+    report = changes.copy()
+    report["原點數"] = report["暱稱"].map(current["點數"]).astype("Int64")
+    report["key"] = report["暱稱"].map(current["key"])
+
+    bad_format = report["暱稱"].eq("") | report["增減"].isna()
+    not_found = ~bad_format & report["key"].isna()
+    invalid_points = ~bad_format & ~not_found & report["原點數"].isna()
+    valid = ~bad_format & ~not_found & ~invalid_points
+    totals = report["增減"].where(valid, 0).groupby(report["暱稱"]).transform("sum")
+    report["新點數"] = (report["原點數"] + totals).where(valid)
+    negative = valid & (report["新點數"] < 0).fillna(False)
+    overflow = valid & (report["新點數"] > MAX_POINTS).fillna(False)
+
+    report["結果"] = np.select(
+        [bad_format, not_found, invalid_points, negative, overflow],
+        [STATUS_BAD_FORMAT, STATUS_NOT_FOUND, STATUS_INVALID_POINTS, STATUS_NEGATIVE, STATUS_OVERFLOW],
+        default=STATUS_OK,
+    )
+    return report
+
+
+def updates(report):
+    """可寫入的 (key, 暱稱, 新點數) 列表，每位會員一筆。"""
+    ok = report[report["結果"] == STATUS_OK].drop_duplicates("暱稱")
+    return list(zip(ok["key"].astype("int64").tolist(), ok["暱稱"].tolist(), ok["新點數"].astype("int64").tolist()))
+
+
+def ledger_entries(report):
+    """寫入點數異動紀錄用的 (暱稱, 增減, 新點數) 列表，每位會員一筆 (增減為合併後的總和)。"""
+    ok = report[report["結果"] == STATUS_OK].drop_duplicates("暱稱")
+    deltas = (ok["新點數"] - ok["原點數"]).astype("int64")
+    return list(zip(ok["暱稱"].tolist(), deltas.tolist(), ok["新點數"].astype("int64").tolist()))
+
+
+def applied(report):
+    """把可更新的列標示為已更新。"""
+    report = report.copy()
+    report.loc[report["結果"] == STATUS_OK, "結果"] = STATUS_APPLIED
+    return report
@@ -0,0 +1,155 @@
+import html
+import math
+
+import pandas as pd
+import streamlit as st
+
+# 排行榜樣式 (與資料列一起以單一 payload 送到瀏覽器)
+LEADERBOARD_CSS = """
+<style>
+/* Custom CSS for a better-aligned and styled leaderboard */
+.leaderboard-header-row {
+    display: flex;
+    font-weight: bold;
+    font-size: 1.1em;
+    padding: 10px 15px;
+    background-color: #e6f3ff; /* 淺藍色背景 */
+    border-radius: 8px;
+    margin-bottom: 5px;
+    color: #1f78b4;
+}
+.leaderboard-item-row {
+    display: flex;
+    padding: 8px 15px;
+    margin-bottom: 5px;
+    border-radius: 8px;
+    align-items: center;
+    background-color: white;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.05);
+    transition: all 0.2s ease-in-out;
+    /* 設置每個元素的高度，避免在 Streamlit 中因內容不同而導致的不對齊 */
+    min-height: 40px;
+    color: #333333; /* 為所有行項目設定清晰的深灰色字體 */
+}
+.leaderboard-item-row:hover {
+    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    transform: translateY(-1px);
+}
+/* 使用固定百分比寬度確保對齊 */
+.leaderboard-rank { width: 15%; text-align: left; font-weight: bold; }
+.leaderboard-name { width: 60%; text-align: left; }
+.leaderboard-points { width: 25%; text-align: right; font-weight: bold; color: #0056b3; }
+/* 特殊前三名樣式 */
+.rank-1 { background-color: #fffde7; border-left: 5px solid #FFD700; }
+.rank-2 { background-color: #f7f7f7; border-left: 5px solid #C0C0C0; }
+.rank-3 { background-color: #fff0e6; border-left: 5px solid #CD7F32; }
+/* 目前登入會員自己的名次 */
+.leaderboard-me { outline: 2px solid #1f78b4; }
+.leaderboard-name, .leaderboard-points, .leaderboard-rank {
+    /* 確保文字不會換行，使用省略號 */
+    white-space: nowrap;
+    overflow: hidden;
+    text-overflow: ellipsis;
+    align-self: center; /* 垂直居中 */
+}
+</style>
+"""
+
+LEADERBOARD_HEADER = (
+    "<div class='leaderboard-header-row'>"
+    "<span class='leaderboard-rank'>排名</span>"
+    "<span class='leaderboard-name'>暱稱</span>"
+    "<span class='leaderboard-points'>點數</span>"
+    "</div>"
+)
+
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+MEDALS = {1: ("🥇 No.1", "rank-1"), 2: ("🥈 No.2", "rank-2"), 3: ("🥉 No.3", "rank-3")}
+
+
+def build_rows_html(page_df, start, highlight_nickname=None):
+    """把一頁的排行榜資料一次轉成 HTML (start 為此頁第一列的 0-based 名次)。"""
+    ranks = pd.Series(range(start + 1, start + 1 + len(page_df)), index=page_df.index)
+    icons = "No." + ranks.astype(str)
+    classes = pd.Series("", index=page_df.index)
+    for rank, (icon, row_class) in MEDALS.items():
+        icons = icons.mask(ranks == rank, icon)
+        classes = classes.mask(ranks == rank, row_class)
+
+    nicknames = page_df['暱稱'].astype(str)
+    if highlight_nickname is not None:
+        classes = classes.mask(nicknames == highlight_nickname, classes + " leaderboard-me")
+
+    rows = (
+        "<div class='leaderboard-item-row " + classes + "'>"
+        + "<span class='leaderboard-rank'>" + icons + "</span>"
+        + "<span class='leaderboard-name'>" + nicknames.map(html.escape) + "</span>"
+        + "<span class='leaderboard-points'>" + page_df['點數'].map('{:,}'.format) + "</span>"
+        + "</div>"
+    )
+    return "".join(rows)
+
+
+def render_leaderboard(ranking, highlight_nickname=None, key="leaderboard", revision=None):
+    """以分頁方式顯示完整排行榜 (ranking 為 RankIndex)，只建立並傳送目前頁面的資料。
+
+    有提供資料的版本標記 (revision) 時，同一版本、同一頁的 HTML 只建立一次，自動更新時直接沿用。
+    """
+    page_key = f"{key}_page"
+    total = len(ranking)
+
+    col_size, col_top, col_jump = st.columns([1, 1, 1])
+    with col_size:
+        page_size = st.selectbox("每頁顯示人數", PAGE_SIZE_OPTIONS, key=f"{key}_page_size")
+    with col_top:
+        top_n = st.number_input(
+            "只顯示前 N 名 (0 為全部)", min_value=0, max_value=total, value=0, step=10, key=f"{key}_top_n"
+        )
+    visible = min(top_n, total) if top_n else total
+    total_pages = max(1, math.ceil(visible / page_size))
+
+    with col_jump:
+        st.write("")
+        jump = st.button("跳到我的名次", key=f"{key}_jump", disabled=highlight_nickname is None)
+    if jump:
+        rank = ranking.rank_of(highlight_nickname)
+        if rank is not None and rank <= visible:
+            st.session_state[page_key] = (rank - 1) // page_size + 1
+        else:
+            st.info("您目前不在顯示範圍內的排行榜中。")
+
+    # 每頁人數或顯示範圍改變後，頁碼可能超出範圍
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+    page = st.number_input(f"頁碼 (共 {total_pages} 頁)", min_value=1, max_value=total_pages, step=1, key=page_key)
+
+    start = (page - 1) * page_size
+    end = min(start + page_size, visible)
+    html_key = f"{key}_html"
+    cache_key = (revision, start, end, highlight_nickname)
+    cached = st.session_state.get(html_key)
+    if revision is None or cached is None or cached[0] != cache_key:
+        page_df = ranking.frame(start, end)
+        cached = (cache_key, build_rows_html(page_df, start, highlight_nickname), len(page_df))
+        if revision is not None:
+            st.session_state[html_key] = cached
+    _, rows_html, shown = cached
+    st.markdown(LEADERBOARD_CSS + LEADERBOARD_HEADER + rows_html, unsafe_allow_html=True)
+    st.caption(f"第 {start + 1 if shown else 0}–{start + shown} 名，共 {visible} 位會員")
+
+
+def render_my_rank(ranking, nickname):
+    """顯示登入會員自己的名次、點數，以及與前一名的差距。"""
+    rank = ranking.rank_of(nickname)
+    if rank is None:
+        st.info("排行榜中找不到您的暱稱。")
+        return
+    _, points = ranking.at(rank)
+    cols = st.columns(3)
+    cols[0].metric("我的名次", f"第 {rank:,} 名", help=f"共 {len(ranking):,} 位會員")
+    cols[1].metric("我的點數", f"{points:,}")
+    if rank > 1:
+        ahead_nickname, ahead_points = ranking.at(rank - 1)
+        cols[2].metric("距離上一名", f"{ahead_points - points:,} 點", help=f"上一名：{ahead_nickname}")
+    else:
+        cols[2].metric("距離上一名", "已是第一名 🎉")
@@ -0,0 +1,64 @@
+class MemberIndex:
+    """會員索引：帳號 -> 列號、暱稱 -> 列號 (列號為 Google Sheet 中 1-based 的實際列數)。
+
+    由快照建立一次，之後新增或修改會員時由 SheetCache 增量更新，
+    讓登入與重複性檢查都是 O(1) 的字典查詢。
+    """
+
+    COLUMNS = ('暱稱', '帳號', '密碼')
+
+    def __init__(self, snapshot):
+        header = snapshot.header
+        self.missing_columns = [col for col in self.COLUMNS if col not in header]
+        self._cols = {col: header.index(col) for col in self.COLUMNS if col in header}
+        self._rows = {}
+        self.by_account = {}
+        self.by_nickname = {}
+        for row_number, row in enumerate(snapshot.rows, start=2):
+            self.add_row(row_number, row)
+
+    def _value(self, row, col):
+        index = self._cols.get(col)
+        if index is None or index >= len(row):
+            return None
+        return row[index]
+
+    def add_row(self, row_number, row):
+        """加入新的一列；重複的帳號或暱稱以最早出現的列為準。"""
+        self._rows[row_number] = row
+        account = self._value(row, '帳號')
+        nickname = self._value(row, '暱稱')
+        if account:
+            self.by_account.setdefault(account, row_number)
+        if nickname:
+            self.by_nickname.setdefault(nickname, row_number)
+
+    def update_row(self, row_number, row):
+        """某一列內容被修改後，更新相關的對應。"""
+        old = self._rows.get(row_number)
+        if old is not None:
+            for col, mapping in (('帳號', self.by_account), ('暱稱', self.by_nickname)):
+                key = self._value(old, col)
+                if mapping.get(key) == row_number:
+                    del mapping[key]
+        self.add_row(row_number, row)
+
+    def has_account(self, account):
+        return account in self.by_account
+
+    def has_nickname(self, nickname):
+        return nickname in self.by_nickname
+
+    def row_of_nickname(self, nickname):
+        """回傳暱稱所在的列號，找不到時回傳 None。"""
+        return self.by_nickname.get(nickname)
+
+    def authenticate(self, account, password):
+        """帳號密碼正確時回傳會員暱稱，否則回傳 None。"""
+        row_number = self.by_account.get(account)
+        if row_number is None:
+            return None
+        row = self._rows[row_number]
+        if self._value(row, '密碼') != password:
+            return None
+        return self._value(row, '暱稱')
@@ -0,0 +1,114 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+
+from schema import MEMBER_SCHEMA
+
+# 每次查詢最多回傳的會員數
+DEFAULT_SEARCH_LIMIT = 20
+
+
+class MemberSearchIndex:
+    """以暱稱或帳號搜尋會員的索引 (不分大小寫)，每次查詢只回傳一小頁結果。
+
+    前綴比對使用排序的 (小寫字串, 列號) 串列加二分搜尋，為 O(log n + K)；
+    子字串比對則把所有小寫字串以換行串接成一個字串，用 str.find 掃描，不必逐筆比對。
+    串接的字串在資料變動後第一次子字串查詢時才重建，新增或修改會員時由 SheetCache 增量更新。
+    """
+
+    SEPARATOR = "\n"
+
+    def __init__(self, snapshot=None):
+        self._entries = {}
+        self._terms = []
+        self._haystack = None
+        self._cols = None
+        if snapshot is None:
+            return
+        layout = MEMBER_SCHEMA.layout(snapshot.header)
+        if '暱稱' not in layout.positions:
+            return
+        self._cols = (layout.positions['暱稱'] - 1, layout.positions.get('帳號'))
+        entries = {}
+        for row_number, row in enumerate(snapshot.rows, start=2):
+            entry = self._parse(row)
+            if entry:
+                entries[row_number] = entry
+        self._entries = entries
+        # 一次排序，不逐筆插入
+        self._terms = sorted((term, key) for key, entry in entries.items() for term in self._terms_of(entry))
+
+    def _parse(self, row):
+        """從工作表的一列取出 (暱稱, 帳號)；沒有暱稱的列不列入搜尋。"""
+        if self._cols is None:
+            return None
+        nickname_index, account_col = self._cols
+        nickname = row[nickname_index] if nickname_index < len(row) else ''
+        if not nickname:
+            return None
+        account = row[account_col - 1] if account_col and account_col <= len(row) else ''
+        return nickname, account
+
+    @staticmethod
+    def _terms_of(entry):
+        return {value.lower() for value in entry if value}
+
+    def add(self, key, nickname, account=''):
+        entry = (nickname, account)
+        self._entries[key] = entry
+        for term in self._terms_of(entry):
+            insort(self._terms, (term, key))
+        self._haystack = None
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for term in self._terms_of(entry):
+            del self._terms[bisect_left(self._terms, (term, key))]
+        self._haystack = None
+
+    # 由 SheetCache 在寫入工作表後呼叫
+    def add_row(self, row_number, row):
+        entry = self._parse(row)
+        if entry:
+            self.add(row_number, *entry)
+
+    def update_row(self, row_number, row):
+        entry = self._parse(row)
+        if entry == self._entries.get(row_number):
+            # 只有點數改變時不需更新
+            return
+        self.remove(row_number)
+        if entry:
+            self.add(row_number, *entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _build_haystack(self):
+        terms = [term for term, _ in self._terms]
+        starts = [0] + list(accumulate(len(term) + 1 for term in terms))[:-1]
+        self._haystack = (self.SEPARATOR.join(terms), starts)
+        return self._haystack
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        """回傳暱稱或帳號包含 query 的會員暱稱 (最多 limit 個)，前綴相符的排在前面。"""
+        query = query.strip().lower()
+        if not query or self.SEPARATOR in query:
+            return []
+        keys = {}
+        i = bisect_left(self._terms, (query,))
+        while i < len(self._terms) and len(keys) < limit and self._terms[i][0].startswith(query):
+            keys.setdefault(self._terms[i][1])
+            i += 1
+
+        if len(keys) < limit:
+            haystack, starts = self._haystack or self._build_haystack()
+            pos = haystack.find(query)
+            while pos != -1 and len(keys) < limit:
+                i = bisect_right(starts, pos) - 1
+                keys.setdefault(self._terms[i][1])
+                # 同一個字串只算一次，從下一個字串繼續找
+                pos = haystack.find(query, starts[i + 1]) if i + 1 < len(starts) else -1
+        # 重複的暱稱只列出一次
+        return list(dict.fromkeys(self._entries[key][0] for key in keys))
@@ -0,0 +1,178 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Google Sheets API 預設配額：每位使用者每分鐘 60 次請求
+DEFAULT_QUOTA_PER_MINUTE = 60
+# 只保留最近活動的 session 統計，避免長時間執行後佔用過多記憶體
+MAX_SESSIONS = 500
+
+
+def _new_totals():
+    return {"calls": 0, "errors": 0, "seconds": 0.0, "bytes": 0}
+
+
+def _add(totals, seconds, nbytes, error):
+    totals["calls"] += 1
+    totals["errors"] += int(error)
+    totals["seconds"] += seconds
+    totals["bytes"] += nbytes
+
+
+def _code_path():
+    """找出觸發這次 API 呼叫的 app.py 程式位置；背景執行緒則回傳執行緒名稱。"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if os.path.basename(frame.f_code.co_filename) == "app.py":
+            return f"app.py:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return f"thread:{threading.current_thread().name}"
+
+
+class ApiMetrics:
+    """記錄每一次 Google Sheets API 呼叫的名稱、工作表、耗時與下載位元組數。
+
+    統計分成三個層級：整個程序 (含最近一分鐘的呼叫速率)、每個 session，以及每個 session 的本次 rerun。
+    """
+
+    def __init__(self, quota_per_minute=DEFAULT_QUOTA_PER_MINUTE):
+        self.quota_per_minute = quota_per_minute
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._recent = deque()
+        self.by_call = {}
+        self.by_path = {}
+        # 因 429 / 5xx / 網路錯誤而重試的次數
+        self.retries = {}
+        self._sessions = OrderedDict()
+
+    @contextmanager
+    def measure(self, call, worksheet):
+        """量測一次 API 呼叫；期間 HTTP client 回報的位元組數會累計到這次呼叫。"""
+        path = _code_path()
+        self._local.nbytes = 0
+        self._local.active = True
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._local.active = False
+            self.record(call, worksheet, time.perf_counter() - start, self._local.nbytes, error, path)
+
+    def add_http_bytes(self, nbytes):
+        """由 HTTP client 回報每個回應的大小；不在 measure() 範圍內的請求 (例如開啟試算表) 單獨記錄。"""
+        if getattr(self._local, "active", False):
+            self._local.nbytes += nbytes
+        else:
+            self.record("http_request", "-", 0.0, nbytes, False, _code_path())
+
+    def record(self, call, worksheet, seconds, nbytes, error=False, path=None):
+        ctx = get_script_run_ctx(suppress_warning=True)
+        session_id = ctx.session_id if ctx is not None else None
+        now = time.time()
+        with self._lock:
+            self._recent.append(now)
+            self._trim(now)
+            _add(self.by_call.setdefault(f"{call} {worksheet}", _new_totals()), seconds, nbytes, error)
+            _add(self.by_path.setdefault(path or "-", _new_totals()), seconds, nbytes, error)
+            if session_id is not None:
+                session = self._session(session_id)
+                _add(session["session"], seconds, nbytes, error)
+                _add(session["rerun"], seconds, nbytes, error)
+
+    def record_retry(self, status):
+        with self._lock:
+            self.retries[str(status)] = self.retries.get(str(status), 0) + 1
+
+    def _trim(self, now):
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"session": _new_totals(), "rerun": _new_totals()}
+            self._sessions[session_id] = session
+            if len(self._sessions) > MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def start_rerun(self):
+        """在每次 rerun 開始時呼叫，重設目前 session 的本次 rerun 統計。"""
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return
+        with self._lock:
+            self._session(ctx.session_id)["rerun"] = _new_totals()
+
+    def current_session(self):
+        """目前 session 的 (本次 rerun, 整個 session) 統計。"""
+        ctx = get_script_run_ctx(suppress_warning=True)
+        with self._lock:
+            session = self._sessions.get(ctx.session_id) if ctx is not None else None
+            if session is None:
+                return _new_totals(), _new_totals()
+            return dict(session["rerun"]), dict(session["session"])
+
+    def calls_per_minute(self):
+        with self._lock:
+            self._trim(time.time())
+            return len(self._recent)
+
+    def hottest(self, by="path", limit=10):
+        """依呼叫次數排序的前幾名程式位置 (by="path") 或 API 呼叫 (by="call")。"""
+        source = self.by_path if by == "path" else self.by_call
+        with self._lock:
+            items = sorted(source.items(), key=lambda item: item[1]["calls"], reverse=True)[:limit]
+            return [dict(totals, name=name) for name, totals in items]
+
+    def to_json(self):
+        with self._lock:
+            data = {
+                "calls_per_minute": len(self._recent),
+                "quota_per_minute": self.quota_per_minute,
+                "by_call": self.by_call,
+                "by_path": self.by_path,
+                "retries": self.retries,
+            }
+            return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition 格式的統計資料。"""
+        lines = [
+            "# TYPE sheets_api_calls_per_minute gauge",
+            f"sheets_api_calls_per_minute {self.calls_per_minute()}",
+            "# TYPE sheets_api_quota_per_minute gauge",
+            f"sheets_api_quota_per_minute {self.quota_per_minute}",
+        ]
+        with self._lock:
+            for metric, key, kind in (
+                ("sheets_api_calls_total", "calls", "counter"),
+                ("sheets_api_errors_total", "errors", "counter"),
+                ("sheets_api_seconds_total", "seconds", "counter"),
+                ("sheets_api_bytes_total", "bytes", "counter"),
+            ):
+                lines.append(f"# TYPE {metric} {kind}")
+                for name, totals in self.by_call.items():
+                    call, worksheet = name.split(" ", 1)
+                    lines.append(f'{metric}{{call="{call}",worksheet="{worksheet}"}} {totals[key]}')
+            lines.append("# TYPE sheets_api_retries_total counter")
+            for status, count in self.retries.items():
+                lines.append(f'sheets_api_retries_total{{status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# 整個程序共用的統計 (背景執行緒也會使用，因此不透過 st.cache_resource 建立)
+api_metrics = ApiMetrics()
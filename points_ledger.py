@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+DEFAULT_LEDGER_PATH = "points_ledger.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    nickname TEXT NOT NULL,
+    delta INTEGER NOT NULL,
+    points_after INTEGER NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS points_ledger_nickname ON points_ledger (nickname, id);
+"""
+
+# 紀錄的來源
+SOURCE_SINGLE = "單筆調整"
+SOURCE_BULK = "批次調整"
+
+
+class PointsLedger:
+    """只會新增、不會修改的點數異動紀錄 (暱稱、增減、異動後點數、來源)。
+
+    每一筆都記下異動後的點數，不必掃描工作表就能重算各會員的增減總和，
+    並找出目前點數與最後一筆紀錄不一致 (被手動修改或寫入遺失) 的會員。
+    """
+
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+        with self._lock:
+            self._db.executescript(SCHEMA)
+
+    def insert(self, entries, source):
+        """在呼叫端已開始的交易中新增紀錄 (entries 為 (暱稱, 增減, 異動後點數) 的列表)。"""
+        now = time.time()
+        self._db.executemany(
+            "INSERT INTO points_ledger (recorded_at, nickname, delta, points_after, source) VALUES (?, ?, ?, ?, ?)",
+            [(now, nickname, int(delta), int(points_after), source) for nickname, delta, points_after in entries],
+        )
+
+    def record(self, entries, source):
+        """在獨立的交易中新增紀錄。"""
+        if not entries:
+            return
+        with self._lock, self._db:
+            self.insert(entries, source)
+
+    def recent(self, limit=100):
+        """最近的紀錄 (新的在前)。"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT recorded_at, nickname, delta, points_after, source FROM points_ledger ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        df = pd.DataFrame(rows, columns=['時間', '暱稱', '增減', '異動後點數', '來源'])
+        df['時間'] = [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) for t in df['時間']]
+        return df
+
+    def totals(self):
+        """每位會員的增減總和、最後一筆紀錄的異動後點數與紀錄筆數。"""
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT l.nickname, t.total, l.points_after, t.entries
+                FROM (SELECT nickname, SUM(delta) AS total, COUNT(*) AS entries, MAX(id) AS last_id
+                      FROM points_ledger GROUP BY nickname) AS t
+                JOIN points_ledger AS l ON l.id = t.last_id
+                """
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['暱稱', '增減總和', '紀錄點數', '紀錄筆數'])
+
+    def mismatches(self, current):
+        """比對目前點數 (current 為含 暱稱、點數 欄位的 DataFrame) 與最後一筆紀錄，回傳不一致的會員。"""
+        current = current[['暱稱', '點數']].drop_duplicates('暱稱')
+        merged = self.totals().merge(current, on='暱稱', how='left')
+        return merged[merged['點數'].isna() | (merged['點數'] != merged['紀錄點數'])].reset_index(drop=True)
+
+
+@st.cache_resource(show_spinner=False)
+def get_points_ledger():
+    """建立 (或取得已建立的) 共用點數異動紀錄，路徑可用 secrets.toml 的 points_ledger_path 設定。"""
+    db = sqlite3.connect(st.secrets.get("points_ledger_path", DEFAULT_LEDGER_PATH), check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    return PointsLedger(db, threading.Lock())
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+# 所有 session 共用的預先讀取執行緒數 (secrets.toml 的 prefetch_workers)
+DEFAULT_PREFETCH_WORKERS = 4
+
+
+class Prefetch:
+    """本次 rerun 同時送出的讀取，總等待時間為最慢的一個而不是全部相加。
+
+    每個分頁以 result(名稱, 讀取函式) 取得結果：有預先送出時等待該結果 (例外會在此時拋出)，
+    否則直接執行讀取函式，因此沒有列入預先讀取的項目行為不變。
+    讀取函式在沒有 ScriptRunContext 的執行緒中執行，不可以呼叫 st.* 的畫面元件。
+    """
+
+    def __init__(self, pool, loaders):
+        self._futures = {name: pool.submit(loader) for name, loader in loaders.items()}
+
+    def result(self, name, loader):
+        future = self._futures.get(name)
+        if future is None:
+            return loader()
+        return future.result()
+
+
+@st.cache_resource(show_spinner=False)
+def get_prefetch_pool():
+    """建立 (或取得已建立的) 共用執行緒池，限制同時進行的預先讀取數量。"""
+    workers = st.secrets.get("prefetch_workers", DEFAULT_PREFETCH_WORKERS)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+
+def prefetch(loaders):
+    """把 {名稱: 讀取函式} 交給共用執行緒池同時執行。"""
+    return Prefetch(get_prefetch_pool(), loaders)
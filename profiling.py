@@ -0,0 +1,177 @@
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from metrics import MAX_SESSIONS
+
+# 每個頁面與階段保留最近幾次 rerun 的耗時，用來計算 p50 / p95
+WINDOW = 200
+# 保留最近幾次 cProfile 擷取結果
+MAX_CAPTURES = 20
+# 整次 rerun 的耗時以這個階段名稱記錄
+TOTAL = "總計"
+
+
+def session_id():
+    """目前 session 的 id；不在 Streamlit 中執行時回傳 None。"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def _percentile(ordered, q):
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class RerunProfiler:
+    """記錄每次 rerun 各階段的耗時，以及 (管理員開啟時) 指定 session 的取樣 cProfile 結果。
+
+    app.py 在每個階段開始時呼叫 phase(名稱)，上一個階段隨之結束，因此各階段加總即為整次 rerun；
+    沒有開啟擷取時，每個階段只多兩次 perf_counter() 與一次 dict 更新。
+    耗時依「頁面 / 階段」各保留最近 WINDOW 次，計算滾動的 p50 / p95。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (頁面, 階段) -> 最近的耗時 (秒)
+        self._samples = {}
+        # session id -> (頁面, 結束時間, [(階段, 秒)])：每個 session 最近一次 rerun 的明細
+        self._last = OrderedDict()
+        # 擷取 cProfile 的 session 與取樣比例，同一時間只會有一個
+        self._target = None
+        self.captures = deque(maxlen=MAX_CAPTURES)
+        # cProfile 同一時間只能有一個在執行
+        self._profile_lock = threading.Lock()
+
+    @contextmanager
+    def rerun(self, view):
+        """量測一次 rerun；巢狀呼叫 (例如整頁 rerun 中執行的 fragment) 時沿用外層的量測。"""
+        if getattr(self._local, "phases", None) is not None:
+            yield
+            return
+        current = session_id()
+        profiler = self._start_capture(current)
+        start = time.perf_counter()
+        self._local.phases = []
+        self._local.phase = (None, start)
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.phase(None, end)
+            phases, self._local.phases = self._local.phases, None
+            if profiler is not None:
+                self._finish_capture(profiler, current, view, end - start)
+            self._record(current, view, end - start, phases)
+
+    def phase(self, name, now=None):
+        """結束目前的階段並開始下一個階段 (不在 rerun() 範圍內時不做任何事)。"""
+        phases = getattr(self._local, "phases", None)
+        if phases is None:
+            return
+        now = time.perf_counter() if now is None else now
+        current, started = self._local.phase
+        if current is not None:
+            phases.append((current, now - started))
+        self._local.phase = (name, now)
+
+    def _record(self, session_id, view, total, phases):
+        # 同一個階段分成數段執行時 (例如中間等待讀取) 合併計算
+        merged = {TOTAL: total}
+        for name, seconds in phases:
+            merged[name] = merged.get(name, 0.0) + seconds
+        phases = list(merged.items())
+        with self._lock:
+            for name, seconds in phases:
+                samples = self._samples.get((view, name))
+                if samples is None:
+                    samples = self._samples[(view, name)] = deque(maxlen=WINDOW)
+                samples.append(seconds)
+            if session_id is not None:
+                self._last[session_id] = (view, time.time(), phases)
+                self._last.move_to_end(session_id)
+                if len(self._last) > MAX_SESSIONS:
+                    self._last.popitem(last=False)
+
+    def stats(self):
+        """每個頁面與階段的 [{view, phase, count, p50_ms, p95_ms, last_ms}]。"""
+        with self._lock:
+            items = [(key, list(samples)) for key, samples in self._samples.items()]
+        rows = []
+        for (view, name), samples in items:
+            ordered = sorted(samples)
+            rows.append({
+                "view": view,
+                "phase": name,
+                "count": len(samples),
+                "p50_ms": round(_percentile(ordered, 0.5) * 1000, 1),
+                "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+                "last_ms": round(samples[-1] * 1000, 1),
+            })
+        return rows
+
+    def last_rerun(self, session_id):
+        """某個 session 最近一次 rerun 的 (頁面, 結束時間, [(階段, 秒)])，沒有紀錄時回傳 None。"""
+        with self._lock:
+            return self._last.get(session_id)
+
+    def sessions(self):
+        """最近有 rerun 的 session，最新的在前：[(session id, 頁面, 結束時間)]。"""
+        with self._lock:
+            return [(session_id, view, ended_at) for session_id, (view, ended_at, _) in reversed(self._last.items())]
+
+    # --- cProfile 擷取 ---
+    @property
+    def target(self):
+        """(擷取的 session id, 取樣比例)，沒有開啟時為 None。"""
+        return self._target
+
+    def set_target(self, session_id, rate):
+        """開始以 rate (0 到 1) 的比例擷取 session_id 的 rerun；session_id 為 None 時停止。"""
+        self._target = None if session_id is None or rate <= 0 else (session_id, rate)
+
+    def _start_capture(self, session_id):
+        target = self._target
+        if target is None or target[0] != session_id or random.random() >= target[1]:
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 已有其他 profiler 在執行
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def _finish_capture(self, profiler, session_id, view, seconds):
+        try:
+            profiler.disable()
+        finally:
+            self._profile_lock.release()
+        stats = pstats.Stats(profiler)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(40)
+        self.captures.appendleft({
+            "session_id": session_id,
+            "view": view,
+            "captured_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "seconds": seconds,
+            "text": text.getvalue(),
+            # 與 cProfile.Profile.dump_stats() 相同的格式，可用 snakeviz 等工具開啟火焰圖
+            "prof": marshal.dumps(stats.stats),
+        })
+
+
+# 整個程序共用的 rerun 耗時統計 (與 metrics.api_metrics 相同，不透過 st.cache_resource 建立)
+rerun_profiler = RerunProfiler()
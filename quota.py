@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from collections import deque
+
+# 會重試的 HTTP 狀態碼：429 表示超過配額，5xx 為 Google 端的暫時性錯誤
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 32.0
+
+
+class TokenBucket:
+    """整個程序共用的請求配額：任何 60 秒內最多 rate_per_minute 次請求。
+
+    token bucket 讓請求平均分散，只允許累積 capacity 次的突發流量 (預設為配額的十分之一)；
+    滿的 bucket 加上這段時間補充的 token 仍可能超過配額，因此另外記錄最近 60 秒內每次請求的時間。
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self._lock = threading.Lock()
+        self.configure(rate_per_minute, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # 最近 WINDOW 秒內取得 token 的時間
+        self._recent = deque()
+
+    def configure(self, rate_per_minute, capacity=None):
+        self.limit = rate_per_minute
+        self.rate = rate_per_minute / self.WINDOW
+        self.capacity = capacity or max(1, rate_per_minute // 10)
+
+    def acquire(self):
+        """取得一個 token；沒有可用的 token 或已達 60 秒內的上限時等待，回傳等待的秒數。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                while self._recent and self._recent[0] <= now - self.WINDOW:
+                    self._recent.popleft()
+                if self._tokens >= 1 and len(self._recent) < self.limit:
+                    self._tokens -= 1
+                    self._recent.append(now)
+                    return waited
+                wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+                if len(self._recent) >= self.limit:
+                    wait = max(wait, self._recent[len(self._recent) - self.limit] + self.WINDOW - now)
+            # 至少等待 1 毫秒，避免浮點誤差造成空轉
+            wait = max(wait, 0.001)
+            time.sleep(wait)
+            waited += wait
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """合併同時進行的相同讀取：第一個呼叫者實際執行，其餘呼叫者等待並取得同一份結果。
+
+    共用的結果不應被修改。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+def should_retry(method, status):
+    """429 代表請求未被處理，任何方法都可以重試；5xx 只重試讀取，避免重複寫入。"""
+    if status == 429:
+        return True
+    return status in RETRY_STATUSES and method.lower() == "get"
+
+
+def backoff_delay(attempt, response=None):
+    """第 attempt 次重試前要等待的秒數 (full jitter 指數退避，並遵守 Retry-After)。"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
@@ -0,0 +1,84 @@
+import json
+import os
+import re
+import time
+
+import pandas as pd
+import streamlit as st
+
+from schema import RAFFLE_SCHEMA
+from sheet_cache import SheetSnapshot
+from snapshot_store import SnapshotStore
+
+DEFAULT_ARCHIVE_DIR = "raffle_archive"
+# 還沒有設定名稱的活動
+DEFAULT_CAMPAIGN_NAME = "抽獎活動"
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+# 目前進行中的活動名稱 (與封存檔放在同一個目錄)
+CURRENT_FILE = "current.json"
+
+
+class RaffleArchive:
+    """已結束的抽獎活動：每一期的報名資料存成一個本機 Arrow 檔 (與 SnapshotStore 相同的格式)，不再留在名單中。
+
+    檔名為「結束時間_活動名稱」，依檔名排序即為結束的先後順序。封存後的檔案不會再修改。
+    目前進行中的活動名稱也記錄在同一個目錄，同一台主機上的程序都會看到相同的名稱。
+    """
+
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR):
+        self._store = SnapshotStore(directory)
+        self._current_path = os.path.join(directory, CURRENT_FILE)
+
+    def current(self):
+        """目前進行中的活動名稱。"""
+        try:
+            with open(self._current_path, encoding="utf-8") as f:
+                return json.load(f)["name"]
+        except (OSError, ValueError, KeyError):
+            return DEFAULT_CAMPAIGN_NAME
+
+    def start(self, name):
+        """開始新的一期活動 (寫入暫存檔後再改名取代)。"""
+        with open(self._current_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"name": name}, f, ensure_ascii=False)
+        os.replace(self._current_path + ".tmp", self._current_path)
+
+    def save(self, campaign, values):
+        """封存一期活動的報名資料 (values 含標頭)，回傳封存的鍵值。"""
+        name = re.sub(r'[\\/:*?"<>|\s]+', "_", campaign or DEFAULT_CAMPAIGN_NAME)
+        key = f"{time.strftime(STAMP_FORMAT)}_{name}"
+        existing = set(self._store.names())
+        suffix = 2
+        while key in existing:
+            key = f"{time.strftime(STAMP_FORMAT)}_{name}-{suffix}"
+            suffix += 1
+        self._store.save(key, SheetSnapshot(values))
+        return key
+
+    def campaigns(self):
+        """已封存的活動，最新的在前：[(鍵值, 活動名稱, 結束時間)]。"""
+        result = []
+        for key in reversed(self._store.names()):
+            stamp, _, name = key.partition("_")
+            try:
+                closed_at = time.strftime("%Y-%m-%d %H:%M:%S", time.strptime(stamp, STAMP_FORMAT))
+            except ValueError:
+                closed_at = ""
+            result.append((key, name, closed_at))
+        return result
+
+    def frame(self, key):
+        """某一期活動的報名資料 (欄位型別依 schema.RAFFLE_SCHEMA)；找不到時回傳 None。"""
+        loaded = self._store.load(key)
+        if loaded is None:
+            return None
+        values, _ = loaded
+        if not values:
+            return pd.DataFrame()
+        return RAFFLE_SCHEMA.from_rows(values[0], values[1:])
+
+
+@st.cache_resource(show_spinner=False)
+def get_raffle_archive():
+    """建立 (或取得已建立的) 抽獎活動封存 (secrets.toml 的 raffle_archive_dir)。"""
+    return RaffleArchive(st.secrets.get("raffle_archive_dir", DEFAULT_ARCHIVE_DIR))
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import secrets
+import time
+
+import numpy as np
+
+# 每一輪抽出的候選數量至少是還需要的人數的幾倍 (重複抽到的人會被略過)
+OVERSAMPLE = 2
+
+
+class AliasTable:
+    """Vose alias method：建立 O(n)，之後每次加權抽樣都是 O(1)。
+
+    weights 必須都大於 0。
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        n = len(weights)
+        remaining = weights * (n / weights.sum())
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = np.flatnonzero(remaining < 1)
+        large = np.flatnonzero(remaining >= 1)
+        # 每一輪把所有機率不足 1 的項目一次分配給多出來的項目：依累積的不足量與多餘量對齊，
+        # 多餘量被分完 (變成不足 1) 的項目在下一輪再分配
+        while len(small) and len(large):
+            deficit = 1 - remaining[small]
+            starts = np.cumsum(deficit) - deficit
+            owner = np.searchsorted(np.cumsum(remaining[large] - 1), starts, side="right")
+            assigned = owner < len(large)
+            if not assigned.any():
+                break
+            done = small[assigned]
+            prob[done] = remaining[done]
+            alias[done] = large[owner[assigned]]
+            remaining[large] -= np.bincount(owner[assigned], weights=deficit[assigned], minlength=len(large))
+            small = np.concatenate([small[~assigned], large[remaining[large] < 1]])
+            large = large[remaining[large] >= 1]
+        # 剩下的項目 (浮點誤差造成) 機率視為 1
+        self.prob = prob
+        self.alias = alias
+
+    def sample(self, rng, size):
+        columns = rng.integers(len(self.prob), size=size)
+        return np.where(rng.random(size) < self.prob[columns], columns, self.alias[columns])
+
+
+def _weighted_sample(rng, weights, k):
+    """依權重抽出 k 個不重複的索引 (依序抽出、抽中後不放回)。"""
+    candidates = np.flatnonzero(weights > 0)
+    if len(candidates) < k:
+        raise ValueError("權重大於 0 的參與者不足")
+    chosen = []
+    while len(chosen) < k:
+        # 已抽中的人從表中移除後重建，同一輪中重複抽到的人直接略過
+        table = AliasTable(weights[candidates])
+        draws = candidates[table.sample(rng, OVERSAMPLE * (k - len(chosen)))]
+        _, first = np.unique(draws, return_index=True)
+        for index in draws[np.sort(first)][:k - len(chosen)].tolist():
+            chosen.append(index)
+        candidates = np.setdiff1d(candidates, chosen, assume_unique=True)
+    return np.array(chosen, dtype=np.int64)
+
+
+def pool_fingerprint(keys, weights=None):
+    """參與名單 (依順序) 與權重的雜湊值，用來確認重播時使用的是同一份名單。"""
+    digest = hashlib.sha256("\n".join(map(str, keys)).encode())
+    if weights is not None:
+        digest.update(np.asarray(weights, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def draw(keys, prizes, weights=None, seed=None):
+    """一次抽出所有獎項的得獎者。
+
+    keys 為參與者的識別值 (例如電子郵件)，prizes 為 [(獎項名稱, 名額), ...]，
+    weights 為每位參與者的權重 (None 表示每人機率相同)。
+    回傳可序列化的抽獎紀錄；以相同的名單、權重與 seed 重新呼叫會得到相同結果。
+    """
+    total = sum(count for _, count in prizes)
+    if total <= 0:
+        raise ValueError("得獎人數必須大於 0")
+    if total > len(keys):
+        raise ValueError("得獎人數超過參與者總數")
+    if seed is None:
+        seed = secrets.randbits(63)
+    rng = np.random.default_rng(seed)
+
+    if weights is None:
+        indices = rng.choice(len(keys), size=total, replace=False)
+    else:
+        weights = np.asarray(weights, dtype=float)
+        indices = _weighted_sample(rng, weights, total)
+
+    # 依抽出順序分配獎項：先抽出的人得到列在前面的獎項
+    winners = []
+    position = 0
+    for prize, count in prizes:
+        for index in indices[position:position + count].tolist():
+            winners.append({"prize": prize, "index": index, "key": keys[index]})
+        position += count
+
+    return {
+        "seed": seed,
+        "drawn_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "pool_size": len(keys),
+        "pool_fingerprint": pool_fingerprint(keys, weights),
+        "weighted": weights is not None,
+        "prizes": [[prize, count] for prize, count in prizes],
+        "winners": winners,
+    }
+
+
+def to_json(record):
+    return json.dumps(record, ensure_ascii=False, indent=2)
+
+
+def parse_prizes(text):
+    """解析每行一個「獎項名稱,名額」的設定文字，回傳 [(獎項名稱, 名額), ...]。"""
+    prizes = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        name, _, count = line.replace("，", ",").rpartition(",")
+        try:
+            count = int(count)
+        except ValueError:
+            raise ValueError(f"第 {line_number} 行的名額不是整數：{line}") from None
+        if not name.strip() or count <= 0:
+            raise ValueError(f"第 {line_number} 行格式錯誤：{line}")
+        prizes.append((name.strip(), count))
+    return prizes
@@ -0,0 +1,36 @@
+class RaffleIndex:
+    """抽獎名單索引：電子郵件 -> 列號 (列號為 Google Sheet 中 1-based 的實際列數)。
+
+    由快照建立一次，之後報名或註記中獎時由 SheetCache 增量更新。
+    """
+
+    def __init__(self, snapshot):
+        header = snapshot.header
+        self._email_col = header.index('電子郵件') if '電子郵件' in header else None
+        self._emails = {}
+        self.by_email = {}
+        for row_number, row in enumerate(snapshot.rows, start=2):
+            self.add_row(row_number, row)
+
+    def add_row(self, row_number, row):
+        """加入新的一列；重複的電子郵件以最早出現的列為準。"""
+        if self._email_col is None or self._email_col >= len(row):
+            return
+        email = row[self._email_col]
+        self._emails[row_number] = email
+        if email:
+            self.by_email.setdefault(email, row_number)
+
+    def update_row(self, row_number, row):
+        """某一列內容被修改後，更新電子郵件的對應。"""
+        old = self._emails.pop(row_number, None)
+        if old is not None and self.by_email.get(old) == row_number:
+            del self.by_email[old]
+        self.add_row(row_number, row)
+
+    def has_email(self, email):
+        return email in self.by_email
+
+    def row_of_email(self, email):
+        """回傳電子郵件所在的列號，找不到時回傳 None。"""
+        return self.by_email.get(email)
@@ -0,0 +1,130 @@
+from bisect import bisect_left, insort
+
+import numpy as np
+import pandas as pd
+
+from schema import MEMBER_SCHEMA, to_points, to_points_series
+
+
+class RankIndex:
+    """依點數由高到低排序的會員名次索引。
+
+    以 (-點數, 鍵值) 排序的串列搭配二分搜尋：查詢名次與前 K 名是 O(log n + K)，
+    單一會員的點數變動只需移除再插入一筆，不必重新排序整張表。
+    鍵值在 Google Sheet 中是列號、在 SQLite 中是 id，點數相同時依鍵值 (先加入者) 排前面。
+    """
+
+    def __init__(self, snapshot=None):
+        self._entries = {}
+        self._keys = []
+        self._by_nickname = {}
+        self._cols = None
+        if snapshot is None:
+            return
+        layout = MEMBER_SCHEMA.layout(snapshot.header)
+        if '暱稱' not in layout.positions:
+            return
+        self._cols = (layout.positions['暱稱'] - 1, layout.positions.get('點數'))
+        rows = snapshot.rows
+        nickname_index, points_col = self._cols
+        nicknames = [row[nickname_index] for row in rows]
+        if points_col:
+            points = to_points_series([row[points_col - 1] for row in rows]).tolist()
+        else:
+            points = [0] * len(rows)
+        # 沒有暱稱的列不列入排名
+        keep = [i for i, nickname in enumerate(nicknames) if nickname]
+        self.load([i + 2 for i in keep], [nicknames[i] for i in keep], [points[i] for i in keep])
+
+    def _parse(self, row):
+        """從工作表的一列取出 (暱稱, 點數)；沒有暱稱的列不列入排名。"""
+        if self._cols is None:
+            return None
+        nickname_index, points_col = self._cols
+        nickname = row[nickname_index] if nickname_index < len(row) else ''
+        if not nickname:
+            return None
+        points = to_points(row[points_col - 1]) if points_col and points_col <= len(row) else 0
+        return nickname, points
+
+    def load(self, keys, nicknames, points):
+        """一次加入多筆資料 (鍵值、暱稱、點數三個等長的串列)，最後只排序一次。"""
+        self._entries.update(zip(keys, zip(nicknames, points)))
+        # 反向建立字典，讓重複的暱稱以最早的一筆為準
+        first = dict(zip(reversed(nicknames), reversed(keys)))
+        if self._by_nickname:
+            for nickname, key in first.items():
+                self._by_nickname.setdefault(nickname, key)
+        else:
+            self._by_nickname = first
+        order = np.lexsort((np.asarray(keys), -np.asarray(points, dtype=np.int64))).tolist()
+        new_keys = [(-points[i], keys[i]) for i in order]
+        self._keys = sorted(self._keys + new_keys) if self._keys else new_keys
+
+    def add(self, key, nickname, points):
+        self._entries[key] = (nickname, points)
+        # 重複的暱稱以最早的一列為準 (改名時加入的列可能比既有的列更早)
+        if key < self._by_nickname.get(nickname, key + 1):
+            self._by_nickname[nickname] = key
+        insort(self._keys, (-points, key))
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        nickname, points = entry
+        del self._keys[bisect_left(self._keys, (-points, key))]
+        if self._by_nickname.get(nickname) == key:
+            del self._by_nickname[nickname]
+            # 同一暱稱若還有其他列，改以最早的一列為準
+            others = [other for other, (name, _) in self._entries.items() if name == nickname]
+            if others:
+                self._by_nickname[nickname] = min(others)
+
+    def update(self, key, nickname, points):
+        old = self._entries.get(key)
+        if old is None or old[0] != nickname:
+            self.remove(key)
+            self.add(key, nickname, points)
+        elif old[1] != points:
+            # 只有點數改變：移動這一筆在排序串列中的位置
+            del self._keys[bisect_left(self._keys, (-old[1], key))]
+            insort(self._keys, (-points, key))
+            self._entries[key] = (nickname, points)
+
+    # 由 SheetCache 在寫入工作表後呼叫
+    def add_row(self, row_number, row):
+        entry = self._parse(row)
+        if entry:
+            self.add(row_number, *entry)
+
+    def update_row(self, row_number, row):
+        entry = self._parse(row)
+        if entry:
+            self.update(row_number, *entry)
+        else:
+            self.remove(row_number)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def rank_of(self, nickname):
+        """回傳暱稱的名次 (1-based)，找不到時回傳 None。"""
+        key = self._by_nickname.get(nickname)
+        if key is None:
+            return None
+        return bisect_left(self._keys, (-self._entries[key][1], key)) + 1
+
+    def at(self, rank):
+        """第 rank 名 (1-based) 的 (暱稱, 點數)。"""
+        return self._entries[self._keys[rank - 1][1]]
+
+    def top(self, k):
+        return [self._entries[key] for _, key in self._keys[:k]]
+
+    def frame(self, start, stop):
+        """名次 start+1 到 stop 的 '暱稱'、'點數' DataFrame，只建立這一段的資料。"""
+        return pd.DataFrame(
+            [self._entries[key] for _, key in self._keys[start:stop]],
+            columns=['暱稱', '點數'],
+        )
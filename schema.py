@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+import pandas as pd
+from gspread.utils import numericise
+
+from storage import MissingColumnsError
+
+
+# 點數以 int32 儲存，超出範圍的值視為無法轉換
+MAX_POINTS = 2**31 - 1
+
+
+def parse_points(value):
+    """把儲存格內容轉成點數 ("1,200" 之類有千分位的格式也可以)，小數捨去；空白為 0。
+
+    無法轉換或超出範圍時回傳 None。寫入前必須以此確認，不能把這類值當成 0 計算後覆蓋。
+    """
+    if value == '':
+        return 0
+    value = numericise(value)
+    if not isinstance(value, (int, float)) or not math.isfinite(value) or abs(value) > MAX_POINTS:
+        return None
+    return int(value)
+
+
+def to_points(value):
+    """顯示用的點數：規則與 parse_points 相同，但無法轉換時視為 0。"""
+    points = parse_points(value)
+    return 0 if points is None else points
+
+
+def parse_points_series(values):
+    """一整欄儲存格的點數 (Int64 的 Series)，規則與 parse_points 相同 (無法轉換時為 <NA>)，以向量化的方式一次轉換。"""
+    text = pd.Series(values, dtype=object).astype(str)
+    # 與 numericise 相同：去掉千分位的逗號，含底線的值不視為數字
+    cleaned = text.str.replace(",", "", regex=False).where(~text.str.contains("_", regex=False))
+    # pandas 接受數字中間有空白 (例如 "1e 1")，這類值改由下方逐一轉換
+    points = pd.to_numeric(cleaned.where(~cleaned.str.strip().str.contains(r"\s", na=False)), errors='coerce')
+    # pandas 無法解析的格式 (例如全形數字) 逐一以 parse_points 轉換
+    fallback = points.isna() & cleaned.notna() & (text != "")
+    if fallback.any():
+        points[fallback] = text[fallback].map(parse_points).astype(float)
+    points = points.where(np.isfinite(points) & (points.abs() <= MAX_POINTS))
+    points[text == ""] = 0
+    return np.trunc(points).astype("Int64")
+
+
+def to_points_series(values):
+    """顯示用的一整欄點數 (int64 的 Series)：規則與 parse_points_series 相同，但無法轉換時視為 0。"""
+    return parse_points_series(values).fillna(0).astype("int64")
+
+
+class SheetLayout:
+    """某個標頭下各欄位的位置 (1-based)，由 SheetSchema.layout() 建立並快取。"""
+
+    def __init__(self, schema, header):
+        self.header = list(header)
+        self.positions = {}
+        for position, name in enumerate(self.header, start=1):
+            # 重複的欄位名稱以第一個為準
+            self.positions.setdefault(name, position)
+        self.missing = [name for name in schema.columns if name not in self.positions]
+
+    def col(self, name):
+        """回傳欄位的位置 (1-based)，找不到時拋出 MissingColumnsError。"""
+        try:
+            return self.positions[name]
+        except KeyError:
+            raise MissingColumnsError([name]) from None
+
+    def require(self, names):
+        missing = [name for name in names if name not in self.positions]
+        if missing:
+            raise MissingColumnsError(missing)
+
+    def build_row(self, data_map):
+        """依實際的標頭順序建立要新增的列，其餘欄位放入空字串作為佔位符。"""
+        return [data_map.get(name, '') for name in self.header]
+
+
+class SheetSchema:
+    """工作表的欄位與型別：解析標頭得到欄位位置，並把資料一次轉成型別精簡的 DataFrame。
+
+    型別為 "string" (帳號、暱稱等識別值)、"int32" (點數，無法轉換的值視為 0) 或 "category" (少數幾種值的狀態欄位)。
+    """
+
+    def __init__(self, columns):
+        self.columns = dict(columns)
+        self._layouts = {}
+
+    def layout(self, header):
+        """取得標頭對應的欄位位置；同一個標頭只解析一次。"""
+        key = tuple(header)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = SheetLayout(self, key)
+        return layout
+
+    def frame(self, snapshot):
+        """把工作表快照轉成 DataFrame (可作為 SheetCache.index 的 factory，快照更新後才重建)。"""
+        return self.from_rows(snapshot.header, snapshot.rows)
+
+    def from_rows(self, header, rows):
+        layout = self.layout(header)
+        width = len(layout.header)
+        df = pd.DataFrame([row[:width] for row in rows], columns=layout.header, dtype=object)
+        df = df.loc[:, ~df.columns.duplicated()]
+        for name, dtype in self.columns.items():
+            if name not in df.columns:
+                if dtype == "int32":
+                    # 缺少的數值欄位視為 0，其餘缺少的欄位不會出現在 DataFrame 中
+                    df[name] = pd.Series(0, index=df.index, dtype="int32")
+                continue
+            if dtype == "int32":
+                df[name] = to_points_series(df[name]).astype("int32")
+            else:
+                df[name] = df[name].fillna('').astype(dtype)
+        return df
+
+
+MEMBER_SCHEMA = SheetSchema({'暱稱': "string", '點數': "int32", '帳號': "string", '密碼': "string"})
+RAFFLE_SCHEMA = SheetSchema({'姓名': "string", '電子郵件': "string", '是否中獎': "category"})
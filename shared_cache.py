@@ -0,0 +1,181 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# 負責重新下載的程序多久沒有續約就改由其他程序接手 (secrets.toml 的 shared_cache_lease_seconds)
+DEFAULT_LEASE_SECONDS = 30
+
+# 資料表結構改變時遞增；舊版本的快取檔案會被清空重建 (內容都可以從 Google Sheets 重新下載)
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    name TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    -- 資料列數 (含標頭)；NULL 表示快照已失效，需重新從 Google Sheets 下載
+    length INTEGER,
+    synced_at REAL,
+    fetched_at REAL NOT NULL,
+    modified TEXT
+);
+CREATE TABLE IF NOT EXISTS sheet_rows (
+    name TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    -- 最後一次寫入這一列的版本號
+    revision INTEGER NOT NULL,
+    PRIMARY KEY (name, row)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SharedCache:
+    """同一台主機上所有 Streamlit 程序共用的工作表快照 (一個 SQLite 檔案)。
+
+    每個工作表一列：列數、版本號與最後確認為最新的時間 (time.time())；內容則每個資料列各存一筆，
+    並記錄最後寫入該列的版本號。應用程式自己的寫入只更新有變動的資料列，其他程序也只讀取
+    本機版本之後變動的列，不必每次都序列化、讀取整張工作表。
+    快照過期時，只有取得租約 (lease) 的程序會向 Google Sheets 重新下載並發布，其他程序直接讀取；
+    任何程序寫入工作表後都會發布新版本，其他程序下次讀取時發現版本改變就會改用新的快照。
+    以 PRAGMA data_version 判斷其他程序是否寫入過資料庫，沒有變動時不必查詢資料表。
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS sheets")
+                db.execute("DROP TABLE IF EXISTS sheet_rows")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    db.execute(statement)
+        self._data_version = None
+        # 名稱 -> (版本號, fetched_at)
+        self._states = {}
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def state(self, name):
+        """回傳 (版本號, fetched_at)，沒有資料時回傳 None。其他程序沒有寫入時不會查詢資料表。"""
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                rows = self._db.execute("SELECT name, revision, fetched_at FROM sheets").fetchall()
+                self._states = {row[0]: (row[1], row[2]) for row in rows}
+                self._data_version = data_version
+            return self._states.get(name)
+
+    def load(self, name, since=None):
+        """回傳 (版本號, 列數, {列號: 資料列}, synced_at, fetched_at, modified)；快照已失效時列數為 None。
+
+        指定 since (本機快照的版本號) 時只回傳在那之後寫入的資料列，否則回傳全部的列 (列號為 1-based)。
+        """
+        with self._lock:
+            # 在同一個讀取交易中查詢，列數與資料列才會是同一個版本
+            self._db.execute("BEGIN")
+            try:
+                row = self._db.execute(
+                    "SELECT revision, length, synced_at, fetched_at, modified FROM sheets WHERE name = ?", (name,)
+                ).fetchone()
+                rows = []
+                if row is not None and row[1] is not None:
+                    rows = self._db.execute(
+                        "SELECT row, data FROM sheet_rows WHERE name = ? AND row <= ? AND revision > ?",
+                        (name, row[1], -1 if since is None else since),
+                    ).fetchall()
+            finally:
+                self._db.execute("COMMIT")
+        if row is None:
+            return None
+        revision, length, synced_at, fetched_at, modified = row
+        return revision, length, {number: json.loads(data) for number, data in rows}, synced_at, fetched_at, modified
+
+    def publish(self, name, values, synced_at=None, fetched_at=None, modified=None, base=None, changed=None):
+        """發布新的快照 (values 為 None 表示失效)，回傳新的版本號。
+
+        指定 base 時，只有共用的版本號仍等於 base 才會發布 (否則回傳 None)，
+        避免蓋掉其他程序在這之間寫入的內容。指定 changed (有變動的列號) 時只寫入這些資料列，
+        其餘的列沿用共用快取中 base 版本的內容，因此必須同時指定 base。
+        """
+        if changed is not None and base is None:
+            raise ValueError("只寫入部分資料列時必須指定 base")
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._transaction() as db:
+            row = db.execute("SELECT revision FROM sheets WHERE name = ?", (name,)).fetchone()
+            current = row[0] if row else 0
+            if base is not None and base != current:
+                return None
+            revision = current + 1
+            if values is None or changed is None:
+                db.execute("DELETE FROM sheet_rows WHERE name = ?", (name,))
+                changed = range(1, len(values) + 1) if values is not None else ()
+            else:
+                db.execute("DELETE FROM sheet_rows WHERE name = ? AND row > ?", (name, len(values)))
+            db.executemany(
+                "INSERT OR REPLACE INTO sheet_rows (name, row, data, revision) VALUES (?, ?, ?, ?)",
+                ((name, number, json.dumps(values[number - 1], ensure_ascii=False), revision) for number in changed),
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO sheets (name, revision, length, synced_at, fetched_at, modified) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, revision, None if values is None else len(values), synced_at, fetched_at, modified),
+            )
+            self._states[name] = (revision, fetched_at)
+        return revision
+
+    def touch(self, name, revision, fetched_at, modified=None):
+        """內容沒有改變的重新下載：只更新確認時間，其他程序就不會再重新下載。"""
+        with self._transaction() as db:
+            cur = db.execute(
+                "UPDATE sheets SET fetched_at = ?, modified = COALESCE(?, modified) WHERE name = ? AND revision = ?",
+                (fetched_at, modified, name, revision),
+            )
+            if cur.rowcount:
+                self._states[name] = (revision, fetched_at)
+
+    def acquire(self, name):
+        """取得 (或續約) 重新下載工作表的租約，回傳是否由這個程序負責。"""
+        now = time.time()
+        with self._transaction() as db:
+            cur = db.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+                (name, self.owner, now + self.lease_seconds, now),
+            )
+            return cur.rowcount == 1
+
+    def release(self, name):
+        """放棄這個程序持有的租約，讓其他程序可以立刻重新下載。"""
+        with self._transaction() as db:
+            db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def leases(self):
+        """目前的租約：名稱 -> (擁有者, 到期時間)。"""
+        with self._lock:
+            rows = self._db.execute("SELECT name, owner, expires_at FROM leases").fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
@@ -0,0 +1,793 @@
+import logging
+import re
+import sys
+import threading
+import time
+import weakref
+
+import streamlit as st
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+from metrics import api_metrics
+from shared_cache import DEFAULT_LEASE_SECONDS, SharedCache
+from sheets_client import get_connection
+from snapshot_store import DEFAULT_SNAPSHOT_DIR, SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+# 快取資料的預設存活秒數，可在 secrets.toml 以 cache_ttl_seconds 覆寫
+DEFAULT_TTL = 30
+# 只會新增資料的工作表：過期時只下載新增的列 (secrets.toml 的 incremental_sheets)
+DEFAULT_INCREMENTAL_SHEETS = ["raffle"]
+# 增量同步的工作表每隔多少秒仍整張重新下載一次，以同步手動修改或刪除的資料
+DEFAULT_FULL_SYNC_INTERVAL = 300
+# 快照最多每隔多少秒存到本機一次 (secrets.toml 的 snapshot_persist_interval_seconds)
+DEFAULT_PERSIST_INTERVAL = 60
+# 快取過期時先查詢試算表在 Google Drive 上的最後修改時間，沒有變動就不重新下載 (secrets.toml 的 check_modified_time)
+DEFAULT_CHECK_MODIFIED = True
+# 其他程序持有重新下載的租約時，隔多少秒再確認一次共用快取
+LEASE_RETRY_SECONDS = 1
+# 沒有任何快照、而其他程序正在下載時，最多等待的秒數
+LEASE_WAIT_SECONDS = 5
+
+
+class SnapshotRows(list):
+    """快照的資料列。可以建立弱參照，用來追蹤每個版本何時不再被任何 session 使用。"""
+
+    __slots__ = ("__weakref__",)
+
+
+class SheetSnapshot:
+    """某一時間點的工作表內容，第一列為標頭。建立後不再修改，寫入時會產生新的快照。
+
+    fetched_at (time.monotonic()) 用來判斷快取是否過期；synced_at (time.time()) 是資料最後一次
+    與工作表同步的時間，從本機檔案讀取的快照會保留原本的同步時間，用來顯示資料有多舊。
+    """
+
+    def __init__(self, values, fetched_at=None, padded=False, synced_at=None):
+        if padded:
+            # 內容相同的快照共用同一份資料列
+            self.values = values if isinstance(values, SnapshotRows) else SnapshotRows(values)
+        else:
+            width = max((len(row) for row in values), default=0)
+            # 補齊每一列的長度，讓欄位索引在所有列都有效
+            self.values = SnapshotRows(list(row) + [''] * (width - len(row)) for row in values)
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+        self.synced_at = time.time() if synced_at is None else synced_at
+
+    @property
+    def header(self):
+        return self.values[0] if self.values else []
+
+    @property
+    def rows(self):
+        return self.values[1:]
+
+    def col_index(self, name):
+        """回傳欄位的位置 (1-based)，找不到時拋出 ValueError。"""
+        return self.header.index(name) + 1
+
+    def column(self, name):
+        """回傳某欄位的所有資料值 (不含標頭)。"""
+        index = self.col_index(name) - 1
+        return [row[index] for row in self.rows]
+
+    def with_rows(self, rows, fetched_at=None):
+        rows = [[str(value) for value in row] for row in rows]
+        width = len(self.header)
+        # 增量下載時 (有 fetched_at) 同步時間為現在，應用程式自己新增的列則沿用原本的同步時間
+        synced_at = None if fetched_at else self.synced_at
+        if any(len(row) > width for row in rows):
+            return SheetSnapshot(self.values + rows, fetched_at or self.fetched_at, synced_at=synced_at)
+        # 既有的列已補齊長度，只需處理新增的列
+        rows = [row + [''] * (width - len(row)) for row in rows]
+        return SheetSnapshot(self.values + rows, fetched_at or self.fetched_at, padded=True, synced_at=synced_at)
+
+    def with_cells(self, cells):
+        """回傳修改了多個儲存格 ((列, 欄, 值) 的列表，皆為 1-based) 的新快照。
+
+        沒有修改的資料列與舊快照共用同一個串列，只複製被修改的列。
+        """
+        values = list(self.values)
+        width = len(self.header)
+        for row, col, value in cells:
+            updated = list(values[row - 1])
+            updated += [''] * (col - len(updated))
+            updated[col - 1] = str(value)
+            values[row - 1] = updated
+            width = max(width, len(updated))
+        if width == len(self.header):
+            return SheetSnapshot(values, self.fetched_at, padded=True, synced_at=self.synced_at)
+        return SheetSnapshot(values, self.fetched_at, synced_at=self.synced_at)
+
+    def renewed(self, fetched_at=None, synced_at=None):
+        """內容相同 (共用同一份資料列)、但視為剛與工作表同步的新快照。"""
+        return SheetSnapshot(self.values, fetched_at, padded=True, synced_at=synced_at)
+
+
+class _LazyConnection:
+    """每次使用時才取得共用連線：Google 無法連線時程序仍可啟動，先以本機快照運作。"""
+
+    def worksheet(self, name):
+        return get_connection().worksheet(name)
+
+
+class SheetCache:
+    """整個程序共用的工作表快取：每個工作表一份快照，依 TTL 過期，應用程式自己寫入時同步更新。
+
+    設定 store (SnapshotStore) 時，下載的快照會定期存到本機；重新下載失敗時繼續使用舊的快照，
+    並把該工作表標示為離線 (offline)，直到下一次成功下載為止。
+
+    每個工作表有一個版本號 (revision)，只有內容真的改變時才會增加；重新下載到相同的內容時
+    沿用原本的索引，不會重新排序或重建。所有 session 共用同一個版本的快照與索引 (DataFrame 等)，
+    舊版本在最後一個使用中的 session 釋放參照後，由 Python 的參照計數回收。
+
+    設定 shared (SharedCache) 時，同一台主機上的多個程序共用快照與版本號：快照過期時只有取得租約的
+    程序會重新下載，寫入後發布的新版本會取代其他程序的快照。
+    """
+
+    def __init__(self, conn, ttl=DEFAULT_TTL, incremental=(), full_sync_interval=DEFAULT_FULL_SYNC_INTERVAL,
+                 store=None, persist_interval=DEFAULT_PERSIST_INTERVAL, check_modified=DEFAULT_CHECK_MODIFIED,
+                 shared=None):
+        self._conn = conn
+        self.shared = shared
+        self.ttl = ttl
+        self.incremental = set(incremental)
+        self.full_sync_interval = full_sync_interval
+        self._store = store
+        self.persist_interval = persist_interval
+        self._persisted_at = {}
+        # 無法連線的工作表：名稱 -> (開始離線的時間, 錯誤訊息)；離線期間每隔 ttl 秒才再試一次
+        self.offline = {}
+        self._retry_at = {}
+        self._snapshots = {}
+        self._revisions = {}
+        # 仍在記憶體中的快照版本：id(資料列) -> [工作表名稱, 版本號, 弱參照, 估計的位元組數]
+        self._versions = {}
+        # 整張下載時試算表的最後修改時間 (Drive 的 modifiedTime)；無法查詢時停用此檢查
+        self.check_modified = check_modified
+        self._modified = {}
+        # 每個工作表最近一次整張下載的時間
+        self._full_synced_at = {}
+        # 由快照衍生的索引：(工作表名稱, 索引類別) -> (建立時的快照, 索引物件)
+        self._indexes = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.deltas = {}
+
+    def _lock_for(self, name):
+        with self._guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _is_fresh(self, name, snapshot):
+        if snapshot is None:
+            return False
+        now = time.monotonic()
+        return now - snapshot.fetched_at < self.ttl or now < self._retry_at.get(name, 0)
+
+    def worksheet(self, name):
+        """取得底層的 Worksheet 物件。"""
+        return self._conn.worksheet(name)
+
+    def snapshot(self, name):
+        """取得工作表快照；快取過期時才重新下載 (增量同步的工作表只下載新增的列)。"""
+        if self._shared_changed(name):
+            with self._lock_for(name):
+                self._load_shared(name)
+        snapshot = self._snapshots.get(name)
+        if self._is_fresh(name, snapshot):
+            self.hits[name] = self.hits.get(name, 0) + 1
+            return snapshot
+
+        with self._lock_for(name):
+            # 等待鎖的期間可能已有其他 session (或其他程序) 完成下載
+            self._load_shared(name)
+            snapshot = self._snapshots.get(name)
+            if self._is_fresh(name, snapshot):
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return snapshot
+            if self.shared is not None and not self.shared.acquire(name):
+                # 由其他程序負責重新下載：有快照時先沿用，沒有時等待對方發布
+                snapshot = snapshot or self._wait_shared(name)
+                if snapshot is not None:
+                    self._retry_at[name] = time.monotonic() + LEASE_RETRY_SECONDS
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    return snapshot
+            try:
+                if self._can_fetch_delta(name, snapshot):
+                    return self._fetch_delta(name, snapshot)
+                modified = self._modified_time(name)
+                if self._unmodified(name, snapshot, modified):
+                    # 試算表沒有修改過，只更新快照的時間
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    return self._renew(name, snapshot)
+                return self._fetch_full(name, modified)
+            except Exception as e:
+                # 沒有任何快照可用時才把錯誤交給呼叫端
+                if snapshot is None:
+                    raise
+                self._mark_offline(name, e)
+                return snapshot
+
+    def _fetch_full(self, name, modified=None):
+        self.misses[name] = self.misses.get(name, 0) + 1
+        old = self._snapshots.get(name)
+        snapshot = SheetSnapshot(self._conn.worksheet(name).get_all_values())
+        self._full_synced_at[name] = snapshot.fetched_at
+        if modified is not None:
+            self._modified[name] = modified
+        if old is not None and old.values == snapshot.values:
+            # 內容沒有改變：版本號不變，沿用原本的資料列與索引，剛下載的資料直接丟棄
+            snapshot = old.renewed(snapshot.fetched_at, snapshot.synced_at)
+            self._keep(name, old, snapshot)
+        else:
+            self._set(name, snapshot, fetched=True)
+        self._synced(name, snapshot)
+        return snapshot
+
+    def _unmodified(self, name, snapshot, modified):
+        """試算表自上次整張下載後沒有修改過。Drive 的修改時間可能稍有延遲，
+        因此距離上次整張下載超過 full_sync_interval 時仍會重新下載。"""
+        if snapshot is None or modified is None or modified != self._modified.get(name):
+            return False
+        return time.monotonic() - self._full_synced_at.get(name, 0) < self.full_sync_interval
+
+    def _renew(self, name, snapshot):
+        new = snapshot.renewed()
+        self._keep(name, snapshot, new)
+        self._synced(name, new)
+        return new
+
+    def _keep(self, name, old, new):
+        """以內容相同、時間較新的快照取代舊的快照：版本號不變，索引直接沿用。"""
+        self._carry_indexes(name, old, new)
+        self._snapshots[name] = new
+        if self.shared is not None:
+            self.shared.touch(name, self._revisions.get(name, 0), _wall_time(new.fetched_at), self._modified.get(name))
+
+    def _modified_time(self, name):
+        """試算表在 Google Drive 上的最後修改時間 (只回傳一個欄位，比下載整張工作表便宜得多)。
+
+        沒有 Drive 權限等無法查詢的情況下回傳 None，之後不再查詢，每次都整張下載。
+        """
+        if not self.check_modified:
+            return None
+        try:
+            spreadsheet = self._conn.worksheet(name).spreadsheet
+            with api_metrics.measure("get_lastUpdateTime", name):
+                return spreadsheet.get_lastUpdateTime()
+        except APIError as e:
+            if e.response.status_code not in (401, 403, 404):
+                raise
+            logger.warning("無法查詢 %s 的最後修改時間，改為每次整張下載：%s", name, e)
+        except AttributeError:
+            pass
+        self.check_modified = False
+        return None
+
+    def _set(self, name, snapshot, fetched=False, changed=None):
+        """以內容不同的新快照取代舊的快照 (None 表示丟棄)，並增加版本號。
+
+        使用共用快取時同時發布給其他程序；changed 為與舊快照相比有變動的列號，指定時只發布這些資料列。
+        應用程式自己的寫入 (fetched=False) 只有在共用的版本沒有被其他程序改過時才發布；
+        否則兩邊的快照都少了對方的寫入，改為讓所有程序重新下載。
+        """
+        old = self._snapshots.get(name)
+        if snapshot is None:
+            self._snapshots.pop(name, None)
+        else:
+            self._snapshots[name] = snapshot
+        if self.shared is None:
+            self._revisions[name] = self._revisions.get(name, 0) + 1
+            self._track(name, snapshot)
+            return
+        if old is None or snapshot is None or len(old.header) != len(snapshot.header):
+            # 欄位數改變時每一列都補齊了長度，整張發布
+            changed = None
+        revision = None
+        if snapshot is not None:
+            publish = dict(
+                synced_at=snapshot.synced_at,
+                fetched_at=_wall_time(snapshot.fetched_at),
+                modified=self._modified.get(name),
+            )
+            if changed is not None or not fetched:
+                revision = self.shared.publish(name, snapshot.values, base=self._revisions.get(name, 0),
+                                               changed=changed, **publish)
+            if revision is None and fetched:
+                # 從工作表下載的資料為準，整張發布
+                revision = self.shared.publish(name, snapshot.values, **publish)
+        if revision is None:
+            self._snapshots.pop(name, None)
+            self._full_synced_at.pop(name, None)
+            revision = self.shared.publish(name, None)
+            # 快照失效後由第一個需要資料的程序重新下載，不必等這個程序的租約到期
+            self.shared.release(name)
+        self._revisions[name] = revision
+        self._track(name, self._snapshots.get(name))
+
+    def _track(self, name, snapshot):
+        """記錄新的快照版本；資料列被回收 (沒有任何快照或 session 使用) 時自動移除。"""
+        if snapshot is None or id(snapshot.values) in self._versions:
+            return
+        key = id(snapshot.values)
+        self._versions[key] = [name, self._revisions.get(name, 0), weakref.ref(snapshot.values), None]
+        weakref.finalize(snapshot.values, self._versions.pop, key, None)
+
+    def memory(self):
+        """各工作表快照與 DataFrame 的記憶體用量 (估計值，位元組)，以及仍被 session 使用的舊版本。"""
+        usage = {}
+        for entry in list(self._versions.values()):
+            name, revision, ref, size = entry
+            values = ref()
+            if values is None:
+                continue
+            if size is None:
+                # 同一版本的資料不會再改變，只計算一次
+                size = entry[3] = _rows_size(values)
+            row = usage.setdefault(name, {"revision": self._revisions.get(name, 0), "snapshot": 0, "frames": 0,
+                                          "old_versions": 0, "old_bytes": 0})
+            current = self._snapshots.get(name)
+            if current is not None and current.values is values:
+                row["snapshot"] = size
+            else:
+                row["old_versions"] += 1
+                row["old_bytes"] += size
+        for (name, _), (snapshot, index) in list(self._indexes.items()):
+            if name in usage and hasattr(index, "memory_usage"):
+                usage[name]["frames"] += int(index.memory_usage(deep=True).sum())
+        return usage
+
+    def _shared_changed(self, name):
+        """共用快取中的版本或確認時間比本機的快照新。"""
+        if self.shared is None:
+            return False
+        state = self.shared.state(name)
+        if state is None:
+            return False
+        revision, fetched_at = state
+        if revision != self._revisions.get(name):
+            return True
+        snapshot = self._snapshots.get(name)
+        # 時間換算有些微誤差，其他程序重新確認的間隔至少為 ttl，差距超過一秒才視為較新
+        return snapshot is not None and fetched_at > _wall_time(snapshot.fetched_at) + 1
+
+    def _wait_shared(self, name):
+        deadline = time.monotonic() + LEASE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            self._load_shared(name)
+            if name in self._snapshots:
+                return self._snapshots[name]
+        return None
+
+    def _load_shared(self, name):
+        """改用共用快取中較新的快照 (呼叫時需持有該工作表的鎖)。"""
+        if not self._shared_changed(name):
+            return
+        old = self._snapshots.get(name)
+        # 本機的快照與共用快取中的某個版本相同，只需讀取之後變動的資料列
+        since = self._revisions.get(name) if old is not None else None
+        loaded = self.shared.load(name, since)
+        if loaded is None:
+            return
+        revision, length, changes, synced_at, fetched_at, modified = loaded
+        fetched_at = _monotonic_time(fetched_at)
+        if modified is not None:
+            self._modified[name] = modified
+        if revision == self._revisions.get(name) and old is not None:
+            # 其他程序確認過內容沒有改變
+            new = old.renewed(fetched_at, synced_at)
+            self._carry_indexes(name, old, new)
+            self._snapshots[name] = new
+            return
+        values = None
+        if length is not None:
+            values = _apply_rows(old.values if since is not None else [], length, changes)
+        if values is None and length is not None:
+            # 缺少某些資料列 (例如本機的版本已被整張取代)，改為讀取全部的列
+            revision, length, changes, synced_at, fetched_at, modified = self.shared.load(name)
+            fetched_at = _monotonic_time(fetched_at)
+            if length is not None:
+                values = _apply_rows([], length, changes)
+        if values is None:
+            self._revisions[name] = revision
+            self._snapshots.pop(name, None)
+            self._full_synced_at.pop(name, None)
+            return
+        self._revisions[name] = revision
+        width = len(old.header) if old is not None else None
+        # 寬度相同時沒有變動的列直接沿用本機快照的串列
+        padded = width is not None and all(len(row) == width for row in values)
+        self._snapshots[name] = SheetSnapshot(values, fetched_at, padded=padded, synced_at=synced_at)
+        self._full_synced_at[name] = fetched_at
+        self._track(name, self._snapshots[name])
+
+    def revision(self, name):
+        """工作表的版本號：取得 (必要時重新下載) 快照後回傳，內容改變時才會增加。
+
+        可用來判斷畫面是否需要更新；快取未過期時不會發出任何 API 請求。
+        """
+        self.snapshot(name)
+        return self._revisions.get(name, 0)
+
+    def _synced(self, name, snapshot):
+        """成功從工作表下載後：解除離線狀態，並依 persist_interval 把快照存到本機。"""
+        self.offline.pop(name, None)
+        self._retry_at.pop(name, None)
+        if self._store is None or time.monotonic() - self._persisted_at.get(name, -self.persist_interval) < self.persist_interval:
+            return
+        try:
+            self._store.save(name, snapshot)
+            self._persisted_at[name] = time.monotonic()
+        except Exception:
+            logger.exception("無法把 %s 的快照存到本機", name)
+
+    def _mark_offline(self, name, error):
+        if name not in self.offline:
+            logger.warning("無法從 Google Sheets 下載 %s，改用 %s 的快照：%s", name,
+                           time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._snapshots[name].synced_at)), error)
+            self.offline[name] = (time.time(), str(error))
+        self._retry_at[name] = time.monotonic() + self.ttl
+
+    def is_offline(self, name=None):
+        """工作表 (未指定時為任一工作表) 目前是否無法連線、正在使用舊的快照。"""
+        return bool(self.offline) if name is None else name in self.offline
+
+    def synced_at(self, name):
+        """快照最後一次與工作表同步的時間 (time.time())，沒有快照時回傳 None。"""
+        snapshot = self._snapshots.get(name)
+        return None if snapshot is None else snapshot.synced_at
+
+    def check(self, name):
+        """確認工作表可以開啟；無法連線但已有快照時標示為離線，不拋出例外。
+
+        離線中的工作表不再確認 (每次連線都可能包含數十秒的退避重試)，由 snapshot() 每隔 ttl 秒重新下載時恢復。
+        """
+        if name in self.offline or time.monotonic() < self._retry_at.get(name, 0):
+            return
+        try:
+            self._conn.worksheet(name)
+        except Exception as e:
+            if self._snapshots.get(name) is None:
+                raise
+            self._mark_offline(name, e)
+
+    def load_persisted(self):
+        """載入本機儲存的快照 (視為剛下載的資料)，回傳載入的工作表名稱。"""
+        if self._store is None:
+            return []
+        loaded = []
+        for name in self._store.names():
+            persisted = self._store.load(name)
+            if persisted is None:
+                continue
+            # 共用快取中已有其他程序下載的資料時，不以較舊的本機檔案蓋掉
+            if self.shared is not None and self.shared.state(name) is not None:
+                continue
+            values, synced_at = persisted
+            self._set(name, SheetSnapshot(values, synced_at=synced_at), fetched=True)
+            loaded.append(name)
+        return loaded
+
+    def refresh_in_background(self, names):
+        """在背景執行緒重新下載工作表，讓畫面先以本機快照顯示。"""
+        def run():
+            for name in names:
+                with self._lock_for(name):
+                    try:
+                        self._fetch_full(name)
+                    except Exception as e:
+                        self._mark_offline(name, e)
+
+        threading.Thread(target=run, name="sheet-cache-refresh", daemon=True).start()
+
+    def _can_fetch_delta(self, name, snapshot):
+        if name not in self.incremental or snapshot is None or not snapshot.header:
+            return False
+        return time.monotonic() - self._full_synced_at.get(name, 0) < self.full_sync_interval
+
+    def _fetch_delta(self, name, snapshot):
+        """只下載快照最後一列之後的資料，加入快照並更新依附的索引。
+
+        範圍從快照的最後一列開始 (超出表格範圍的列號會被 API 拒絕)，順便用這一列確認
+        資料沒有被手動修改或刪除；對不上時改為整張重新下載。
+        """
+        fetched_at = time.monotonic()
+        last_row = len(snapshot.values)
+        width = len(snapshot.header)
+        last_col = re.sub(r"\d+$", "", rowcol_to_a1(1, width))
+        rows = list(self._conn.worksheet(name).get(f"A{last_row}:{last_col}"))
+        overlap = rows[0] if rows else []
+        if overlap + [''] * (width - len(overlap)) != snapshot.values[-1][:width]:
+            return self._fetch_full(name)
+        self.deltas[name] = self.deltas.get(name, 0) + 1
+        new = snapshot.with_rows(rows[1:], fetched_at)
+        if len(rows) > 1:
+            self._set(name, new, fetched=True, changed=range(last_row + 1, len(new.values) + 1))
+        else:
+            self._keep(name, snapshot, new)
+        self._synced(name, new)
+        changes = [(row_number, new.values[row_number - 1]) for row_number in range(last_row + 1, len(new.values) + 1)]
+        self._patch_indexes(name, snapshot, new, "add_row", changes)
+        return new
+
+    def index(self, name, factory):
+        """取得以目前快照建立的索引；快照重新下載後才會重建。"""
+        snapshot = self.snapshot(name)
+        entry = self._indexes.get((name, factory))
+        if entry is None or entry[0] is not snapshot:
+            entry = (snapshot, factory(snapshot))
+            self._indexes[(name, factory)] = entry
+        return entry[1]
+
+    def _patch_indexes(self, name, old, new, method, changes):
+        """把寫入同步到依附舊快照的索引；索引不支援增量更新時直接丟棄，下次再重建。"""
+        for key, (snapshot, index) in list(self._indexes.items()):
+            if key[0] != name or snapshot is not old:
+                continue
+            if hasattr(index, method):
+                for args in changes:
+                    getattr(index, method)(*args)
+                self._indexes[key] = (new, index)
+            else:
+                del self._indexes[key]
+
+    def _carry_indexes(self, name, old, new):
+        """內容相同的新快照：依附舊快照的索引直接沿用。"""
+        for key, (snapshot, index) in list(self._indexes.items()):
+            if key[0] == name and snapshot is old:
+                self._indexes[key] = (new, index)
+
+    def invalidate(self, name=None):
+        """丟棄快照，下一次讀取時重新下載。未指定名稱時清除全部。
+
+        離線中的工作表保留快照：丟棄後就沒有資料可以顯示，恢復連線時會自動重新下載。
+        """
+        for key in ([name] if name is not None else list(self._snapshots)):
+            if key in self.offline:
+                continue
+            self._set(key, None)
+            self._full_synced_at.pop(key, None)
+            self._modified.pop(key, None)
+
+    def append_row(self, name, row):
+        """新增一列到工作表，並把同一列加入快照，避免重新下載。"""
+        with self._lock_for(name):
+            response = self._conn.worksheet(name).append_row(row)
+            self._patch_appended(name, [row], response)
+            return response
+
+    def append_rows(self, name, rows):
+        """以單一請求新增多列到工作表，並同步加入快照。"""
+        if not rows:
+            return None
+        with self._lock_for(name):
+            response = self._conn.worksheet(name).append_rows(rows)
+            self._patch_appended(name, rows, response)
+            return response
+
+    def _patch_appended(self, name, rows, response):
+        # 以其他程序最新發布的快照為基礎，發布時才不會與共用的版本衝突
+        self._load_shared(name)
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            return
+        # 若其他程序也在同時新增資料，寫入的列號會與快照對不上，此時直接丟棄快照
+        first_row = _appended_row_number(response)
+        if first_row != len(snapshot.values) + 1:
+            self._set(name, None)
+            return
+        new = snapshot.with_rows(rows)
+        self._set(name, new, changed=range(first_row, len(new.values) + 1))
+        changes = [(row_number, new.values[row_number - 1]) for row_number in range(first_row, len(new.values) + 1)]
+        self._patch_indexes(name, snapshot, new, "add_row", changes)
+
+    def update_cell(self, name, row, col, value):
+        """更新工作表中的單一儲存格，並同步修改快照。"""
+        with self._lock_for(name):
+            response = self._conn.worksheet(name).update_cell(row, col, value)
+            self._patch_cells(name, [(row, col, value)])
+            return response
+
+    def update_cells(self, name, cells):
+        """以單一 batch_update 請求更新多個儲存格 ((列, 欄, 值) 的列表)，並同步修改快照。"""
+        if not cells:
+            return None
+        with self._lock_for(name):
+            data = [{"range": rowcol_to_a1(row, col), "values": [[value]]} for row, col, value in cells]
+            response = self._conn.worksheet(name).batch_update(data)
+            self._patch_cells(name, cells)
+            return response
+
+    def compare_and_set(self, name, row, col, expected, value):
+        """只有在儲存格目前的值等於 expected 時才寫入 value，回傳是否寫入成功。
+
+        以限定在單一儲存格的 findReplace 請求在伺服器端比對並取代，比對與寫入之間不會被其他程序插入。
+        失敗時重新讀取該儲存格並更新快照，呼叫端可依最新的值重試。expected 不可為空字串。
+        """
+        with self._lock_for(name):
+            worksheet = self._conn.worksheet(name)
+            body = {"requests": [{"findReplace": {
+                "find": str(expected),
+                "replacement": str(value),
+                "matchCase": True,
+                "matchEntireCell": True,
+                "range": {
+                    "sheetId": worksheet.id,
+                    "startRowIndex": row - 1,
+                    "endRowIndex": row,
+                    "startColumnIndex": col - 1,
+                    "endColumnIndex": col,
+                },
+            }}]}
+            with api_metrics.measure("find_replace", name):
+                response = worksheet.spreadsheet.batch_update(body)
+            replies = response.get("replies") or [{}]
+            if replies[0].get("findReplace", {}).get("occurrencesChanged", 0):
+                self._patch_cells(name, [(row, col, value)])
+                return True
+            current = worksheet.cell(row, col).value
+            self._patch_cells(name, [(row, col, '' if current is None else current)])
+            return False
+
+    def refresh_columns(self, name, cols):
+        """以單一 batch_get 請求重新讀取幾個欄位，回傳各欄的值 (含標頭，補齊為相同長度)。
+
+        cols[0] 為用來找出資料列的鍵值欄 (例如暱稱)。鍵值欄與快照相同時只更新快照中有變動的儲存格；
+        不同時 (工作表被排序，或有列被插入、刪除) 丟棄快照，下一次讀取時整張重新下載。
+        """
+        with self._lock_for(name):
+            ranges = []
+            for col in cols:
+                letter = rowcol_to_a1(1, col)[:-1]
+                ranges.append(f"{letter}1:{letter}")
+            columns = [[row[0] if row else '' for row in values] for values in self._conn.worksheet(name).batch_get(ranges)]
+            # 讀取結果會省略結尾的空白儲存格
+            length = max(len(column) for column in columns)
+            columns = [column + [''] * (length - len(column)) for column in columns]
+
+            self._load_shared(name)
+            snapshot = self._snapshots.get(name)
+            if snapshot is None:
+                return columns
+            padding = [''] * (len(snapshot.values) - length)
+            if length > len(snapshot.values) or [row[cols[0] - 1] for row in snapshot.values] != columns[0] + padding:
+                self._set(name, None)
+                return columns
+            cells = []
+            for col, column in zip(cols[1:], columns[1:]):
+                for row, value in enumerate(column + padding, start=1):
+                    if snapshot.values[row - 1][col - 1] != value:
+                        cells.append((row, col, value))
+            if cells:
+                self._patch_cells(name, cells)
+            return columns
+
+    def refresh_row(self, name, row):
+        """重新讀取工作表的一列並更新快照，回傳該列的值 (補齊為快照的寬度)。"""
+        with self._lock_for(name):
+            values = self._conn.worksheet(name).row_values(row)
+            self._load_shared(name)
+            snapshot = self._snapshots.get(name)
+            if snapshot is None or row > len(snapshot.values):
+                return values
+            cached = snapshot.values[row - 1]
+            values = values + [''] * (len(cached) - len(values))
+            cells = [(row, col, value) for col, value in enumerate(values[:len(cached)], start=1) if cached[col - 1] != value]
+            if cells:
+                self._patch_cells(name, cells)
+            return values
+
+    def delete_rows(self, name, start, end):
+        """刪除工作表的第 start 到 end 列 (1-based，含兩端)，並同步從快照移除。"""
+        with self._lock_for(name):
+            response = self._conn.worksheet(name).delete_rows(start, end)
+            self._load_shared(name)
+            snapshot = self._snapshots.get(name)
+            if snapshot is None or end > len(snapshot.values):
+                self._set(name, None)
+            else:
+                values = snapshot.values[:start - 1] + snapshot.values[end:]
+                self._set(name, SheetSnapshot(values, snapshot.fetched_at, padded=True, synced_at=snapshot.synced_at))
+            return response
+
+    def replace(self, name, values):
+        """以 values (含標頭) 覆寫整張工作表，多出來的舊資料列會被清除。"""
+        with self._lock_for(name):
+            worksheet = self._conn.worksheet(name)
+            old = self._snapshots.get(name)
+            worksheet.update(values, "A1")
+            if old is not None and len(old.values) > len(values):
+                width = max(len(old.header), max((len(row) for row in values), default=1))
+                worksheet.batch_clear([f"A{len(values) + 1}:{rowcol_to_a1(len(old.values), width)}"])
+            self._set(name, SheetSnapshot(values))
+            self._full_synced_at[name] = self._snapshots[name].fetched_at
+
+    def _patch_cells(self, name, cells):
+        self._load_shared(name)
+        snapshot = self._snapshots.get(name)
+        if snapshot is None or max(row for row, _, _ in cells) > len(snapshot.values):
+            self._set(name, None)
+            return
+        new = snapshot.with_cells(cells)
+        rows = sorted({row for row, _, _ in cells})
+        self._set(name, new, changed=rows)
+        self._patch_indexes(name, snapshot, new, "update_row", [(row, new.values[row - 1]) for row in rows])
+
+    def stats(self):
+        """各工作表的快取命中、增量下載與整張下載次數。"""
+        names = sorted(set(self.hits) | set(self.misses) | set(self.deltas))
+        return {
+            name: {"hits": self.hits.get(name, 0), "deltas": self.deltas.get(name, 0), "misses": self.misses.get(name, 0)}
+            for name in names
+        }
+
+
+def _rows_size(values):
+    """資料列 (含每個儲存格的字串) 所佔的位元組數。"""
+    size = sys.getsizeof(values)
+    for row in values:
+        size += sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+    return size
+
+
+def _apply_rows(values, length, changes):
+    """把共用快取中變動的資料列 ({列號: 資料列}) 套用到 values，缺少任何一列時回傳 None。"""
+    values = list(values[:length])
+    values += [None] * (length - len(values))
+    for number, row in changes.items():
+        values[number - 1] = row
+    return None if None in values else values
+
+
+def _wall_time(monotonic_time):
+    """把 time.monotonic() 的時間換算成 time.time()，讓不同程序可以比較。"""
+    return time.time() - (time.monotonic() - monotonic_time)
+
+
+def _monotonic_time(wall_time):
+    return time.monotonic() - (time.time() - wall_time)
+
+
+def _appended_row_number(response):
+    """從 append 的 API 回應 (例如 'Sheet1!A7:D9') 取出實際寫入的第一列列號。"""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    cell = re.sub(r"^.*!", "", updated_range).split(":")[0]
+    return a1_to_rowcol(cell)[0]
+
+
+@st.cache_resource(show_spinner=False)
+def get_sheet_cache():
+    """建立 (或取得已建立的) 共用工作表快取。"""
+    ttl = st.secrets.get("cache_ttl_seconds", DEFAULT_TTL)
+    incremental = st.secrets.get("incremental_sheets", DEFAULT_INCREMENTAL_SHEETS)
+    full_sync_interval = st.secrets.get("full_sync_interval_seconds", DEFAULT_FULL_SYNC_INTERVAL)
+    # 本機快照的資料夾 (secrets.toml 的 snapshot_dir)，設為空字串時不儲存
+    snapshot_dir = st.secrets.get("snapshot_dir", DEFAULT_SNAPSHOT_DIR)
+    # 同一台主機上多個程序共用的快取檔案 (secrets.toml 的 shared_cache_path)，未設定時每個程序各自快取
+    shared_cache_path = st.secrets.get("shared_cache_path", "")
+    cache = SheetCache(
+        _LazyConnection(),
+        ttl=ttl,
+        incremental=incremental,
+        full_sync_interval=full_sync_interval,
+        store=SnapshotStore(snapshot_dir) if snapshot_dir else None,
+        persist_interval=st.secrets.get("snapshot_persist_interval_seconds", DEFAULT_PERSIST_INTERVAL),
+        check_modified=st.secrets.get("check_modified_time", DEFAULT_CHECK_MODIFIED),
+        shared=SharedCache(
+            shared_cache_path,
+            lease_seconds=st.secrets.get("shared_cache_lease_seconds", DEFAULT_LEASE_SECONDS),
+        ) if shared_cache_path else None,
+    )
+    # 啟動時先用本機快照，畫面不必等 Google Sheets；同時在背景重新下載
+    loaded = cache.load_persisted()
+    if loaded:
+        cache.refresh_in_background(loaded)
+    return cache
@@ -0,0 +1,219 @@
+import functools
+import threading
+import time
+
+import gspread
+import requests
+import streamlit as st
+from google.auth.exceptions import RefreshError
+from gspread.http_client import HTTPClient
+from requests.adapters import HTTPAdapter
+
+from metrics import DEFAULT_QUOTA_PER_MINUTE, api_metrics
+from quota import MAX_RETRIES, SingleFlight, TokenBucket, backoff_delay, should_retry
+
+# 應用程式使用的試算表：邏輯名稱 -> Google Drive 上的檔案名稱
+SPREADSHEETS = {
+    "members": "拯救會員管理",
+    "raffle": "抽獎名單",
+}
+
+# 連線池大小 (同時進行中的 HTTP 連線數量上限)
+POOL_SIZE = 16
+# 兩次健康檢查之間至少間隔的秒數，避免每次 rerun 都多打一次 API
+HEALTH_CHECK_INTERVAL = 300
+# 開啟試算表失敗後隔多少秒才再試一次，期間直接拋出上一次的錯誤
+REOPEN_RETRY_SECONDS = 30
+
+# 只讀取資料的 Worksheet 方法，同時進行的相同呼叫會合併成一次請求
+READ_METHODS = {"get_all_values", "get_all_records", "get_values", "get", "batch_get", "row_values", "col_values"}
+
+# 整個程序共用的請求配額與讀取合併
+request_bucket = TokenBucket(DEFAULT_QUOTA_PER_MINUTE)
+read_flights = SingleFlight()
+
+
+class PooledHTTPClient(HTTPClient):
+    """使用 keep-alive 連線池的 gspread HTTP client。
+
+    每個請求先從共用的 token bucket 取得配額；遇到 429 或暫時性錯誤時以指數退避重試，
+    token 失效時自動重新驗證。
+    """
+
+    def __init__(self, auth, session=None):
+        super().__init__(auth, session)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, endpoint, *args, **kwargs):
+        attempt = 0
+        while True:
+            request_bucket.acquire()
+            try:
+                return self._authorized_request(method, endpoint, *args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                status = e.response.status_code
+                if attempt >= MAX_RETRIES or not should_retry(method, status):
+                    raise
+                delay = backoff_delay(attempt, e.response)
+            except (requests.ConnectionError, requests.Timeout):
+                # 網路錯誤時無法確定寫入是否已完成，只重試讀取
+                if attempt >= MAX_RETRIES or method.lower() != "get":
+                    raise
+                status = "network"
+                delay = backoff_delay(attempt)
+            api_metrics.record_retry(status)
+            attempt += 1
+            time.sleep(delay)
+
+    def _authorized_request(self, *args, **kwargs):
+        try:
+            return self._measured_request(*args, **kwargs)
+        except RefreshError:
+            # token 更新失敗 (例如時鐘偏移或暫時性錯誤)，重新登入後再試一次
+            self.login()
+            return self._measured_request(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            if e.response.status_code != 401:
+                raise
+            self.login()
+            return self._measured_request(*args, **kwargs)
+
+    def _measured_request(self, *args, **kwargs):
+        try:
+            response = super().request(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            api_metrics.add_http_bytes(len(e.response.content))
+            raise
+        api_metrics.add_http_bytes(len(response.content))
+        return response
+
+
+class InstrumentedWorksheet:
+    """包裝 gspread Worksheet，記錄每一次方法呼叫的耗時與資料量 (其餘屬性直接轉給原本的物件)。
+
+    同時進行的相同讀取 (例如多個 session 同時下載會員資料) 只會送出一次請求。
+    """
+
+    def __init__(self, worksheet, name):
+        self._worksheet = worksheet
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._worksheet, attr)
+        if attr.startswith("_") or not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def measured(*args, **kwargs):
+            with api_metrics.measure(attr, self._name):
+                return value(*args, **kwargs)
+
+        if attr not in READ_METHODS:
+            return measured
+
+        @functools.wraps(value)
+        def coalesced(*args, **kwargs):
+            key = (self._name, attr, repr(args), repr(sorted(kwargs.items())))
+            return read_flights.do(key, lambda: measured(*args, **kwargs))
+        return coalesced
+
+
+class SheetsConnection:
+    """整個程序共用的 Google Sheets 連線：只驗證一次，並快取已開啟的工作表。"""
+
+    def __init__(self, creds, spreadsheet_keys=None):
+        self._creds = dict(creds)
+        # 以 key 開啟試算表只需一次請求；未設定 key 時才退回以名稱搜尋 Drive
+        self._keys = dict(spreadsheet_keys or {})
+        # 只保護下列字典，不在持有時發出請求 (請求可能包含數十秒的退避重試)
+        self._lock = threading.Lock()
+        self._worksheets = {}
+        # 最近一次健康檢查或開啟 (包含失敗) 的時間
+        self._checked_at = {}
+        # 開啟失敗的工作表：名稱 -> 錯誤
+        self._errors = {}
+        # 每個工作表同一時間只有一個執行緒在開啟
+        self._opening = {}
+        self.client = self._authorize()
+
+    def _authorize(self):
+        return gspread.service_account_from_dict(self._creds, http_client=PooledHTTPClient)
+
+    def _open(self, name):
+        key = self._keys.get(name)
+        if key:
+            spreadsheet = self.client.open_by_key(key)
+        else:
+            spreadsheet = self.client.open(SPREADSHEETS[name])
+            # 記住解析出來的 key，之後重新連線時就不必再搜尋 Drive
+            self._keys[name] = spreadsheet.id
+        return InstrumentedWorksheet(spreadsheet.sheet1, name)
+
+    def worksheet(self, name):
+        """取得快取的 Worksheet 物件；必要時開啟試算表或進行健康檢查。
+
+        健康檢查期間其他 session 繼續使用原本的物件；開啟失敗後 REOPEN_RETRY_SECONDS 秒內
+        直接拋出上一次的錯誤，不會每次 rerun 都重新連線。
+        """
+        with self._lock:
+            worksheet = self._worksheets.get(name)
+            if worksheet is not None:
+                if time.monotonic() - self._checked_at[name] <= HEALTH_CHECK_INTERVAL:
+                    return worksheet
+                # 先記下檢查時間，檢查期間其他 session 不會重複檢查
+                self._checked_at[name] = time.monotonic()
+            opening = self._opening.setdefault(name, threading.Lock())
+        if worksheet is not None:
+            return self._check_health(name, worksheet)
+        with opening:
+            return self._reopen(name)
+
+    def _reopen(self, name):
+        """開啟試算表 (呼叫時需持有該工作表的 _opening 鎖)。"""
+        with self._lock:
+            worksheet = self._worksheets.get(name)
+            error = self._errors.get(name)
+            if worksheet is not None:
+                # 等待期間已由其他執行緒開啟
+                return worksheet
+            if error is not None and time.monotonic() - self._checked_at[name] < REOPEN_RETRY_SECONDS:
+                raise error
+        try:
+            worksheet = self._open(name)
+        except Exception as e:
+            with self._lock:
+                self._errors[name] = e
+                self._checked_at[name] = time.monotonic()
+            raise
+        with self._lock:
+            self._errors.pop(name, None)
+            self._worksheets[name] = worksheet
+            self._checked_at[name] = time.monotonic()
+        return worksheet
+
+    def _check_health(self, name, worksheet):
+        try:
+            with api_metrics.measure("fetch_sheet_metadata", name):
+                worksheet.spreadsheet.fetch_sheet_metadata(params={"fields": "spreadsheetId"})
+            return worksheet
+        except Exception:
+            # 連線或憑證已失效：重新驗證，並丟棄所有以舊連線開啟的工作表
+            client = self._authorize()
+            with self._lock:
+                self.client = client
+                self._worksheets.clear()
+                opening = self._opening.setdefault(name, threading.Lock())
+        with opening:
+            return self._reopen(name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_connection():
+    """建立 (或取得已建立的) 共用 Google Sheets 連線。"""
+    creds = st.secrets["gcp_service_account"]
+    spreadsheet_keys = st.secrets.get("spreadsheet_keys", {})
+    quota_per_minute = st.secrets.get("sheets_quota_per_minute", DEFAULT_QUOTA_PER_MINUTE)
+    api_metrics.quota_per_minute = quota_per_minute
+    request_bucket.configure(quota_per_minute)
+    return SheetsConnection(creds, spreadsheet_keys)
@@ -0,0 +1,292 @@
+import threading
+from contextlib import ExitStack
+
+import pandas as pd
+
+import bulk_points
+from member_index import MemberIndex
+from member_search import MemberSearchIndex
+from points_ledger import SOURCE_BULK, SOURCE_SINGLE, get_points_ledger
+from raffle_archive import get_raffle_archive
+from raffle_index import RaffleIndex
+from rank_index import RankIndex
+from schema import MAX_POINTS, MEMBER_SCHEMA, RAFFLE_SCHEMA, parse_points, parse_points_series
+from sheet_cache import get_sheet_cache
+from storage import ConcurrentUpdateError, InvalidPointsError, MemberRepository, RaffleRepository, ReadOnlyError, Storage
+from write_queue import get_write_queue
+
+# 點數被其他程序同時修改時，以最新的值重新計算並重試的次數
+CAS_RETRIES = 5
+
+
+class SheetsMemberRepository(MemberRepository):
+    """以 Google Sheet「拯救會員管理」為資料來源的會員資料。"""
+
+    sheet = "members"
+
+    def __init__(self, cache, write_queue=None, ledger=None):
+        self._cache = cache
+        self._queue = write_queue
+        self._ledger = ledger
+        # 每位會員一把鎖：同一程序內對同一會員的點數修改依序進行
+        self._guard = threading.Lock()
+        self._member_locks = {}
+
+    def _index(self):
+        return self._cache.index(self.sheet, MemberIndex)
+
+    def _lock_for(self, nickname):
+        with self._guard:
+            return self._member_locks.setdefault(nickname, threading.Lock())
+
+    def _record(self, entries, source):
+        if self._ledger is not None:
+            self._ledger.record(entries, source)
+
+    def _is_pending(self, field, value):
+        return self._queue is not None and self._queue.has_pending(self.sheet, field, value)
+
+    def _use_queue(self):
+        return self._queue is not None and (self._queue.write_behind or self._cache.is_offline(self.sheet))
+
+    @property
+    def read_only(self):
+        return self._cache.is_offline(self.sheet)
+
+    def _require_online(self):
+        # 點數的修改需要比對工作表上目前的值，離線時無法排入佇列
+        if self.read_only:
+            raise ReadOnlyError()
+
+    @property
+    def missing_columns(self):
+        return self._index().missing_columns
+
+    def check(self):
+        self._cache.check(self.sheet)
+
+    def frame(self):
+        return self._cache.index(self.sheet, MEMBER_SCHEMA.frame)
+
+    def ranking(self):
+        # 點數修改或新增會員時由 SheetCache 增量更新，不會重新排序
+        return self._cache.index(self.sheet, RankIndex)
+
+    def revision(self):
+        return self._cache.revision(self.sheet)
+
+    def search(self, query, limit=20):
+        return self._cache.index(self.sheet, MemberSearchIndex).search(query, limit)
+
+    def authenticate(self, account, password):
+        return self._index().authenticate(account, password)
+
+    def nickname_taken(self, nickname):
+        return self._index().has_nickname(nickname) or self._is_pending('暱稱', nickname)
+
+    def account_taken(self, account):
+        return self._index().has_account(account) or self._is_pending('帳號', account)
+
+    def add_member(self, nickname, points, account, password):
+        layout = MEMBER_SCHEMA.layout(self._cache.snapshot(self.sheet).header)
+        layout.require(MEMBER_SCHEMA.columns)
+        if self.nickname_taken(nickname) or self.account_taken(account):
+            return False
+
+        # 確保帳號和密碼始終作為字串儲存
+        row = layout.build_row({'暱稱': str(nickname), '點數': int(points), '帳號': str(account), '密碼': str(password)})
+        if self._use_queue():
+            return self._queue.enqueue(self.sheet, row, keys={'暱稱': nickname, '帳號': account})
+        self._cache.append_row(self.sheet, row)
+        return True
+
+    def update_points(self, nickname, delta):
+        self._require_online()
+        with self._lock_for(nickname):
+            new_points = self._compare_and_set_points(nickname, delta)
+        self._record([(nickname, delta, new_points)], SOURCE_SINGLE)
+        return new_points
+
+    def _compare_and_set_points(self, nickname, delta):
+        """依工作表上目前的點數計算新點數，只在值仍相同時寫入；被其他程序改過時以最新的值重算。"""
+        for _ in range(CAS_RETRIES):
+            snapshot = self._cache.snapshot(self.sheet)
+            layout = MEMBER_SCHEMA.layout(snapshot.header)
+            nickname_col, points_col = layout.col('暱稱'), layout.col('點數')
+            row_index = self._index().row_of_nickname(nickname)
+            if row_index is None:
+                raise KeyError(nickname)
+
+            # 索引最久可能是 TTL 之前的資料：寫入前重新讀取這一列，確認仍是同一位會員
+            row = self._cache.refresh_row(self.sheet, row_index)
+            if (row[nickname_col - 1] if nickname_col <= len(row) else '') != nickname:
+                # 工作表被排序，或有列被插入、刪除：整張重新下載後再找一次
+                self._cache.invalidate(self.sheet)
+                continue
+            current = row[points_col - 1] if points_col <= len(row) else ''
+            points = parse_points(current)
+            if points is None:
+                # 當成 0 計算會蓋掉工作表上原本的值
+                raise InvalidPointsError(f"「{nickname}」目前的點數「{current}」無法辨識，請先在工作表上修正")
+            new_points = points + delta
+            if new_points < 0:
+                raise ValueError("點數不能為負數")
+            if new_points > MAX_POINTS:
+                raise InvalidPointsError(f"點數不能超過 {MAX_POINTS:,}")
+            if delta == 0:
+                return new_points
+            if current == '':
+                # 空白儲存格無法比對，直接寫入
+                self._cache.update_cell(self.sheet, row_index, points_col, new_points)
+                return new_points
+            if self._cache.compare_and_set(self.sheet, row_index, points_col, current, new_points):
+                return new_points
+        raise ConcurrentUpdateError(f"「{nickname}」的點數一直被同時修改，請稍後再試")
+
+    def bulk_update_points(self, changes, dry_run=False):
+        if not dry_run:
+            self._require_online()
+        nicknames = sorted(set(changes['暱稱'].dropna()))
+        with ExitStack() as stack:
+            # 依暱稱排序取得每位會員的鎖，避免與其他批次互相等待
+            for nickname in nicknames:
+                stack.enter_context(self._lock_for(nickname))
+            snapshot = self._cache.snapshot(self.sheet)
+            layout = MEMBER_SCHEMA.layout(snapshot.header)
+            layout.require(['暱稱', '點數'])
+            points_col = layout.col('點數')
+            nickname_col = layout.col('暱稱')
+            if dry_run:
+                # 預覽以快照計算，不發出請求
+                nicknames = [row[nickname_col - 1] for row in snapshot.values]
+                points = [row[points_col - 1] for row in snapshot.values]
+            else:
+                # 寫入前重新讀取暱稱與點數兩欄，以工作表上目前的列號與點數計算 (列可能已被排序、插入或刪除)
+                nicknames, points = self._cache.refresh_columns(self.sheet, [nickname_col, points_col])
+            current = pd.DataFrame({
+                '暱稱': nicknames[1:],
+                # 無法辨識的點數為 <NA>，這些會員不會被更新
+                '點數': parse_points_series(points[1:]),
+                'key': range(2, len(nicknames) + 1),
+            })
+            report = bulk_points.plan(current, changes)
+            if not dry_run:
+                cells = [(row_index, points_col, points) for row_index, _, points in bulk_points.updates(report)]
+                self._cache.update_cells(self.sheet, cells)
+                self._record(bulk_points.ledger_entries(report), SOURCE_BULK)
+                report = bulk_points.applied(report)
+        return report.drop(columns='key')
+
+    def refresh(self):
+        self._cache.invalidate(self.sheet)
+
+
+class SheetsRaffleRepository(RaffleRepository):
+    """以 Google Sheet「抽獎名單」為資料來源的抽獎報名資料。"""
+
+    sheet = "raffle"
+
+    def __init__(self, cache, write_queue=None, archive=None):
+        self._cache = cache
+        self._queue = write_queue
+        self._archive = archive
+
+    def _use_queue(self):
+        return self._queue is not None and (self._queue.write_behind or self._cache.is_offline(self.sheet))
+
+    @property
+    def read_only(self):
+        return self._cache.is_offline(self.sheet)
+
+    def _require_online(self):
+        if self.read_only:
+            raise ReadOnlyError()
+
+    @property
+    def missing_columns(self):
+        missing = RAFFLE_SCHEMA.layout(self._cache.snapshot(self.sheet).header).missing
+        return [col for col in ('電子郵件', '是否中獎') if col in missing]
+
+    def check(self):
+        self._cache.check(self.sheet)
+
+    def frame(self):
+        return self._cache.index(self.sheet, RAFFLE_SCHEMA.frame)
+
+    def email_taken(self, email):
+        if self._cache.index(self.sheet, RaffleIndex).has_email(email):
+            return True
+        return self._queue is not None and self._queue.has_pending(self.sheet, '電子郵件', email)
+
+    def add_entry(self, name, email):
+        if self.email_taken(email):
+            return False
+        layout = RAFFLE_SCHEMA.layout(self._cache.snapshot(self.sheet).header)
+        row = layout.build_row({'姓名': name, '電子郵件': email, '是否中獎': ''})
+        if self._use_queue():
+            return self._queue.enqueue(self.sheet, row, keys={'電子郵件': email})
+        self._cache.append_row(self.sheet, row)
+        return True
+
+    def mark_winners(self, emails):
+        self._require_online()
+        layout = RAFFLE_SCHEMA.layout(self._cache.snapshot(self.sheet).header)
+        email_col, status_col = layout.col('電子郵件'), layout.col('是否中獎')
+
+        # 快取的索引可能已過時 (名單被排序或刪除過)：重新讀取電子郵件欄找出每位中獎者目前所在的列，
+        # 全部以單一批次請求寫入
+        current_emails, _ = self._cache.refresh_columns(self.sheet, [email_col, status_col])
+        rows = {}
+        for row_index, email in enumerate(current_emails[1:], start=2):
+            rows.setdefault(email, row_index)
+        cells = []
+        not_found = []
+        for email in emails:
+            row_index = rows.get(email)
+            if row_index is None:
+                not_found.append(email)
+            else:
+                cells.append((row_index, status_col, "是"))
+        self._cache.update_cells(self.sheet, cells)
+        return not_found
+
+    def campaign(self):
+        return self._archive.current()
+
+    def close_campaign(self, next_name=None):
+        self._require_online()
+        # 佇列中的報名屬於這一期，先寫入工作表再封存
+        if self._queue is not None:
+            self._queue.flush()
+        campaign = self.campaign()
+        # 以最新的資料封存
+        self._cache.invalidate(self.sheet)
+        values = self._cache.snapshot(self.sheet).values
+        self._archive.save(campaign, values)
+        # 只刪除已封存的列；封存期間才送出的報名會留在新的一期
+        if len(values) > 1:
+            self._cache.delete_rows(self.sheet, 2, len(values))
+        if next_name:
+            self._archive.start(next_name)
+        return campaign, max(len(values) - 1, 0)
+
+    def refresh(self):
+        self._cache.invalidate(self.sheet)
+
+
+def open_sheets_storage():
+    """以 Google Sheets 為資料來源 (預設)。"""
+    cache = get_sheet_cache()
+    # 延遲寫入模式 (secrets.toml 中 write_behind = true) 才會建立佇列
+    write_queue = get_write_queue()
+    ledger = get_points_ledger()
+    archive = get_raffle_archive()
+    return Storage(
+        "sheets",
+        SheetsMemberRepository(cache, write_queue, ledger),
+        SheetsRaffleRepository(cache, write_queue, archive),
+        cache=cache,
+        write_queue=write_queue,
+        ledger=ledger,
+        archive=archive,
+    )
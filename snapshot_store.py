@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = "sheet_snapshots"
+SUFFIX = ".arrow"
+
+
+class SnapshotStore:
+    """把工作表快照存成本機的 Arrow IPC 檔，程序重新啟動或 Google Sheets 無法連線時直接讀取。
+
+    每個儲存格以字串欄位儲存 (與 get_all_values() 相同)，標頭與同步時間放在檔案的 metadata；
+    讀取時以 memory map 開啟，不需先把整個檔案複製到記憶體。
+    """
+
+    def __init__(self, directory=DEFAULT_SNAPSHOT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def names(self):
+        return sorted(entry[:-len(SUFFIX)] for entry in os.listdir(self.directory) if entry.endswith(SUFFIX))
+
+    def save(self, name, snapshot):
+        """寫入暫存檔後再改名取代，讀取端不會讀到寫到一半的檔案。"""
+        width = len(snapshot.header)
+        rows = snapshot.rows
+        table = pa.table({str(i): pa.array([row[i] for row in rows], type=pa.string()) for i in range(width)})
+        table = table.replace_schema_metadata({
+            "header": json.dumps(snapshot.header, ensure_ascii=False),
+            "synced_at": repr(snapshot.synced_at),
+        })
+        path = self._path(name)
+        with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(path + ".tmp", path)
+
+    def load(self, name):
+        """回傳 (values, synced_at)；沒有檔案或檔案無法讀取時回傳 None。"""
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+                metadata = table.schema.metadata
+                header = json.loads(metadata[b"header"])
+                synced_at = float(metadata[b"synced_at"])
+                columns = [column.to_pylist() for column in table.columns]
+        except (OSError, pa.ArrowException, KeyError, TypeError, ValueError):
+            logger.exception("無法讀取本機快照 %s", path)
+            return None
+        if not header:
+            return [], synced_at
+        return [header] + [list(row) for row in zip(*columns)], synced_at
@@ -0,0 +1,322 @@
+import logging
+import sqlite3
+import threading
+
+import pandas as pd
+import streamlit as st
+
+import bulk_points
+from points_ledger import SOURCE_BULK, SOURCE_SINGLE, PointsLedger
+from raffle_archive import get_raffle_archive
+from rank_index import RankIndex
+from schema import MAX_POINTS, MEMBER_SCHEMA, RAFFLE_SCHEMA, parse_points
+from storage import MEMBER_COLUMNS, RAFFLE_COLUMNS, InvalidPointsError, MemberRepository, RaffleRepository, Storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = "app_data.sqlite3"
+DEFAULT_SYNC_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nickname TEXT NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    account TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS members_account ON members (account);
+CREATE UNIQUE INDEX IF NOT EXISTS members_nickname ON members (nickname);
+CREATE TABLE IF NOT EXISTS raffle_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    won TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX IF NOT EXISTS raffle_entries_email ON raffle_entries (email);
+"""
+
+
+class SqliteStore:
+    """本機 SQLite 資料庫，所有 session 共用同一個連線。"""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        # 每次寫入都會遞增，同步到 Google Sheets 時用來判斷是否有變更
+        self.version = 0
+        # 依資料庫版本快取的 DataFrame：名稱 -> (版本, DataFrame)，所有 session 共用同一份
+        self._frames = {}
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def write(self, sql, params=()):
+        """在交易中執行一個寫入指令，回傳受影響的列數。"""
+        with self.lock, self.db:
+            cur = self.db.execute(sql, params)
+            self.version += 1
+            return cur.rowcount
+
+    def frame(self, name, build):
+        """取得目前版本的共用 DataFrame，資料有寫入後才重新建立 (請勿直接修改)。"""
+        with self.lock:
+            entry = self._frames.get(name)
+            if entry is None or entry[0] != self.version:
+                entry = (self.version, build())
+                self._frames[name] = entry
+            return entry[1]
+
+    def is_empty(self):
+        return not self.query("SELECT 1 FROM members LIMIT 1") and not self.query("SELECT 1 FROM raffle_entries LIMIT 1")
+
+
+class SqliteMemberRepository(MemberRepository):
+    """以本機 SQLite 為資料來源的會員資料。"""
+
+    def __init__(self, store, ledger):
+        self._store = store
+        # 點數異動紀錄與會員資料在同一個資料庫，和點數的修改在同一個交易中寫入
+        self._ledger = ledger
+        # 名次索引與建立時的資料庫版本；只有點數變動時就地更新
+        self._ranking = None
+        self._ranking_version = None
+
+    def frame(self):
+        return self._store.frame("members", self._build_frame)
+
+    def _build_frame(self):
+        rows = self._store.query("SELECT nickname, points, account, password FROM members ORDER BY id")
+        return MEMBER_SCHEMA.from_rows(MEMBER_COLUMNS, rows)
+
+    def ranking(self):
+        with self._store.lock:
+            if self._ranking_version != self._store.version:
+                ranking = RankIndex()
+                rows = self._store.query("SELECT id, nickname, points FROM members WHERE nickname != ''")
+                ranking.load([row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
+                self._ranking = ranking
+                self._ranking_version = self._store.version
+            return self._ranking
+
+    def revision(self):
+        return self._store.version
+
+    def search(self, query, limit=20):
+        query = query.strip()
+        if not query:
+            return []
+        # LIKE 對英文字母不分大小寫；跳脫 query 中的萬用字元
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self._store.query(
+            """
+            SELECT nickname FROM members
+            WHERE nickname LIKE :contains ESCAPE '\\' OR account LIKE :contains ESCAPE '\\'
+            ORDER BY NOT (nickname LIKE :prefix ESCAPE '\\' OR account LIKE :prefix ESCAPE '\\'), lower(nickname)
+            LIMIT :limit
+            """,
+            {"contains": f"%{escaped}%", "prefix": f"{escaped}%", "limit": limit},
+        )
+        return [row[0] for row in rows]
+
+    def authenticate(self, account, password):
+        rows = self._store.query("SELECT nickname FROM members WHERE account = ? AND password = ?", (account, password))
+        return rows[0][0] if rows else None
+
+    def nickname_taken(self, nickname):
+        return bool(self._store.query("SELECT 1 FROM members WHERE nickname = ?", (nickname,)))
+
+    def account_taken(self, account):
+        return bool(self._store.query("SELECT 1 FROM members WHERE account = ?", (account,)))
+
+    def add_member(self, nickname, points, account, password):
+        try:
+            self._store.write(
+                "INSERT INTO members (nickname, points, account, password) VALUES (?, ?, ?, ?)",
+                (str(nickname), int(points), str(account), str(password)),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update_points(self, nickname, delta):
+        # 以單一 UPDATE 在資料庫內計算新點數，並行修改時不會覆蓋彼此的結果
+        with self._store.lock, self._store.db:
+            row = self._store.db.execute(
+                "UPDATE members SET points = points + ? WHERE nickname = ? AND points + ? BETWEEN 0 AND ? "
+                "RETURNING id, points",
+                (delta, nickname, delta, MAX_POINTS),
+            ).fetchone()
+            if row is None:
+                if not self.nickname_taken(nickname):
+                    raise KeyError(nickname)
+                if delta > 0:
+                    raise InvalidPointsError(f"點數不能超過 {MAX_POINTS:,}")
+                raise ValueError("點數不能為負數")
+            member_id, points = row
+            self._ledger.insert([(nickname, delta, points)], SOURCE_SINGLE)
+            up_to_date = self._ranking_version == self._store.version
+            self._store.version += 1
+            if up_to_date:
+                self._ranking.update(member_id, nickname, points)
+                self._ranking_version = self._store.version
+            return points
+
+    def bulk_update_points(self, changes, dry_run=False):
+        # 在同一個交易中讀取目前點數、計算並寫入，不會與其他寫入交錯
+        with self._store.lock, self._store.db:
+            rows = self._store.db.execute("SELECT nickname, points, id FROM members ORDER BY id").fetchall()
+            report = bulk_points.plan(pd.DataFrame(rows, columns=['暱稱', '點數', 'key']), changes)
+            if not dry_run:
+                self._store.db.executemany(
+                    "UPDATE members SET points = ? WHERE id = ?",
+                    [(points, member_id) for member_id, _, points in bulk_points.updates(report)],
+                )
+                self._ledger.insert(bulk_points.ledger_entries(report), SOURCE_BULK)
+                self._store.version += 1
+                report = bulk_points.applied(report)
+        return report.drop(columns='key')
+
+
+class SqliteRaffleRepository(RaffleRepository):
+    """以本機 SQLite 為資料來源的抽獎報名資料。"""
+
+    def __init__(self, store, archive=None):
+        self._store = store
+        self._archive = archive
+
+    def frame(self):
+        return self._store.frame("raffle", self._build_frame)
+
+    def _build_frame(self):
+        rows = self._store.query("SELECT name, email, won FROM raffle_entries ORDER BY id")
+        return RAFFLE_SCHEMA.from_rows(RAFFLE_COLUMNS, rows)
+
+    def email_taken(self, email):
+        return bool(self._store.query("SELECT 1 FROM raffle_entries WHERE email = ?", (email,)))
+
+    def add_entry(self, name, email):
+        try:
+            self._store.write("INSERT INTO raffle_entries (name, email) VALUES (?, ?)", (name, email))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def mark_winners(self, emails):
+        not_found = []
+        with self._store.lock, self._store.db:
+            for email in emails:
+                cur = self._store.db.execute("UPDATE raffle_entries SET won = '是' WHERE email = ?", (email,))
+                if cur.rowcount == 0:
+                    not_found.append(email)
+            self._store.version += 1
+        return not_found
+
+    def campaign(self):
+        return self._archive.current()
+
+    def close_campaign(self, next_name=None):
+        campaign = self.campaign()
+        with self._store.lock, self._store.db:
+            rows = self._store.db.execute("SELECT id, name, email, won FROM raffle_entries ORDER BY id").fetchall()
+            self._archive.save(campaign, [RAFFLE_COLUMNS] + [list(row[1:]) for row in rows])
+            if rows:
+                self._store.db.execute("DELETE FROM raffle_entries WHERE id <= ?", (rows[-1][0],))
+            self._store.version += 1
+        if next_name:
+            self._archive.start(next_name)
+        return campaign, len(rows)
+
+
+class SheetsSync:
+    """把 SQLite 的資料定期整份寫回 Google Sheets (Google Sheet 只作為鏡像，以 SQLite 為準)。"""
+
+    TABLES = {
+        "members": ("SELECT nickname, points, account, password FROM members ORDER BY id", MEMBER_COLUMNS),
+        "raffle": ("SELECT name, email, won FROM raffle_entries ORDER BY id", RAFFLE_COLUMNS),
+    }
+
+    def __init__(self, store, cache, interval=DEFAULT_SYNC_INTERVAL):
+        self._store = store
+        self._cache = cache
+        self.interval = interval
+        self._synced_version = None
+        self._stop = threading.Event()
+        self.last_error = None
+
+    def import_from_sheets(self):
+        """資料庫是空的時候，從 Google Sheets 匯入現有資料 (重複的帳號、暱稱或電子郵件以第一筆為準)。
+
+        有任何無法辨識的點數時不匯入：當成 0 匯入後，同步時會把 0 寫回工作表。
+        """
+        members = [(nickname, parse_points(points), account, password, points)
+                   for nickname, points, account, password in self._values("members", MEMBER_COLUMNS)]
+        invalid = [f"{nickname} ({raw})" for nickname, points, _, _, raw in members if points is None]
+        if invalid:
+            raise InvalidPointsError(f"以下會員的點數無法辨識，請先在工作表上修正：{'、'.join(invalid)}")
+        with self._store.lock, self._store.db:
+            for nickname, points, account, password, _ in members:
+                self._store.db.execute(
+                    "INSERT OR IGNORE INTO members (nickname, points, account, password) VALUES (?, ?, ?, ?)",
+                    (nickname, points, account, password),
+                )
+            for row in self._values("raffle", RAFFLE_COLUMNS):
+                self._store.db.execute(
+                    "INSERT OR IGNORE INTO raffle_entries (name, email, won) VALUES (?, ?, ?)", row
+                )
+        self._synced_version = self._store.version
+
+    def _values(self, sheet, columns):
+        """工作表中各欄位的原始字串 (不會把 '007' 這類帳號或密碼轉成數字)，缺少的欄位為空字串。"""
+        snapshot = self._cache.snapshot(sheet)
+        positions = [snapshot.header.index(col) if col in snapshot.header else None for col in columns]
+        for row in snapshot.rows:
+            yield [row[i] if i is not None and i < len(row) else '' for i in positions]
+
+    def push(self):
+        """有變更時把資料表依 Google Sheet 的標頭順序整份寫回。"""
+        version = self._store.version
+        if version == self._synced_version:
+            return False
+        for sheet, (sql, columns) in self.TABLES.items():
+            header = self._cache.snapshot(sheet).header or columns
+            positions = [columns.index(col) if col in columns else None for col in header]
+            rows = [[row[i] if i is not None else '' for i in positions] for row in self._store.query(sql)]
+            self._cache.replace(sheet, [header] + rows)
+        self._synced_version = version
+        return True
+
+    def start(self):
+        threading.Thread(target=self._run, name="sqlite-sheets-sync", daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.push()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("同步 SQLite 資料到 Google Sheets 失敗")
+
+
+def open_sqlite_storage():
+    """以本機 SQLite 為資料來源；sqlite_sync_interval_seconds 為 0 時完全離線運作。"""
+    store = SqliteStore(st.secrets.get("sqlite_path", DEFAULT_SQLITE_PATH))
+    ledger = PointsLedger(store.db, store.lock)
+    members = SqliteMemberRepository(store, ledger)
+    archive = get_raffle_archive()
+    raffle = SqliteRaffleRepository(store, archive)
+    interval = st.secrets.get("sqlite_sync_interval_seconds", DEFAULT_SYNC_INTERVAL)
+    if not interval:
+        return Storage("sqlite", members, raffle, ledger=ledger, archive=archive)
+
+    from sheet_cache import get_sheet_cache
+    cache = get_sheet_cache()
+    sync = SheetsSync(store, cache, interval)
+    if store.is_empty():
+        sync.import_from_sheets()
+    sync.start()
+    return Storage("sqlite", members, raffle, cache=cache, sync=sync, ledger=ledger, archive=archive)
@@ -0,0 +1,154 @@
+import streamlit as st
+
+# 各資料表的欄位 (與 Google Sheet 標頭名稱相同)
+MEMBER_COLUMNS = ['暱稱', '點數', '帳號', '密碼']
+RAFFLE_COLUMNS = ['姓名', '電子郵件', '是否中獎']
+
+
+class MissingColumnsError(Exception):
+    """資料表缺少必要的欄位。"""
+
+    def __init__(self, columns):
+        super().__init__(f"缺少必要的欄位：{', '.join(columns)}")
+        self.columns = list(columns)
+
+
+class ConcurrentUpdateError(Exception):
+    """重試數次後仍無法寫入：資料一直被其他人同時修改。"""
+
+
+class InvalidPointsError(Exception):
+    """工作表上目前的點數無法辨識，或寫入後會超出範圍：為避免覆蓋原本的值，不寫入。"""
+
+
+class ReadOnlyError(Exception):
+    """資料來源暫時無法連線，目前只能瀏覽本機快照，無法修改資料。"""
+
+    def __init__(self):
+        super().__init__("目前無法連線到 Google Sheets，只能瀏覽資料，請稍後再試")
+
+
+class MemberRepository:
+    """會員資料 (暱稱、點數、帳號、密碼) 的存取介面。"""
+
+    # 資料表缺少的欄位 (僅 Google Sheets 可能發生)
+    missing_columns = []
+    # 資料來源暫時無法連線、只能讀取 (僅 Google Sheets 可能發生)
+    read_only = False
+
+    def check(self):
+        """確認資料來源可以使用，無法使用時拋出例外。"""
+
+    def frame(self):
+        """所有會員資料的 DataFrame，欄位型別依 schema.MEMBER_SCHEMA (可能為共用的快取，請勿直接修改)。"""
+        raise NotImplementedError
+
+    def ranking(self):
+        """依點數排序的名次索引 (rank_index.RankIndex)。"""
+        raise NotImplementedError
+
+    def revision(self):
+        """資料的版本標記：內容改變時才會改變，用來判斷畫面是否需要重新顯示。"""
+        raise NotImplementedError
+
+    def search(self, query, limit=20):
+        """以暱稱或帳號搜尋會員 (不分大小寫，前綴相符的排在前面)，回傳最多 limit 個暱稱。"""
+        raise NotImplementedError
+
+    def authenticate(self, account, password):
+        """帳號密碼正確時回傳會員暱稱，否則回傳 None。"""
+        raise NotImplementedError
+
+    def nickname_taken(self, nickname):
+        raise NotImplementedError
+
+    def account_taken(self, account):
+        raise NotImplementedError
+
+    def add_member(self, nickname, points, account, password):
+        """新增會員。暱稱或帳號已被使用時回傳 False。"""
+        raise NotImplementedError
+
+    def update_points(self, nickname, delta):
+        """增減會員點數並回傳新的點數；結果為負數時拋出 ValueError，找不到會員時拋出 KeyError，
+        目前的點數無法辨識或結果超過上限時拋出 InvalidPointsError。
+
+        寫入前會以最新的點數重新計算，不會覆蓋其他人同時做的修改；每次增減都會記錄到點數異動紀錄。
+        """
+        raise NotImplementedError
+
+    def bulk_update_points(self, changes, dry_run=False):
+        """批次增減點數 (changes 為 bulk_points.parse_changes() 的結果)，以單一請求寫入所有新點數。
+
+        回傳每一列的處理結果 (bulk_points.plan() 的欄位)；dry_run 為 True 時只計算不寫入。
+        """
+        raise NotImplementedError
+
+    def refresh(self):
+        """丟棄快取的資料，下次讀取時取得最新內容。"""
+
+
+class RaffleRepository:
+    """抽獎名單 (姓名、電子郵件、是否中獎) 的存取介面。"""
+
+    missing_columns = []
+    read_only = False
+
+    def check(self):
+        """確認資料來源可以使用，無法使用時拋出例外。"""
+
+    def frame(self):
+        """所有報名資料的 DataFrame，欄位型別依 schema.RAFFLE_SCHEMA (可能為共用的快取，請勿直接修改)。"""
+        raise NotImplementedError
+
+    def email_taken(self, email):
+        raise NotImplementedError
+
+    def add_entry(self, name, email):
+        """新增報名資料。電子郵件已報名過時回傳 False。"""
+        raise NotImplementedError
+
+    def mark_winners(self, emails):
+        """將中獎者註記為 '是'，回傳找不到的電子郵件列表。"""
+        raise NotImplementedError
+
+    def campaign(self):
+        """目前進行中的抽獎活動名稱。"""
+        raise NotImplementedError
+
+    def close_campaign(self, next_name=None):
+        """結束目前的活動：報名資料封存到 RaffleArchive 後從名單中移除，回傳 (活動名稱, 封存筆數)。
+
+        之後的報名、重複報名檢查與抽獎都只會讀取新一期的資料；next_name 為新一期的活動名稱。
+        """
+        raise NotImplementedError
+
+    def refresh(self):
+        """丟棄快取的資料，下次讀取時取得最新內容。"""
+
+
+class Storage:
+    """目前使用的資料來源、點數異動紀錄、已封存的抽獎活動，以及 (有用到時) 背後的工作表快取、延遲寫入佇列與 SQLite 同步工作。"""
+
+    def __init__(self, backend, members, raffle, cache=None, write_queue=None, sync=None, ledger=None, archive=None):
+        self.backend = backend
+        self.members = members
+        self.raffle = raffle
+        self.cache = cache
+        self.write_queue = write_queue
+        self.sync = sync
+        self.ledger = ledger
+        self.archive = archive
+
+
+@st.cache_resource(show_spinner=False)
+def get_storage():
+    """依 secrets.toml 的 storage_backend ("sheets" 或 "sqlite") 建立共用的資料來源。"""
+    backend = st.secrets.get("storage_backend", "sheets")
+    if backend == "sqlite":
+        from sqlite_storage import open_sqlite_storage
+        return open_sqlite_storage()
+    if backend == "sheets":
+        from sheets_storage import open_sheets_storage
+        return open_sheets_storage()
+    raise ValueError(f"未知的 storage_backend：{backend}")
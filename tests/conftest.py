@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 應用程式的模組都放在專案根目錄
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 以 bench/fake_sheets.py 的假 Google Sheets 測試快取與寫入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
@@ -0,0 +1,62 @@
+import pandas as pd
+
+import bulk_points
+from bulk_points import STATUS_BAD_FORMAT, STATUS_NEGATIVE, STATUS_NOT_FOUND, STATUS_OK
+
+
+def current(rows):
+    return pd.DataFrame(rows, columns=["暱稱", "點數", "key"])
+
+
+def test_parse_changes_skips_header_and_rejects_bad_lines():
+    changes = bulk_points.parse_changes("暱稱,增減\na,5\n\nb，-3\nc,1.5\nd,x\na,b,7\n")
+    assert changes["行號"].tolist() == [2, 4, 5, 6, 7]
+    assert changes["暱稱"].tolist() == ["a", "b", "c", "d", "a,b"]
+    assert changes["增減"].tolist() == [5, -3, pd.NA, pd.NA, 7]
+
+
+def test_negative_total_rejects_every_line_of_that_member():
+    members = current([("a", 10, 2), ("b", 5, 3)])
+    # a 的第一行單獨看可以扣，但合計後為負數：a 的所有行都不更新
+    changes = bulk_points.parse_changes("a,-8\nb,-5\na,-3\n")
+    report = bulk_points.plan(members, changes)
+    assert report["結果"].tolist() == [STATUS_NEGATIVE, STATUS_OK, STATUS_NEGATIVE]
+    assert bulk_points.updates(report) == [(3, "b", 0)]
+
+
+def test_grouped_totals_and_one_write_per_member():
+    members = current([("a", 10, 2), ("b", 5, 3), ("a", 99, 7)])
+    changes = bulk_points.parse_changes("a,-8\na,3\nb,1\nzz,4\n,2\n")
+    report = bulk_points.plan(members, changes)
+    assert report["結果"].tolist() == [STATUS_OK, STATUS_OK, STATUS_OK, STATUS_NOT_FOUND, STATUS_BAD_FORMAT]
+    # 重複的暱稱以第一列為準，同一位會員合併為一次寫入
+    assert bulk_points.updates(report) == [(2, "a", 5), (3, "b", 6)]
+    assert bulk_points.ledger_entries(report) == [("a", -5, 5), ("b", 1, 6)]
+    assert bulk_points.applied(report)["結果"].tolist()[:3] == [bulk_points.STATUS_APPLIED] * 3
+
+
+def test_decode_csv_accepts_big5():
+    text = "暱稱,增減\n小明,5\n"
+    assert bulk_points.decode_csv(text.encode("utf-8-sig")) == text
+    assert bulk_points.decode_csv(text.encode("cp950")) == text
+
+
+def test_blank_input_gives_an_empty_frame():
+    for text in ["", "  \n\n \t\n", "暱稱,增減\n"]:
+        changes = bulk_points.parse_changes(text)
+        assert changes.empty
+        assert list(changes.columns) == ["行號", "內容", "暱稱", "增減"]
+
+
+def test_blank_lines_between_valid_lines_are_skipped():
+    changes = bulk_points.parse_changes("\na,5\n   \n\nb,-2\n\n")
+    assert changes["行號"].tolist() == [2, 5]
+    assert changes["增減"].tolist() == [5, -2]
+
+
+def test_overflowing_deltas_are_bad_format():
+    members = current([("a", 10, 2), ("b", 5, 3)])
+    changes = bulk_points.parse_changes("a,1e30\nb,12345678901234567890\na,2147483648\nb,2147483647\n")
+    assert changes["增減"].tolist() == [pd.NA, pd.NA, pd.NA, 2147483647]
+    report = bulk_points.plan(members, changes)
+    assert report["結果"].tolist()[:3] == [STATUS_BAD_FORMAT] * 3
@@ -0,0 +1,69 @@
+import random
+import string
+
+from member_search import MemberSearchIndex
+from sheet_cache import SheetSnapshot
+
+HEADER = ['暱稱', '點數', '帳號', '密碼']
+
+
+def expected(entries, query):
+    """直接逐筆比對：前綴相符的在前，其餘依字串排序。"""
+    query = query.lower()
+    terms = sorted((term, key) for key, entry in entries.items() for term in {v.lower() for v in entry if v})
+    keys = {}
+    for term, key in terms:
+        if term.startswith(query):
+            keys.setdefault(key)
+    for term, key in terms:
+        if query in term:
+            keys.setdefault(key)
+    return list(dict.fromkeys(entries[key][0] for key in keys))
+
+
+def test_substring_hits_map_back_to_the_right_member():
+    snapshot = SheetSnapshot([HEADER, ['Alice', '1', 'al01', ''], ['Bob', '2', 'bobby', ''], ['Carol', '3', 'c', '']])
+    index = MemberSearchIndex(snapshot)
+    assert index.search('ice') == ['Alice']
+    assert index.search('BB') == ['Bob']
+    # 最後一個字串的結尾
+    assert index.search('rol') == ['Carol']
+    # 不會跨過分隔的換行比對到相鄰的兩個字串
+    assert index.search('ebo') == []
+    assert index.search('a\nb') == []
+
+
+def test_prefix_matches_come_first():
+    index = MemberSearchIndex()
+    index.add(2, 'xanna')
+    index.add(3, 'anna')
+    index.add(4, 'banana', 'ann')
+    assert index.search('ann') == ['banana', 'anna', 'xanna']
+
+
+def test_limit_counts_members_not_terms():
+    index = MemberSearchIndex()
+    for key in range(2, 12):
+        index.add(key, f'user{key}', f'user{key}-account')
+    assert len(index.search('user', limit=3)) == 3
+    assert len(index.search('account', limit=4)) == 4
+
+
+def test_random_edits_keep_the_haystack_in_sync():
+    rng = random.Random(0)
+
+    def word():
+        return ''.join(rng.choice('abcAB') for _ in range(rng.randint(1, 6)))
+
+    entries = {}
+    index = MemberSearchIndex(SheetSnapshot([HEADER]))
+    for _ in range(400):
+        key = rng.randint(2, 60)
+        if rng.random() < 0.3:
+            entries.pop(key, None)
+            index.update_row(key, ['', '', '', ''])
+        else:
+            entries[key] = (word(), word() if rng.random() < 0.7 else '')
+            index.update_row(key, [entries[key][0], '0', entries[key][1], ''])
+        query = ''.join(rng.choice(string.ascii_lowercase[:3]) for _ in range(rng.randint(1, 3)))
+        assert index.search(query, limit=1000) == expected(entries, query)
@@ -0,0 +1,60 @@
+from bisect import bisect_left
+
+import pytest
+
+import quota
+from quota import TokenBucket
+
+
+class FakeClock:
+    """取代 time.monotonic 與 time.sleep：sleep 只推進時間，不真的等待。"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(quota.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(quota.time, "sleep", clock.sleep)
+    return clock
+
+
+def max_in_window(times, window=60.0):
+    return max(bisect_left(times, start + window) - i for i, start in enumerate(times))
+
+
+@pytest.mark.parametrize("rate", [1, 60, 300])
+def test_no_window_exceeds_the_rate(clock, rate):
+    bucket = TokenBucket(rate)
+    times = []
+    for _ in range(rate * 5):
+        bucket.acquire()
+        times.append(clock.now)
+    assert max_in_window(times) <= rate
+    # 仍能在長時間內用滿配額
+    assert times[-1] - times[0] < 5 * 60
+
+
+def test_burst_is_limited_to_the_capacity(clock):
+    bucket = TokenBucket(60)
+    for _ in range(6):
+        assert bucket.acquire() == 0
+    assert bucket.acquire() > 0
+
+
+def test_reconfigure_lowers_the_rate(clock):
+    bucket = TokenBucket(600)
+    bucket.configure(60)
+    times = []
+    for _ in range(200):
+        bucket.acquire()
+        times.append(clock.now)
+    assert max_in_window(times) <= 60
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import raffle_draw
+from raffle_draw import AliasTable
+
+
+def implied_probabilities(table):
+    """alias table 實際給每個項目的機率：自己的欄位加上以它為 alias 的欄位。"""
+    n = len(table.prob)
+    result = table.prob / n
+    np.add.at(result, table.alias, (1 - table.prob) / n)
+    return result
+
+
+@pytest.mark.parametrize("weights", [
+    [1, 1, 1, 1],
+    [1, 2, 3, 4, 10],
+    [1000, 1, 1, 1, 1, 1, 1],
+    [0.5, 0.25, 0.125, 0.125],
+    np.random.default_rng(0).random(1000) + 0.01,
+    np.random.default_rng(1).pareto(1.0, 5000) + 0.001,
+])
+def test_alias_table_matches_weights(weights):
+    weights = np.asarray(weights, dtype=float)
+    table = AliasTable(weights)
+    assert ((table.prob >= 0) & (table.prob <= 1 + 1e-9)).all()
+    np.testing.assert_allclose(implied_probabilities(table), weights / weights.sum(), atol=1e-9)
+
+
+def test_alias_table_sampling_frequencies():
+    weights = np.array([1.0, 2.0, 7.0])
+    samples = AliasTable(weights).sample(np.random.default_rng(42), 100_000)
+    frequencies = np.bincount(samples, minlength=3) / len(samples)
+    np.testing.assert_allclose(frequencies, weights / weights.sum(), atol=0.01)
+
+
+def test_weighted_draw_is_reproducible_and_unique():
+    keys = [f"user{i}@example.com" for i in range(200)]
+    weights = np.arange(1, 201)
+    prizes = [("頭獎", 1), ("二獎", 5), ("三獎", 20)]
+    first = raffle_draw.draw(keys, prizes, weights=weights, seed=123)
+    second = raffle_draw.draw(keys, prizes, weights=weights, seed=123)
+    assert first["winners"] == second["winners"]
+    indices = [winner["index"] for winner in first["winners"]]
+    assert len(set(indices)) == len(indices) == 26
+    assert [winner["prize"] for winner in first["winners"]] == ["頭獎"] + ["二獎"] * 5 + ["三獎"] * 20
+
+
+def test_weighted_draw_skips_zero_weights():
+    keys = list("abcdef")
+    record = raffle_draw.draw(keys, [("獎", 3)], weights=[0, 1, 0, 1, 0, 1], seed=7)
+    assert sorted(winner["key"] for winner in record["winners"]) == ["b", "d", "f"]
+
+
+def test_weighted_draw_needs_enough_positive_weights():
+    with pytest.raises(ValueError):
+        raffle_draw.draw(list("abc"), [("獎", 2)], weights=[1, 0, 0], seed=1)
+
+
+def test_draw_rejects_more_winners_than_participants():
+    with pytest.raises(ValueError):
+        raffle_draw.draw(["a"], [("獎", 2)])
+
+
+def test_parse_prizes():
+    assert raffle_draw.parse_prizes("頭獎,1\n\n二獎，3\n") == [("頭獎", 1), ("二獎", 3)]
+    with pytest.raises(ValueError):
+        raffle_draw.parse_prizes("頭獎,一")
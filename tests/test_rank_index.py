@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from rank_index import RankIndex
+from sheet_cache import SheetSnapshot
+
+HEADER = ['暱稱', '點數', '帳號', '密碼']
+
+
+def expected_order(rows):
+    """以最直接的方式排序：點數由高到低，點數相同時列號小的在前。"""
+    return sorted((-points, key) for key, (nickname, points) in rows.items())
+
+
+def assert_matches(index, rows):
+    order = expected_order(rows)
+    assert len(index) == len(order)
+    assert index.top(len(order)) == [rows[key] for _, key in order]
+    for rank, (_, key) in enumerate(order, start=1):
+        assert index.at(rank) == rows[key]
+    for nickname in {nickname for nickname, _ in rows.values()}:
+        first = min(key for key, (name, _) in rows.items() if name == nickname)
+        assert index.rank_of(nickname) == [key for _, key in order].index(first) + 1
+
+
+def test_snapshot_load_parses_formatted_points_and_skips_blank_nicknames():
+    snapshot = SheetSnapshot([HEADER, ['a', '1,200', '', ''], ['', '99', '', ''], ['b', '300', '', ''], ['c', 'x', '', '']])
+    index = RankIndex(snapshot)
+    assert index.top(3) == [('a', 1200), ('b', 300), ('c', 0)]
+    assert index.rank_of('c') == 3
+    assert index.rank_of('') is None
+
+
+def test_ties_are_ordered_by_key():
+    index = RankIndex()
+    index.load([5, 2, 9], ['e', 'b', 'i'], [10, 10, 10])
+    assert index.top(3) == [('b', 10), ('e', 10), ('i', 10)]
+    index.update(9, 'i', 11)
+    assert index.top(1) == [('i', 11)]
+    assert index.rank_of('b') == 2
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_updates_keep_the_order(seed):
+    rng = random.Random(seed)
+    names = [f"m{i}" for i in range(30)]
+    rows = {key: (rng.choice(names), rng.randint(0, 50)) for key in range(2, 80)}
+    index = RankIndex()
+    index.load(list(rows), [nickname for nickname, _ in rows.values()], [points for _, points in rows.values()])
+    assert_matches(index, rows)
+    for _ in range(300):
+        action = rng.random()
+        key = rng.randint(2, 120)
+        if action < 0.3:
+            rows.pop(key, None)
+            index.remove(key)
+        elif action < 0.6 and key in rows:
+            # 只改點數
+            points = rng.randint(0, 50)
+            rows[key] = (rows[key][0], points)
+            index.update(key, rows[key][0], points)
+        else:
+            rows[key] = (rng.choice(names), rng.randint(0, 50))
+            index.update(key, *rows[key])
+        assert_matches(index, rows)
+
+
+def test_row_callbacks_from_the_sheet_cache():
+    snapshot = SheetSnapshot([HEADER, ['a', '10', '', ''], ['b', '20', '', '']])
+    index = RankIndex(snapshot)
+    index.add_row(4, ['c', '15', '', ''])
+    index.update_row(2, ['a', '30', '', ''])
+    assert index.top(3) == [('a', 30), ('b', 20), ('c', 15)]
+    # 暱稱被清空的列移出排名
+    index.update_row(3, ['', '20', '', ''])
+    assert index.top(3) == [('a', 30), ('c', 15)]
+    assert index.rank_of('b') is None
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from schema import MAX_POINTS, MEMBER_SCHEMA, parse_points, parse_points_series, to_points, to_points_series
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("", 0),
+    ("1,200", 1200),
+    ("12.7", 12),
+    ("１２", 12),
+    (str(MAX_POINTS), MAX_POINTS),
+    (str(MAX_POINTS + 1), None),
+    ("99999999999999999999", None),
+    ("abc", None),
+    ("inf", None),
+])
+def test_parse_points(value, expected):
+    assert parse_points(value) == expected
+    parsed = parse_points_series([value]).iloc[0]
+    assert (None if pd.isna(parsed) else parsed) == expected
+    # 顯示時無法辨識的值視為 0
+    assert to_points(value) == (expected or 0)
+    assert to_points_series([value]).iloc[0] == (expected or 0)
+
+
+def test_frame_shows_out_of_range_points_as_zero():
+    frame = MEMBER_SCHEMA.from_rows(['暱稱', '點數'], [['a', '3000000000'], ['b', '1,200']])
+    assert frame['點數'].tolist() == [0, 1200]
@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import sheet_cache
+from fake_sheets import FakeConnection, FaultInjector, sample_sheets
+from shared_cache import SharedCache
+from sheet_cache import SheetCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared.sqlite3")
+
+
+@pytest.fixture
+def faults():
+    return FaultInjector()
+
+
+@pytest.fixture
+def conn(faults):
+    return FakeConnection(sample_sheets(members=20, raffle=5), faults)
+
+
+def make_cache(conn, path, ttl=60, lease_seconds=30):
+    """模擬另一個程序：各自的 SheetCache 與 SQLite 連線，共用同一個檔案與同一份工作表。"""
+    return SheetCache(conn, ttl=ttl, check_modified=False, shared=SharedCache(path, lease_seconds=lease_seconds))
+
+
+def sheet_rows(conn, name):
+    return [list(row) for row in conn.sheets[name]._rows]
+
+
+def test_second_process_reads_the_shared_snapshot(conn, faults, path):
+    a, b = make_cache(conn, path), make_cache(conn, path)
+    a.snapshot("members")
+    b.snapshot("members")
+    assert faults.calls["get_all_values"] == 1
+    assert b.revision("members") == a.revision("members")
+
+
+def test_write_in_one_process_is_visible_in_the_other(conn, path):
+    a, b = make_cache(conn, path), make_cache(conn, path)
+    before = b.snapshot("members")
+    a.update_cell("members", 3, 2, 777)
+    after = b.snapshot("members")
+    assert after.values[2][1] == "777"
+    assert after.values == sheet_rows(conn, "members")
+    # 沒有變動的資料列沿用本機快照的串列
+    assert after.values[5] is before.values[5]
+    assert b.revision("members") == a.revision("members")
+
+
+def test_app_writes_only_store_the_changed_rows(conn, path):
+    a = make_cache(conn, path)
+    a.snapshot("members")
+    db = sqlite3.connect(path)
+    first = db.execute("SELECT MAX(revision) FROM sheet_rows WHERE name = 'members'").fetchone()[0]
+    a.update_cell("members", 4, 2, 5)
+    a.append_row("members", ["new", "1", "acc", "pw"])
+    changed = db.execute("SELECT row FROM sheet_rows WHERE name = 'members' AND revision > ? ORDER BY row",
+                         (first,)).fetchall()
+    assert changed == [(4,), (22,)]
+
+
+def test_invalidation_propagates(conn, faults, path):
+    a, b = make_cache(conn, path), make_cache(conn, path)
+    a.snapshot("members")
+    b.snapshot("members")
+    a.invalidate("members")
+    conn.sheets["members"].update_cell(2, 2, 4242)
+    began = time.monotonic()
+    assert b.snapshot("members").values[1][1] == "4242"
+    # a 放棄了租約，b 不必等待就重新下載
+    assert time.monotonic() - began < sheet_cache.LEASE_WAIT_SECONDS / 2
+    assert faults.calls["get_all_values"] == 2
+    # 重新下載的快照也發布給 a
+    assert a.snapshot("members").values == sheet_rows(conn, "members")
+    assert faults.calls["get_all_values"] == 2
+
+
+def test_conflicting_write_invalidates_both_processes(conn, path):
+    a, b = make_cache(conn, path), make_cache(conn, path)
+    a.snapshot("members")
+    b.snapshot("members")
+    stale = b._snapshots["members"]
+    a.update_cell("members", 2, 2, 1)
+    # b 還沒看到 a 的版本就以舊的版本號發布
+    b._set("members", stale.with_cells([(3, 2, "2")]), changed=[3])
+    assert b._snapshots.get("members") is None
+    assert a.snapshot("members").values == sheet_rows(conn, "members")
+
+
+def test_concurrent_appends_keep_both_rows(conn, path):
+    a, b = make_cache(conn, path), make_cache(conn, path)
+    a.snapshot("raffle")
+    b.snapshot("raffle")
+    start = threading.Barrier(2)
+
+    def append(cache, row):
+        start.wait()
+        for i in range(10):
+            cache.append_row("raffle", [f"{row}{i}", f"{row}{i}@example.com", ""])
+
+    threads = [threading.Thread(target=append, args=(cache, row)) for cache, row in ((a, "a"), (b, "b"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = sheet_rows(conn, "raffle")
+    assert len(expected) == 6 + 20
+    assert a.snapshot("raffle").values == expected
+    assert b.snapshot("raffle").values == expected
+
+
+def test_lease_expires_when_the_holder_dies(conn, faults, path, monkeypatch):
+    monkeypatch.setattr(sheet_cache, "LEASE_RETRY_SECONDS", 0.05)
+    a = make_cache(conn, path, ttl=0.05, lease_seconds=0.3)
+    b = make_cache(conn, path, ttl=0.05, lease_seconds=0.3)
+    # a 下載時取得租約，之後就沒有再執行 (程序結束)
+    a.snapshot("members")
+    b.snapshot("members")
+    assert b.shared.leases()["members"][0] == a.shared.owner
+    conn.sheets["members"].update_cell(2, 2, 99)
+    time.sleep(0.06)
+    # 租約有效期間 b 沿用舊的快照，不重新下載
+    assert b.snapshot("members").values[1][1] != "99"
+    assert faults.calls["get_all_values"] == 1
+
+    time.sleep(0.3)
+    assert b.snapshot("members").values[1][1] == "99"
+    assert faults.calls["get_all_values"] == 2
+    assert b.shared.leases()["members"][0] == b.shared.owner
+
+
+def test_state_sees_other_connections_through_data_version(path):
+    a, b = SharedCache(path), SharedCache(path)
+    assert b.state("members") is None
+    revision = a.publish("members", [["暱稱"], ["x"]], fetched_at=100.0)
+    assert b.state("members") == (revision, 100.0)
+    a.touch("members", revision, 200.0)
+    assert b.state("members") == (revision, 200.0)
+    # 以過期的版本號發布會被拒絕
+    assert b.publish("members", [["暱稱"], ["y"]], base=revision - 1) is None
+    assert b.load("members", since=revision)[2] == {}
+
+
+def test_partial_publish_needs_a_base(path):
+    with pytest.raises(ValueError):
+        SharedCache(path).publish("members", [["暱稱"]], changed=[1])
+
+
+def test_old_schema_is_rebuilt(path):
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE sheets (name TEXT PRIMARY KEY, revision INTEGER, data TEXT, "
+               "synced_at REAL, fetched_at REAL NOT NULL, modified TEXT)")
+    db.execute("INSERT INTO sheets VALUES ('members', 3, '[]', NULL, 0, NULL)")
+    db.commit()
+    cache = SharedCache(path)
+    assert cache.state("members") is None
+    revision = cache.publish("members", [["暱稱"], ["x"]])
+    assert cache.load("members")[1:3] == (2, {1: ["暱稱"], 2: ["x"]})
+    assert revision == 1
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from fake_sheets import FakeConnection, FaultInjector, sample_sheets
+from sheet_cache import SheetCache
+
+
+@pytest.fixture
+def faults():
+    return FaultInjector()
+
+
+@pytest.fixture
+def conn(faults):
+    return FakeConnection(sample_sheets(members=5, raffle=3), faults)
+
+
+def test_check_does_not_reconnect_while_offline(conn, faults):
+    cache = SheetCache(conn, ttl=60, check_modified=False)
+    cache.snapshot("members")
+    conn.outage = True
+    cache.check("members")
+    assert cache.is_offline("members")
+
+    calls = faults.total_calls()
+    cache.check("members")
+    cache.check("members")
+    assert faults.total_calls() == calls
+
+
+def test_offline_sheet_recovers_on_the_next_download(conn):
+    cache = SheetCache(conn, ttl=0.05, check_modified=False)
+    cache.snapshot("members")
+    conn.outage = True
+    time.sleep(0.06)
+    # 無法連線時沿用舊的快照
+    assert cache.snapshot("members").values[1][0] == "member0"
+    assert cache.is_offline("members")
+
+    conn.outage = False
+    time.sleep(0.06)
+    cache.snapshot("members")
+    assert not cache.is_offline("members")
+    cache.check("members")
+    assert not cache.is_offline("members")
+
+
+def incremental_cache(conn):
+    cache = SheetCache(conn, ttl=0.02, incremental=["raffle"], full_sync_interval=60, check_modified=False)
+    cache.snapshot("raffle")
+    return cache
+
+
+def refreshed(cache, name):
+    time.sleep(0.03)
+    return cache.snapshot(name)
+
+
+def test_incremental_sync_appends_new_rows(conn, faults):
+    cache = incremental_cache(conn)
+    revision = cache.revision("raffle")
+    conn.sheets["raffle"].append_rows([["new1", "new1@example.com", ""], ["new2", "new2@example.com", ""]])
+    snapshot = refreshed(cache, "raffle")
+    assert snapshot.values == conn.sheets["raffle"]._rows
+    assert faults.calls["get_all_values"] == 1
+    assert cache.stats()["raffle"]["deltas"] == 1
+    assert cache.revision("raffle") == revision + 1
+
+    # 沒有新增資料時版本號不變
+    refreshed(cache, "raffle")
+    assert cache.revision("raffle") == revision + 1
+    assert faults.calls["get_all_values"] == 1
+
+
+def test_incremental_sync_falls_back_when_the_last_row_changed(conn, faults):
+    cache = incremental_cache(conn)
+    conn.sheets["raffle"].update_cell(len(conn.sheets["raffle"]._rows), 3, "是")
+    conn.sheets["raffle"].append_rows([["new", "new@example.com", ""]])
+    snapshot = refreshed(cache, "raffle")
+    assert snapshot.values == conn.sheets["raffle"]._rows
+    assert faults.calls["get_all_values"] == 2
+
+
+def test_incremental_sync_falls_back_when_the_last_row_was_deleted(conn, faults):
+    cache = incremental_cache(conn)
+    rows = conn.sheets["raffle"]._rows
+    conn.sheets["raffle"].delete_rows(len(rows))
+    snapshot = refreshed(cache, "raffle")
+    assert snapshot.values == rows
+    assert faults.calls["get_all_values"] == 2
+
+
+def test_incremental_sync_falls_back_when_rows_were_deleted_and_appended(conn, faults):
+    cache = incremental_cache(conn)
+    worksheet = conn.sheets["raffle"]
+    # 刪除最後一列後又新增一列：列數相同，但最後一列的內容不同
+    worksheet.delete_rows(len(worksheet._rows))
+    worksheet.append_rows([["other", "other@example.com", ""]])
+    snapshot = refreshed(cache, "raffle")
+    assert snapshot.values == worksheet._rows
+    assert faults.calls["get_all_values"] == 2
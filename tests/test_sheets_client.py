@@ -0,0 +1,75 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import sheets_client
+from sheets_client import SheetsConnection
+
+
+class FakeClient:
+    """記錄 open_by_key 呼叫次數的 gspread client；failing 為 True 時拋出 ConnectionError。"""
+
+    def __init__(self, spreadsheet=None):
+        self.spreadsheet = spreadsheet
+        self.opened = 0
+        self.failing = False
+
+    def open_by_key(self, key):
+        self.opened += 1
+        if self.failing:
+            raise requests.ConnectionError("無法連線")
+        return self.spreadsheet
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(SheetsConnection, "_authorize", lambda self: client)
+    return client
+
+
+def test_failed_open_is_not_retried_within_the_retry_window(client, monkeypatch):
+    client.failing = True
+    conn = SheetsConnection({}, {"members": "key"})
+    with pytest.raises(requests.ConnectionError):
+        conn.worksheet("members")
+    with pytest.raises(requests.ConnectionError):
+        conn.worksheet("members")
+    assert client.opened == 1
+
+    # 超過重試間隔後才再開啟一次
+    monkeypatch.setattr(sheets_client, "REOPEN_RETRY_SECONDS", 0)
+    client.failing = False
+    client.spreadsheet = SimpleNamespace(id="key", sheet1=SimpleNamespace())
+    assert conn.worksheet("members") is not None
+    assert client.opened == 2
+
+
+def test_health_check_does_not_block_other_sessions(client, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def fetch_sheet_metadata(params=None):
+        started.set()
+        release.wait(5)
+        return {}
+
+    client.spreadsheet = SimpleNamespace(id="key", sheet1=SimpleNamespace(spreadsheet=SimpleNamespace(
+        fetch_sheet_metadata=fetch_sheet_metadata)))
+    conn = SheetsConnection({}, {"members": "key"})
+    worksheet = conn.worksheet("members")
+    monkeypatch.setattr(sheets_client, "HEALTH_CHECK_INTERVAL", -1)
+    checker = threading.Thread(target=conn.worksheet, args=("members",))
+    checker.start()
+    try:
+        assert started.wait(5)
+        monkeypatch.setattr(sheets_client, "HEALTH_CHECK_INTERVAL", 300)
+        began = time.monotonic()
+        # 健康檢查進行中，其他 session 直接取得原本的物件
+        assert conn.worksheet("members") is worksheet
+        assert time.monotonic() - began < 1
+    finally:
+        release.set()
+        checker.join()
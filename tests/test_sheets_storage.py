@@ -0,0 +1,124 @@
+import pytest
+
+from bulk_points import STATUS_APPLIED, STATUS_INVALID_POINTS, STATUS_OVERFLOW, parse_changes
+from fake_sheets import FakeConnection, FaultInjector, sample_sheets
+from schema import MAX_POINTS
+from sheet_cache import SheetCache
+from sheets_storage import CAS_RETRIES, SheetsMemberRepository
+from storage import ConcurrentUpdateError, InvalidPointsError
+
+
+@pytest.fixture
+def faults():
+    return FaultInjector()
+
+
+@pytest.fixture
+def conn(faults):
+    return FakeConnection(sample_sheets(members=5, raffle=0), faults)
+
+
+@pytest.fixture
+def cache(conn):
+    return SheetCache(conn, ttl=60, check_modified=False)
+
+
+@pytest.fixture
+def members(cache):
+    return SheetsMemberRepository(cache)
+
+
+def points_of(conn, nickname):
+    return next(int(row[1]) for row in conn.sheets["members"]._rows if row[0] == nickname)
+
+
+def interfere(conn, times, change):
+    """在接下來 times 次 findReplace 之前，模擬另一個程序修改了同一個儲存格。"""
+    worksheet = conn.sheets["members"]
+    find_replace = worksheet.find_replace
+    remaining = [times]
+
+    def wrapped(body):
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            grid = body["requests"][0]["findReplace"]["range"]
+            row, col = grid["startRowIndex"] + 1, grid["startColumnIndex"] + 1
+            worksheet._set(row, col, int(worksheet._rows[row - 1][col - 1]) + change)
+        return find_replace(body)
+
+    worksheet.find_replace = wrapped
+
+
+def test_compare_and_set_only_writes_the_expected_value(conn, cache):
+    cache.snapshot("members")
+    current = conn.sheets["members"]._rows[1][1]
+    assert not cache.compare_and_set("members", 2, 2, "not-the-value", 1)
+    assert conn.sheets["members"]._rows[1][1] == current
+    assert cache.compare_and_set("members", 2, 2, current, 1)
+    assert conn.sheets["members"]._rows[1][1] == "1"
+    assert cache.snapshot("members").values[1][1] == "1"
+
+
+def test_concurrent_update_keeps_both_deltas(conn, faults, members):
+    before = points_of(conn, "member1")
+    members.frame()
+    interfere(conn, 1, 50)
+    assert members.update_points("member1", 7) == before + 57
+    assert points_of(conn, "member1") == before + 57
+    # 第一次 findReplace 比對失敗，以最新的值重算後再寫入一次
+    assert faults.calls["find_replace"] == 2
+
+
+def test_reordered_rows_are_found_again(conn, faults, members):
+    members.frame()
+    rows = conn.sheets["members"]._rows
+    # 快照建立後工作表被排序：member1 移到 member0 原本的位置
+    rows[1], rows[2] = rows[2], rows[1]
+    before0, before1 = points_of(conn, "member0"), points_of(conn, "member1")
+    assert members.update_points("member1", 5) == before1 + 5
+    assert rows[1] == ["member1", str(before1 + 5), "acc1", "pw1"]
+    assert points_of(conn, "member0") == before0
+    # 發現列號對不上後整張重新下載一次
+    assert faults.calls["get_all_values"] == 2
+
+
+def test_gives_up_after_the_retry_limit(conn, faults, members):
+    before = points_of(conn, "member2")
+    members.frame()
+    interfere(conn, CAS_RETRIES, 1)
+    with pytest.raises(ConcurrentUpdateError):
+        members.update_points("member2", 10)
+    assert faults.calls["find_replace"] == CAS_RETRIES
+    # 只留下另一個程序的修改
+    assert points_of(conn, "member2") == before + CAS_RETRIES
+
+
+def test_negative_result_is_rejected(conn, members):
+    before = points_of(conn, "member3")
+    with pytest.raises(ValueError):
+        members.update_points("member3", -before - 1)
+    assert points_of(conn, "member3") == before
+
+
+def test_unreadable_points_are_never_overwritten(conn, members):
+    rows = conn.sheets["members"]._rows
+    rows[1][1] = "3000000000"
+    rows[2][1] = "abc"
+    for nickname in ("member0", "member1"):
+        with pytest.raises(InvalidPointsError):
+            members.update_points(nickname, 5)
+
+    report = members.bulk_update_points(parse_changes("member0,5\nmember1,5\nmember2,5"))
+    assert report["結果"].tolist() == [STATUS_INVALID_POINTS, STATUS_INVALID_POINTS, STATUS_APPLIED]
+    assert rows[1][1] == "3000000000"
+    assert rows[2][1] == "abc"
+
+
+def test_totals_above_the_limit_are_rejected(conn, members):
+    rows = conn.sheets["members"]._rows
+    rows[1][1] = str(MAX_POINTS - 1)
+    with pytest.raises(InvalidPointsError):
+        members.update_points("member0", 2)
+    report = members.bulk_update_points(parse_changes("member0,2"))
+    assert report["結果"].tolist() == [STATUS_OVERFLOW]
+    assert rows[1][1] == str(MAX_POINTS - 1)
@@ -0,0 +1,33 @@
+import pytest
+
+from fake_sheets import FakeConnection, FaultInjector, sample_sheets
+from points_ledger import PointsLedger
+from schema import MAX_POINTS
+from sheet_cache import SheetCache
+from sqlite_storage import SheetsSync, SqliteMemberRepository, SqliteStore
+from storage import InvalidPointsError
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteStore(str(tmp_path / "app_data.sqlite3"))
+
+
+def test_import_refuses_unreadable_points(store):
+    sheets = sample_sheets(members=3, raffle=1)
+    sheets["members"][2][1] = "3000000000"
+    sync = SheetsSync(store, SheetCache(FakeConnection(sheets, FaultInjector()), check_modified=False))
+    with pytest.raises(InvalidPointsError, match="member1"):
+        sync.import_from_sheets()
+    # 沒有匯入任何資料，之後也不會把 0 同步回工作表
+    assert store.is_empty()
+
+
+def test_update_points_rejects_totals_above_the_limit(store):
+    members = SqliteMemberRepository(store, PointsLedger(store.db, store.lock))
+    assert members.add_member("a", MAX_POINTS - 1, "acc", "pw")
+    with pytest.raises(InvalidPointsError):
+        members.update_points("a", 2)
+    with pytest.raises(ValueError):
+        members.update_points("a", -MAX_POINTS)
+    assert members.update_points("a", 1) == MAX_POINTS
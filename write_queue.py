@@ -0,0 +1,179 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from sheet_cache import get_sheet_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = "write_queue.sqlite3"
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_rows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet TEXT NOT NULL,
+    row TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_keys (
+    sheet TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    PRIMARY KEY (sheet, field, value)
+);
+"""
+
+
+class WriteQueue:
+    """延遲寫入佇列：新增的資料列先存進本機 SQLite，再由背景執行緒以 append_rows 批次寫回 Google Sheet。
+
+    每一列可附帶唯一鍵 (例如帳號、暱稱、電子郵件)，佇列中重複的鍵會被拒絕，
+    讓重複性檢查可以同時考慮工作表與尚未寫入的資料。程序重新啟動後會繼續寫入未完成的資料。
+    """
+
+    def __init__(self, cache, path=DEFAULT_QUEUE_PATH, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, write_behind=True):
+        self._cache = cache
+        # False 時只在工作表無法連線 (離線模式) 時才使用佇列
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # 背景執行緒與封存活動等操作都會呼叫 flush()，同一時間只允許一個，避免同一批資料被寫入兩次
+        self._flush_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._wake = threading.Event()
+        self._thread = None
+        self.last_error = None
+
+    def enqueue(self, sheet, row, keys=None):
+        """把一列資料放進佇列。若任何唯一鍵已在佇列中則不加入並回傳 False。"""
+        keys = keys or {}
+        try:
+            with self._lock, self._db:
+                cur = self._db.execute(
+                    "INSERT INTO pending_rows (sheet, row, created_at) VALUES (?, ?, ?)",
+                    (sheet, json.dumps(row, ensure_ascii=False), time.time()),
+                )
+                self._db.executemany(
+                    "INSERT INTO pending_keys (sheet, field, value, row_id) VALUES (?, ?, ?, ?)",
+                    [(sheet, field, str(value), cur.lastrowid) for field, value in keys.items()],
+                )
+        except sqlite3.IntegrityError:
+            return False
+        if self.pending_count(sheet) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def has_pending(self, sheet, field, value):
+        """檢查某個唯一鍵是否已在佇列中等待寫入。"""
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT 1 FROM pending_keys WHERE sheet = ? AND field = ? AND value = ?",
+                (sheet, field, str(value)),
+            )
+            return cur.fetchone() is not None
+
+    def pending_count(self, sheet=None):
+        with self._lock:
+            if sheet is None:
+                cur = self._db.execute("SELECT COUNT(*) FROM pending_rows")
+            else:
+                cur = self._db.execute("SELECT COUNT(*) FROM pending_rows WHERE sheet = ?", (sheet,))
+            return cur.fetchone()[0]
+
+    def flush(self):
+        """把佇列中所有資料依工作表分批寫回 Google Sheet，回傳寫入的列數。"""
+        with self._flush_lock:
+            written = 0
+            with self._lock:
+                sheets = [row[0] for row in self._db.execute("SELECT DISTINCT sheet FROM pending_rows")]
+            for sheet in sheets:
+                while True:
+                    with self._lock:
+                        batch = self._db.execute(
+                            "SELECT id, row FROM pending_rows WHERE sheet = ? ORDER BY id LIMIT ?",
+                            (sheet, self.batch_size),
+                        ).fetchall()
+                        keys = self._db.execute(
+                            "SELECT row_id, field, value FROM pending_keys WHERE sheet = ? AND row_id <= ?",
+                            (sheet, batch[-1][0] if batch else 0),
+                        ).fetchall()
+                    if not batch:
+                        break
+                    rows = self._skip_already_written(sheet, batch, keys)
+                    if rows:
+                        self._cache.append_rows(sheet, rows)
+                        written += len(rows)
+                    self._remove([row_id for row_id, _ in batch])
+            return written
+
+    def _skip_already_written(self, sheet, batch, keys):
+        """程序若在寫入後、刪除佇列前中止，重新啟動時這些列的唯一鍵已存在於工作表中，不再重複寫入。"""
+        keys_by_row = {}
+        for row_id, field, value in keys:
+            keys_by_row.setdefault(row_id, []).append((field, value))
+        snapshot = self._cache.snapshot(sheet)
+        existing = {}
+        rows = []
+        for row_id, row in batch:
+            already_written = False
+            for field, value in keys_by_row.get(row_id, []):
+                if field not in existing:
+                    existing[field] = set(snapshot.column(field)) if field in snapshot.header else set()
+                if value in existing[field]:
+                    already_written = True
+            if not already_written:
+                rows.append(json.loads(row))
+        return rows
+
+    def _remove(self, row_ids):
+        with self._lock, self._db:
+            placeholders = ",".join("?" * len(row_ids))
+            self._db.execute(f"DELETE FROM pending_keys WHERE row_id IN ({placeholders})", row_ids)
+            self._db.execute(f"DELETE FROM pending_rows WHERE id IN ({placeholders})", row_ids)
+
+    def start(self):
+        """啟動背景寫入執行緒 (每個程序只需一個)。"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            # 佇列達到批次大小時會提早喚醒，否則每隔 flush_interval 秒寫入一次
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:
+                # 寫入失敗的資料仍留在佇列中，下一輪再試
+                self.last_error = str(e)
+                logger.exception("延遲寫入 Google Sheet 失敗")
+
+
+@st.cache_resource(show_spinner=False)
+def get_write_queue():
+    """延遲寫入模式或離線寫入 (offline_write_queue，預設啟用) 啟用時回傳共用的 WriteQueue，否則回傳 None。"""
+    write_behind = st.secrets.get("write_behind", False)
+    if not write_behind and not st.secrets.get("offline_write_queue", True):
+        return None
+    queue = WriteQueue(
+        get_sheet_cache(),
+        path=st.secrets.get("write_queue_path", DEFAULT_QUEUE_PATH),
+        batch_size=st.secrets.get("write_behind_batch_size", DEFAULT_BATCH_SIZE),
+        flush_interval=st.secrets.get("write_behind_interval_seconds", DEFAULT_FLUSH_INTERVAL),
+        write_behind=write_behind,
+    )
+    queue.start()
+    return queue